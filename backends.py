@@ -0,0 +1,256 @@
+import os
+import re
+import zlib
+import shlex
+import logging
+import tarfile
+import subprocess
+
+from sevenzip import run_7z, run_tool, read_listing
+from checksums import CHUNK_SIZE
+
+
+logger = logging.getLogger()
+
+SIZE_PATTERN = re.compile(r'^(?P<number>\d+(?:\.\d+)?)\s*(?P<unit>[KMGT]?)i?B?$', re.IGNORECASE)
+SIZE_UNITS = {"": 1, "K": 1024, "M": 1024 ** 2, "G": 1024 ** 3, "T": 1024 ** 4}
+
+
+class Backend:
+    """
+    An output format for the store folder: how to create, test, extract and list its archives.
+    compress, test and extract return the tool's return code, like run_7z.
+    """
+    name = None
+    extension = None
+
+    def __init__(self, config):
+        self.config = config
+
+    def compress(self, folder_path, archive_path, threads, level=None, cancel=None, bytes_in=0):
+        raise NotImplementedError
+
+    def test(self, archive_path, archive_type=None):
+        raise NotImplementedError
+
+    def extract(self, archive_path, dest):
+        raise NotImplementedError
+
+    def manifest(self, archive_path):
+        """List the archive's files as a (path, size) manifest, see relative_manifest."""
+        raise NotImplementedError
+
+    def checksums(self, archive_path):
+        """List the archive's files as (path, size, crc32) entries, see relative_manifest."""
+        raise NotImplementedError
+
+
+class SevenZipBackend(Backend):
+    name = "7z"
+    extension = ".7z"
+
+    def compress(self, folder_path, archive_path, threads, level=None, cancel=None, bytes_in=0):
+        command = [self.config["compressionCMD"], 'a', '-t7z', archive_path, folder_path, f'-mmt={threads}']
+        if level is not None:
+            command.append(f'-mx={level}')
+        return run_7z(command, bytes_in=bytes_in, cancel=cancel)
+
+    def test(self, archive_path, archive_type=None):
+        return run_7z([self.config["compressionCMD"], 't', f'-t{archive_type or "7z"}', archive_path],
+                      bytes_in=os.path.getsize(archive_path))
+
+    def extract(self, archive_path, dest):
+        return run_7z([self.config["compressionCMD"], 'x', archive_path, f'-o{dest}', '-y'],
+                      bytes_in=os.path.getsize(archive_path))
+
+    def manifest(self, archive_path):
+        return listing_manifest(read_listing(self.config["compressionCMD"], archive_path)[1])
+
+    def checksums(self, archive_path):
+        # 7z stores the CRC32 of every file, "7z t" is what checks the data still decodes to it
+        listing = read_listing(self.config["compressionCMD"], archive_path)[1]
+        return relative_manifest([(fields["Path"].replace("\\", "/"), int(fields.get("Size") or 0),
+                                   int(fields.get("CRC") or "0", 16)) for fields in listing if _is_file(fields)])
+
+
+class TarBackend(Backend):
+    """
+    A tar stream piped through an external multithreaded compressor, with tar -I.
+    The archive keeps the folder as its top-level entry, like 7z does.
+    """
+    compressor = None
+    default_level = None
+
+    def compressor_command(self, threads, level):
+        raise NotImplementedError
+
+    def decompressor_command(self):
+        """The compressor command for reading, tar adds -d itself."""
+        return [self.compressor]
+
+    def compress(self, folder_path, archive_path, threads, level=None, cancel=None, bytes_in=0):
+        folder_path = os.path.abspath(folder_path.rstrip("/"))
+        program = shlex.join(self.compressor_command(threads, self.default_level if level is None else level))
+        logger.info(f"Compressing {folder_path} with tar -I '{program}'")
+        return run_tool(['tar', '-I', program, '-cf', archive_path,
+                         '-C', os.path.dirname(folder_path), os.path.basename(folder_path)], cancel=cancel)
+
+    def test(self, archive_path, archive_type=None):
+        # Listing decompresses the whole stream, which checks the compressor's own checksums
+        return run_tool(['tar', '-I', shlex.join(self.decompressor_command()), '-tf', archive_path])
+
+    def extract(self, archive_path, dest):
+        os.makedirs(dest, exist_ok=True)
+        return run_tool(['tar', '-I', shlex.join(self.decompressor_command()), '-xf', archive_path, '-C', dest])
+
+    def manifest(self, archive_path):
+        return [(path, size) for path, size, _ in self._read_stream(archive_path, with_crc=False)]
+
+    def checksums(self, archive_path):
+        # Decompresses the whole stream, so this also checks the compressor's own checksums
+        return self._read_stream(archive_path, with_crc=True)
+
+    def _read_stream(self, archive_path, with_crc):
+        """Read the tar stream from the decompressor's pipe, returns the relative (path, size, crc32) of its files."""
+        process = subprocess.Popen(self.decompressor_command() + ['-d', '-c', archive_path],
+                                   stdin=subprocess.DEVNULL, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        entries = []
+        try:
+            with tarfile.open(fileobj=process.stdout, mode="r|") as tar:
+                for member in tar:
+                    if not member.isfile():
+                        continue
+                    crc = 0
+                    if with_crc:
+                        f = tar.extractfile(member)
+                        while chunk := f.read(CHUNK_SIZE):
+                            crc = zlib.crc32(chunk, crc)
+                    entries.append((member.name, member.size, crc))
+        except tarfile.TarError as e:
+            process.kill()
+            raise subprocess.CalledProcessError(1, process.args, stderr=str(e))
+        finally:
+            process.stdout.close()
+            stderr = process.stderr.read().decode(errors="replace")
+            process.stderr.close()
+            returncode = process.wait()
+        if returncode != 0:
+            raise subprocess.CalledProcessError(returncode, process.args, stderr=stderr)
+        return relative_manifest(entries)
+
+
+class TarZstdBackend(TarBackend):
+    name = "zstd"
+    extension = ".tar.zst"
+    compressor = "zstd"
+    default_level = 15
+
+    def compressor_command(self, threads, level):
+        # Long distance matching finds repeats across the big, similar asset files of a game
+        command = ['zstd', f'-T{threads or 0}', f'-{level}', f'--long={self.config["output"]["zstd_long"]}']
+        if int(level) > 19:
+            command.insert(1, '--ultra')
+        return command
+
+    def decompressor_command(self):
+        # Archives written with a window above 27 can't be read without allowing it
+        return ['zstd', '--long=31']
+
+
+class TarXzBackend(TarBackend):
+    name = "xz"
+    extension = ".tar.xz"
+    compressor = "xz"
+    default_level = 6
+
+    def compressor_command(self, threads, level):
+        return ['xz', f'-T{threads or 0}', f'-{level}']
+
+    def decompressor_command(self):
+        return ['xz', '-T0']
+
+
+BACKENDS = {backend.name: backend for backend in (SevenZipBackend, TarZstdBackend, TarXzBackend)}
+
+
+def get_backend(name, config):
+    try:
+        return BACKENDS[name](config)
+    except KeyError:
+        raise ValueError(f"Unknown output backend {name}, expected one of: {', '.join(BACKENDS)}")
+
+
+def backend_for_archive(archive_path, config):
+    """Pick the backend that reads an archive from its extension, 7z for everything 7z opens."""
+    for backend in BACKENDS.values():
+        if backend.name != "7z" and archive_path.endswith(backend.extension):
+            return backend(config)
+    return SevenZipBackend(config)
+
+
+def select_backend(config, source_size):
+    """
+    Pick the output backend and level of a job: the largest size rule the source reaches,
+    then its category's rule, then the default.
+    Returns (backend, level), level is None for the backend's default.
+    """
+    output_config = config["output"]
+    name, level = output_config["default"]
+    category_rule = output_config["by_category"].get(config.get("category"))
+    if category_rule:
+        name, level = category_rule
+    for threshold, rule in sorted(output_config["by_size"].items()):
+        if source_size >= threshold:
+            name, level = rule
+    backend = get_backend(name, config)
+    logger.info(f"Output backend: {backend.name}, level {'default' if level is None else level}")
+    return backend, level
+
+
+def parse_backend_spec(spec):
+    """"zstd:19" -> ("zstd", 19), "7z" -> ("7z", None)"""
+    name, _, level = spec.strip().partition(":")
+    name = name.strip().lower()
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown output backend {name}, expected one of: {', '.join(BACKENDS)}")
+    return name, int(level) if level.strip() else None
+
+
+def parse_backend_rules(text):
+    """Parse "key=backend[:level]" pairs separated by commas into {key: (backend, level)}."""
+    rules = {}
+    for pair in filter(None, (pair.strip() for pair in text.split(","))):
+        key, _, spec = pair.partition("=")
+        rules[key.strip()] = parse_backend_spec(spec)
+    return rules
+
+
+def parse_size(text):
+    """"50G" -> 53687091200, sizes are in binary units."""
+    match = SIZE_PATTERN.match(text.strip())
+    if not match:
+        raise ValueError(f"Invalid size {text}, expected something like 500M or 50G")
+    return int(float(match["number"]) * SIZE_UNITS[match["unit"].upper()])
+
+
+def listing_manifest(listing):
+    """Turn the entries of a "7z l -slt" listing into a (path, size) manifest, see relative_manifest."""
+    return relative_manifest([(fields["Path"].replace("\\", "/"), int(fields.get("Size") or 0))
+                              for fields in listing if _is_file(fields)])
+
+
+def _is_file(fields):
+    return fields.get("Folder") != "+" and not fields.get("Attributes", "").startswith("D")
+
+
+def relative_manifest(entries):
+    """
+    Sort the (path, size...) files of an archive, with paths relative to its top-level folder
+    when it has a single one, like the trees fingerprint_tree sees.
+    """
+    entries = [(path[2:] if path.startswith("./") else path, *rest) for path, *rest in entries]
+    top_levels = {entry[0].split("/", 1)[0] for entry in entries}
+    if len(top_levels) == 1 and all("/" in entry[0] for entry in entries):
+        entries = [(entry[0].split("/", 1)[1], *entry[1:]) for entry in entries]
+    entries.sort()
+    return entries
@@ -0,0 +1,88 @@
+"""
+Benchmark of the output backends: compression time, decompression time and ratio on a reference folder.
+
+Compresses the folder with every backend (and level) given, tests the archive, then extracts it:
+    python3 benchmarks/bench_backends.py /path/to/reference/game --backends 7z zstd:15 zstd:19 xz:6
+Without a folder, a synthetic tree of compressible text, repeated binary blocks and random data is used.
+Needs compressionCMD (7z) for the 7z backend, and tar with zstd and xz for the others.
+"""
+import os
+import sys
+import time
+import shutil
+import argparse
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from backends import get_backend, parse_backend_spec
+from catalog import tree_manifest
+
+
+def create_tree(folder, size):
+    """Write about `size` bytes: a third text, a third repeated blocks (long-range matches), a third random."""
+    os.makedirs(os.path.join(folder, "data"), exist_ok=True)
+    with open(os.path.join(folder, "data", "strings.txt"), "wb") as f:
+        line = b"".join(f"item_{i} = {i * 7919 % 104729}\n".encode() for i in range(1000))
+        for _ in range(size // 3 // len(line) + 1):
+            f.write(line)
+    block = os.urandom(4 * 1024 * 1024)
+    for i in range(max(1, size // 3 // (16 * 1024 * 1024))):
+        with open(os.path.join(folder, "data", f"level{i}.pak"), "wb") as f:
+            for _ in range(4):
+                f.write(block)
+    with open(os.path.join(folder, "game.bin"), "wb") as f:
+        f.write(os.urandom(size // 3))
+
+
+def run(backend, level, folder, work_dir, threads):
+    archive_path = os.path.join(work_dir, f"bench{backend.extension}")
+    extract_dir = os.path.join(work_dir, "extract")
+    start = time.perf_counter()
+    if backend.compress(folder, archive_path, threads, level) != 0:
+        raise SystemExit(f"{backend.name} compression failed")
+    compress_time = time.perf_counter() - start
+    start = time.perf_counter()
+    if backend.extract(archive_path, extract_dir) != 0:
+        raise SystemExit(f"{backend.name} extraction failed")
+    decompress_time = time.perf_counter() - start
+    extracted = tree_manifest(os.path.join(extract_dir, os.path.basename(folder.rstrip("/"))))
+    archive_size = os.path.getsize(archive_path)
+    os.remove(archive_path)
+    shutil.rmtree(extract_dir)
+    return compress_time, decompress_time, archive_size, extracted
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("folder", nargs="?", help="Reference folder, a synthetic one is created without it")
+    parser.add_argument("--backends", nargs="+", default=["7z", "zstd", "xz"], help="backend[:level] to compare")
+    parser.add_argument("--size", type=int, default=256, help="Synthetic tree size in MB")
+    parser.add_argument("--threads", type=int, default=os.cpu_count())
+    parser.add_argument("--zstd-long", type=int, default=27, help="zstd long distance matching window (log2)")
+    parser.add_argument("--work-dir", help="Where archives are written, defaults to a temporary directory")
+    args = parser.parse_args()
+
+    config = {"compressionCMD": os.getenv("compressionCMD", "7z"), "output": {"zstd_long": args.zstd_long}}
+    with tempfile.TemporaryDirectory(dir=args.work_dir) as tmp:
+        folder = args.folder
+        if not folder:
+            folder = os.path.join(tmp, "Reference")
+            create_tree(folder, args.size * 1024 * 1024)
+        manifest = tree_manifest(folder)
+        source_size = sum(size for _, size in manifest)
+        print(f"reference: {folder}, {len(manifest)} files, {source_size / 1024 / 1024:.1f} MB, {args.threads} threads")
+        print(f"{'backend':<12}{'compress s':>12}{'MB/s':>9}{'decompress s':>14}{'MB/s':>9}{'ratio':>8}")
+        for spec in args.backends:
+            name, level = parse_backend_spec(spec)
+            backend = get_backend(name, config)
+            compress_time, decompress_time, archive_size, extracted = run(backend, level, folder, tmp, args.threads)
+            if extracted != manifest:
+                raise SystemExit(f"{spec}: the extracted tree doesn't match the reference folder")
+            megabytes = source_size / 1024 / 1024
+            print(f"{spec:<12}{compress_time:>12.2f}{megabytes / compress_time:>9.1f}"
+                  f"{decompress_time:>14.2f}{megabytes / decompress_time:>9.1f}{archive_size / source_size:>8.3f}")
+
+
+if __name__ == "__main__":
+    main()
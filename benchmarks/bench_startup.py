@@ -0,0 +1,98 @@
+"""
+Startup cost of the torrent client hook: main.py against trigger.py.
+
+Runs each entry point as the torrent client would, for a torrent outside the games category (which should
+exit right away) and for a game queued for the daemon, and reports the wall time and CPU time per call.
+With --importtime, also lists the imports that make up most of main.py's startup (python -X importtime):
+    python3 benchmarks/bench_startup.py --runs 20 --importtime
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import resource
+import tempfile
+import statistics
+import subprocess
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+ENTRY_POINTS = ("main.py", "trigger.py")
+
+
+def child_cpu_time():
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return usage.ru_utime + usage.ru_stime
+
+
+def time_call(command, env):
+    """Returns (wall seconds, CPU seconds) of one call."""
+    cpu = child_cpu_time()
+    start = time.perf_counter()
+    subprocess.run(command, env=env, stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL, check=True)
+    return time.perf_counter() - start, child_cpu_time() - cpu
+
+
+def import_times(env, top):
+    """The slowest top-level imports of main.py, as (cumulative seconds, module)."""
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", "import main"], cwd=ROOT, env=env,
+                            stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True, check=True)
+    times = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        # Nested imports are indented by two spaces per level, main.py's own imports are one level down
+        if len(name) - len(name.lstrip()) == 3:
+            times.append((int(cumulative) / 1e6, name.strip()))
+    times.sort(reverse=True)
+    return times[:top]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=10, help="Calls per entry point and case")
+    parser.add_argument("--importtime", action="store_true", help="Also list main.py's slowest imports")
+    parser.add_argument("--top", type=int, default=10, help="Imports listed with --importtime")
+    parser.add_argument("--report", help="Write the results as JSON to this file")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        game = os.path.join(tmp, "Hollow.Knight-GRP")
+        os.makedirs(game)
+        env = dict(os.environ, STATE_DIR=os.path.join(tmp, "state"), storeFolder=os.path.join(tmp, "store"),
+                   logFileLocation=os.path.join(tmp, "gamezip.log"), categoryName="Games", ENABLE_DAEMON="true",
+                   JOB_SERVER_URL="", CATALOG="false")
+        cases = {
+            "other category": ["-c", "Movies", os.path.join(tmp, "Some.Movie.2020")],
+            "queued game": ["-c", "Games", game],
+        }
+        results = []
+        print(f"{'entry point':<14}{'case':<18}{'wall ms':>10}{'cpu ms':>10}")
+        for case, arguments in cases.items():
+            for entry_point in ENTRY_POINTS:
+                command = [sys.executable, os.path.join(ROOT, entry_point), *arguments]
+                time_call(command, env)  # Warm up the page cache and __pycache__
+                calls = [time_call(command, env) for _ in range(args.runs)]
+                wall = statistics.median(call[0] for call in calls)
+                cpu = statistics.median(call[1] for call in calls)
+                results.append({"entry_point": entry_point, "case": case, "wall": wall, "cpu": cpu})
+                print(f"{entry_point:<14}{case:<18}{wall * 1000:>10.1f}{cpu * 1000:>10.1f}")
+        queued = len(os.listdir(os.path.join(tmp, "state", "spool", "pending")))
+        print(f"{queued} jobs queued")
+
+        imports = []
+        if args.importtime:
+            imports = import_times(env, args.top)
+            print(f"\nslowest imports of main.py:\n{'cumulative ms':>14}  module")
+            for seconds, name in imports:
+                print(f"{seconds * 1000:>14.1f}  {name}")
+
+    if args.report:
+        with open(args.report, "w") as f:
+            json.dump({"runs": args.runs, "python": sys.version.split()[0], "results": results,
+                       "main_imports": [{"module": name, "seconds": seconds} for seconds, name in imports]}, f, indent=1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,271 @@
+"""
+End-to-end benchmark suite: synthetic game trees, archive sets and a local IGDB stub, timed stage by stage.
+
+Generates game folders (compressible and incompressible data, thousands of small files), splits them into
+7z volume sets (and RAR sets, plain and password protected, when the rar tool is installed), then times
+find_archive_sets, handle_rar_file, find_best_match, fetch_game_name (against benchmarks/igdb_stub.py),
+compression for each size, thread count and output backend, and whole process_folder jobs.
+Results are written as a JSON report; pass the report of a previous run as --baseline to flag regressions:
+    python3 benchmarks/bench_suite.py --sizes 64 256 --threads 1 4 --report bench.json
+    python3 benchmarks/bench_suite.py --sizes 64 256 --threads 1 4 --report new.json --baseline bench.json
+"""
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import platform
+import argparse
+import tempfile
+import datetime
+import statistics
+import subprocess
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from igdb_stub import KNOWN_GAMES, start_stub, search
+
+PASSWORD = "bench-secret"
+MB = 1024 * 1024
+
+# Share of each tree's size per kind of file
+SCENARIOS = {
+    "mixed": {"text": 0.4, "random": 0.4, "small": 0.2},
+    "incompressible": {"text": 0.05, "random": 0.9, "small": 0.05},
+    "small_files": {"text": 0.1, "random": 0.1, "small": 0.8},
+}
+
+
+def write_text(path, size, rng):
+    """Compressible data: repetitive, game-config-like text."""
+    words = [f"{rng.choice(('texture', 'mesh', 'sound', 'level', 'npc'))}_{i}" for i in range(500)]
+    line = " ".join(words).encode() + b"\n"
+    with open(path, "wb") as f:
+        for _ in range(size // len(line) + 1):
+            f.write(line)
+        f.truncate(size)
+
+
+def write_random(path, size):
+    """Incompressible data, like video or already packed assets."""
+    with open(path, "wb") as f:
+        remaining = size
+        while remaining > 0:
+            f.write(os.urandom(min(remaining, 4 * MB)))
+            remaining -= 4 * MB
+
+
+def make_game_tree(root, size, scenario, seed=0):
+    """Create a game folder of about size bytes laid out like a repack: data/, movies/ and many small files."""
+    rng = random.Random(seed)
+    shares = SCENARIOS[scenario]
+    os.makedirs(os.path.join(root, "data"), exist_ok=True)
+    os.makedirs(os.path.join(root, "movies"), exist_ok=True)
+    text_size = int(size * shares["text"])
+    for i in range(max(1, text_size // (32 * MB))):
+        write_text(os.path.join(root, "data", f"assets{i}.dat"), min(text_size, 32 * MB), rng)
+    random_size = int(size * shares["random"])
+    for i in range(max(1, random_size // (64 * MB))):
+        write_random(os.path.join(root, "movies", f"intro{i}.bk2"), min(random_size, 64 * MB))
+    small_size = int(size * shares["small"])
+    count = 0
+    while small_size > 0:
+        file_size = rng.randint(1024, 32 * 1024)
+        folder = os.path.join(root, "data", "scripts", f"pack{count // 500}")
+        os.makedirs(folder, exist_ok=True)
+        write_text(os.path.join(folder, f"script{count}.lua"), file_size, rng)
+        small_size -= file_size
+        count += 1
+    return root
+
+
+def make_archive_sets(tree, work_dir, config, volume_size):
+    """
+    Build the archive sets of a tree, one folder each, named after a known game.
+    Returns {kind: folder}; RAR sets need the rar tool and are left out without it.
+    """
+    sets = {}
+    archive = os.path.join(work_dir, "whole.7z")
+    subprocess.run([config["compressionCMD"], 'a', '-t7z', '-mx1', archive, tree], check=True,
+                   stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL)
+    folder = os.path.join(work_dir, "7z_split", "Hollow Knight [GRP]")
+    os.makedirs(folder)
+    with open(archive, "rb") as f:
+        for index, chunk in enumerate(iter(lambda: f.read(volume_size), b""), 1):
+            with open(os.path.join(folder, f"hollow.knight.7z.{index:03d}"), "wb") as volume:
+                volume.write(chunk)
+    os.remove(archive)
+    sets["7z_split"] = folder
+    if shutil.which("rar"):
+        for kind, switches in (("rar_volumes", []), ("rar_password", [f"-hp{PASSWORD}"])):
+            folder = os.path.join(work_dir, kind, "Dead Cells [GRP]")
+            os.makedirs(folder)
+            subprocess.run(["rar", "a", "-m1", "-ep1", "-idq", f"-v{volume_size // 1024}k", *switches,
+                            os.path.join(folder, "dead.cells.rar"), tree], check=True, stdin=subprocess.DEVNULL)
+            sets[kind] = folder
+    return sets
+
+
+def link_copy(folder, dest):
+    """Hardlink a folder of volumes, so each timed run starts from untouched inputs without copying them."""
+    os.makedirs(dest)
+    for name in os.listdir(folder):
+        os.link(os.path.join(folder, name), os.path.join(dest, name))
+    return dest
+
+
+def timed(function, repeat=1):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        timings.append(time.perf_counter() - start)
+    return {"wall_time": round(statistics.median(timings), 4), "min": round(min(timings), 4), "runs": repeat}
+
+
+def stage_times(stages):
+    return {record["stage"]: {"wall_time": record["wall_time"], "mb_per_s": record["mb_per_s"]} for record in stages}
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(report, baseline, tolerance):
+    """Print the results slower than in the baseline by more than tolerance. Returns the number of regressions."""
+    previous = {json.dumps([result["benchmark"], result["params"]], sort_keys=True): result for result in baseline["results"]}
+    regressions = 0
+    for result in report["results"]:
+        old = previous.get(json.dumps([result["benchmark"], result["params"]], sort_keys=True))
+        if not old or not old["wall_time"]:
+            continue
+        change = result["wall_time"] / old["wall_time"] - 1
+        if change > tolerance:
+            regressions += 1
+            print(f"REGRESSION {result['benchmark']} {result['params']}: {old['wall_time']:.3f}s -> "
+                  f"{result['wall_time']:.3f}s ({change:+.0%})")
+    print(f"{regressions} regressions against the baseline ({baseline['created_at']}, {baseline.get('git_commit')})")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[64], help="Game tree sizes in MB")
+    parser.add_argument("--threads", type=int, nargs="+", default=[1, os.cpu_count() or 1], help="Compression thread counts")
+    parser.add_argument("--scenarios", nargs="+", default=list(SCENARIOS), choices=list(SCENARIOS))
+    parser.add_argument("--backends", nargs="+", default=["7z"], help="Output backends to compress with")
+    parser.add_argument("--volume-size", type=int, default=16, help="Archive volume size in MB")
+    parser.add_argument("--latency", type=float, default=0.05, help="Simulated IGDB round trip in seconds")
+    parser.add_argument("--repeat", type=int, default=3, help="Runs of the quick benchmarks, the median is kept")
+    parser.add_argument("--work-dir", help="Where trees and archives are created, defaults to a temporary directory")
+    parser.add_argument("--report", default="bench-report.json")
+    parser.add_argument("--baseline", help="Report of a previous run to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.1, help="Slowdown reported as a regression")
+    args = parser.parse_args()
+
+    stub, stub_url = start_stub(latency=args.latency)
+    with tempfile.TemporaryDirectory(dir=args.work_dir) as tmp:
+        os.environ.update({
+            "STATE_DIR": os.path.join(tmp, "state"), "storeFolder": os.path.join(tmp, "store") + "/",
+            "logFileLocation": os.path.join(tmp, "gamezip.log"), "client_id": "bench", "client_secret": "bench",
+            "IGDB_API_URL": f"{stub_url}/v4/", "TWITCH_TOKEN_URL": f"{stub_url}/oauth2/token",
+            "IGDB_REQUESTS_PER_SECOND": "1000", "IGDB_BURST": "1000", "IGDB_CACHE": "false",
+            "CATALOG": "false", "ENABLE_POPULARITY_FILTER": "false", "password_list": f"wrong1,wrong2,{PASSWORD}",
+        })
+        os.makedirs(os.environ["STATE_DIR"])
+        os.makedirs(os.environ["storeFolder"])
+        import main as gamezip
+        from metrics import start_job_metrics
+        config = gamezip.load_config()
+        gamezip.load_logger(config, False)
+        results = []
+
+        def record(benchmark, params, timing, **extra):
+            results.append({"benchmark": benchmark, "params": params, **timing, **extra})
+            details = " ".join(f"{key}={value}" for key, value in params.items())
+            print(f"{benchmark:<18} {details:<55} {timing['wall_time']:>9.3f}s")
+
+        # Name lookups: matching alone, then through HTTP and the rate limiter against the stub
+        rng = random.Random(0)
+        candidates = [(name, search(stub.catalog, name)) for name in KNOWN_GAMES]
+        record("find_best_match", {"games": len(candidates)},
+               timed(lambda: [gamezip.find_best_match(games, name) for name, games in candidates], args.repeat))
+        folders = [os.path.join(tmp, f"{name} [Repack v{rng.randint(1, 9)}]") for name in KNOWN_GAMES]
+        record("fetch_game_name", {"lookups": len(folders), "latency": args.latency},
+               timed(lambda: [gamezip.fetch_game_name(folder, dict(config)) for folder in folders]))
+        record("fetch_game_names", {"lookups": len(folders), "latency": args.latency},
+               timed(lambda: list(gamezip.fetch_game_names(folders, config))))
+
+        for size in args.sizes:
+            for scenario in args.scenarios:
+                work_dir = os.path.join(tmp, f"{scenario}_{size}")
+                tree = make_game_tree(os.path.join(work_dir, "tree", "Hollow Knight"), size * MB, scenario)
+                tree_size = gamezip.estimate_folder_size(tree)
+                params = {"scenario": scenario, "size_mb": size}
+
+                for backend in args.backends:
+                    for threads in args.threads:
+                        job_config = dict(config, multithread=threads, releaseDate=2017,
+                                          output=dict(config["output"], default=(backend, None)))
+                        start_job_metrics(job_config, tree)
+                        timing = timed(lambda: gamezip.compression(tree, f"Bench {scenario} {threads}", job_config))
+                        archive = os.path.join(config["storeFolder"], f"Bench {scenario} {threads} (2017)"
+                                               f"{gamezip.get_backend(backend, config).extension}")
+                        record("compression", {**params, "backend": backend, "threads": threads}, timing,
+                               mb_per_s=round(tree_size / MB / timing["wall_time"], 2),
+                               ratio=round(os.path.getsize(archive) / tree_size, 4),
+                               stages=stage_times(job_config["job_metrics"]["stages"]))
+                        for name in os.listdir(config["storeFolder"]):
+                            os.remove(os.path.join(config["storeFolder"], name))
+
+                archive_sets = make_archive_sets(tree, work_dir, config, args.volume_size * MB)
+                for kind, folder in archive_sets.items():
+                    record("find_archive_sets", {**params, "kind": kind},
+                           timed(lambda: gamezip.find_archive_sets(folder), args.repeat))
+                    job_folder = link_copy(folder, os.path.join(work_dir, "jobs", kind, os.path.basename(folder)))
+                    job_config = dict(config)
+                    start_job_metrics(job_config, job_folder)
+                    timing = timed(lambda: gamezip.handle_rar_file(job_folder, None, job_config))
+                    record("handle_rar_file", {**params, "kind": kind}, timing,
+                           stages=stage_times(job_config["job_metrics"]["stages"]))
+
+                    # The whole job, lookup through the stub included
+                    job_folder = link_copy(folder, os.path.join(work_dir, "pipeline", kind, os.path.basename(folder)))
+                    timing = timed(lambda: gamezip.process_folder(job_folder, dict(config, multithread=max(args.threads))))
+                    with open(config["metrics"]["file"]) as f:
+                        job_metrics = json.loads(f.read().splitlines()[-1])
+                    record("process_folder", {**params, "kind": kind}, timing, status=job_metrics["status"],
+                           stages=stage_times(job_metrics["stages"]))
+                    for name in os.listdir(config["storeFolder"]):
+                        os.remove(os.path.join(config["storeFolder"], name))
+                if not shutil.which("rar"):
+                    print(f"{'':<18} rar not found, RAR sets skipped")
+                shutil.rmtree(work_dir)
+
+    report = {
+        "version": 1,
+        "created_at": datetime.datetime.now().isoformat(timespec="seconds"),
+        "git_commit": git_commit(),
+        "host": {"platform": platform.platform(), "python": platform.python_version(), "cpus": os.cpu_count()},
+        "args": vars(args),
+        "igdb_stub_requests": stub.requests,
+        "results": results,
+    }
+    with open(args.report, "w") as f:
+        json.dump(report, f, indent=1)
+    print(f"Report written to {args.report}")
+    stub.shutdown()
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(report, json.load(f), args.tolerance)
+        if regressions:
+            raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
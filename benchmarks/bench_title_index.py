@@ -0,0 +1,79 @@
+"""
+Lookup benchmark for the offline title index.
+
+Builds a synthetic catalog (or uses an existing index with --index) and times lookups of mangled names:
+    python3 benchmarks/bench_title_index.py --games 200000 --lookups 500
+"""
+import os
+import sys
+import csv
+import time
+import random
+import argparse
+import tempfile
+import statistics
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from title_index import open_index, lookup, build_index
+
+WORDS = ("dark souls legend zelda final fantasy witcher hunt wild portal hades peak skyrim elder scrolls "
+         "minecraft dungeon craft star wars knight hollow city night racing simulator tactics empire age "
+         "kingdom hearts space station dead island shadow tomb raider call duty modern warfare").split()
+
+
+def synthetic_titles(count, seed=0):
+    rng = random.Random(seed)
+    return [" ".join(rng.choice(WORDS).title() for _ in range(rng.randint(1, 4))) + f" {i % 97 or ''}".rstrip()
+            for i in range(count)]
+
+
+def mangle(name, rng):
+    """Mangle a title the way release names often are: dots, underscores and dropped spaces."""
+    chars = [c for c in name if c != " " or rng.random() < 0.5]
+    return "".join(c + ("." if rng.random() < 0.2 else "") for c in chars)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--index", help="Benchmark an existing index instead of a synthetic one")
+    parser.add_argument("--games", type=int, default=100000, help="Size of the synthetic catalog")
+    parser.add_argument("--lookups", type=int, default=300)
+    args = parser.parse_args()
+    rng = random.Random(1)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        index_path = args.index
+        if not index_path:
+            titles = synthetic_titles(args.games)
+            games_csv = os.path.join(tmp, "games.csv")
+            with open(games_csv, "w", newline="") as f:
+                writer = csv.writer(f)
+                writer.writerow(["id", "name", "first_release_date", "total_rating_count"])
+                for i, title in enumerate(titles, 1):
+                    writer.writerow([i, title, 1262304000 + i, rng.randint(0, 2000)])
+            index_path = os.path.join(tmp, "title_index.sqlite")
+            start = time.monotonic()
+            build_index(index_path, games_csv)
+            print(f"build: {args.games} games in {time.monotonic() - start:.1f}s")
+
+        conn = open_index(index_path)
+        names = [row[0] for row in conn.execute("SELECT name FROM games ORDER BY RANDOM() LIMIT ?", (args.lookups,))]
+        timings = []
+        hits = 0
+        for name in names:
+            search = mangle(name, rng)
+            start = time.perf_counter()
+            games = lookup(conn, search)
+            timings.append((time.perf_counter() - start) * 1000)
+            hits += bool(games) and games[0]["name"] == name
+        conn.close()
+
+    timings.sort()
+    print(f"lookups: {len(timings)}, top-1 accuracy {hits / len(timings):.1%}")
+    print(f"latency ms: mean {statistics.mean(timings):.2f}, p50 {timings[len(timings) // 2]:.2f}, "
+          f"p95 {timings[int(len(timings) * 0.95)]:.2f}, max {timings[-1]:.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+"""
+Benchmark for the archive volume-set indexer.
+
+Creates a folder of empty sparse volumes (RAR .partN and .rNN sets, 7z and zip splits, plus unrelated files)
+and times index_volume_sets on it:
+    python3 benchmarks/bench_volume_index.py --volumes 5000 --repeat 20
+"""
+import os
+import sys
+import time
+import argparse
+import tempfile
+import statistics
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from volumes import index_volume_sets, describe_problems
+
+VOLUME_SIZE = 100 * 1024 * 1024
+
+
+def old_style_name(index):
+    if index == 0:
+        return ".rar"
+    letter, number = divmod(index - 1, 100)
+    return f".{chr(ord('r') + letter)}{number:02d}"
+
+
+def create_volumes(folder, volumes, sets):
+    """Spread `volumes` sparse files over `sets` sets of each naming scheme, the last set missing one volume."""
+    per_set = max(2, volumes // (sets * 4))
+    schemes = (
+        lambda base, i: f"{base}.part{i + 1:04d}.rar",
+        lambda base, i: f"{base}{old_style_name(i)}",
+        lambda base, i: f"{base}.7z.{i + 1:03d}",
+        lambda base, i: f"{base}.z{i + 1:02d}" if i < per_set - 1 else f"{base}.zip",
+    )
+    count = 0
+    for set_number in range(sets):
+        for scheme_number, name in enumerate(schemes):
+            # Old style RAR names stop at .z99
+            length = min(per_set, 801) if scheme_number == 1 else per_set
+            for i in range(length):
+                if set_number == sets - 1 and i == length // 2:
+                    continue
+                with open(os.path.join(folder, name(f"set{set_number}_{scheme_number}", i)), "wb") as f:
+                    f.truncate(VOLUME_SIZE if i < length - 1 else VOLUME_SIZE // 3)
+                count += 1
+    for i in range(sets * 10):
+        open(os.path.join(folder, f"readme{i}.nfo"), "w").close()
+    return count
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--folder", help="Benchmark an existing folder instead of a synthetic one")
+    parser.add_argument("--volumes", type=int, default=5000, help="Number of synthetic volumes")
+    parser.add_argument("--sets", type=int, default=4, help="Synthetic sets per naming scheme")
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        folder = args.folder or tmp
+        if not args.folder:
+            created = create_volumes(folder, args.volumes, args.sets)
+            print(f"created {created} volumes in {folder}")
+
+        timings = []
+        for _ in range(args.repeat):
+            start = time.perf_counter()
+            volume_sets = index_volume_sets(folder)
+            timings.append((time.perf_counter() - start) * 1000)
+
+    incomplete = [volume_set for volume_set in volume_sets if describe_problems(volume_set)]
+    volumes = sum(len(volume_set["volumes"]) for volume_set in volume_sets)
+    print(f"sets: {len(volume_sets)} ({len(incomplete)} incomplete), volumes: {volumes}")
+    print(f"index ms: mean {statistics.mean(timings):.2f}, min {min(timings):.2f}, max {max(timings):.2f}, "
+          f"{volumes / (min(timings) / 1000):,.0f} volumes/s")
+
+
+if __name__ == "__main__":
+    main()
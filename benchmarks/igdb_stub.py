@@ -0,0 +1,110 @@
+"""
+Local stand-in for the Twitch token endpoint and IGDB's games and multiquery endpoints, serving canned results.
+
+Point GameZip at it to run lookups without credentials or network, with a simulated round trip:
+    python3 benchmarks/igdb_stub.py --port 8766 --latency 0.15
+    IGDB_API_URL=http://127.0.0.1:8766/v4/ TWITCH_TOKEN_URL=http://127.0.0.1:8766/oauth2/token python3 main.py ...
+"""
+import re
+import json
+import time
+import random
+import argparse
+import threading
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Games the synthetic trees of the benchmark suite are named after, so their lookups find a good match
+KNOWN_GAMES = ("Hollow Knight", "Portal 2", "Hades", "The Witcher 3 Wild Hunt", "It Takes Two", "Celeste",
+               "Stardew Valley", "Disco Elysium", "Outer Wilds", "Into the Breach", "Dead Cells", "Factorio")
+WORDS = ("dark souls legend zelda final fantasy witcher hunt wild portal hades peak skyrim elder scrolls "
+         "knight hollow city night racing simulator tactics empire age kingdom space station dead island").split()
+
+SEARCH_PATTERN = re.compile(r'search "(?P<name>[^"]*)"')
+MULTIQUERY_PATTERN = re.compile(r'query games "(?P<label>[^"]*)" \{(?P<body>.*?)\};', re.DOTALL)
+
+
+def build_catalog(size=5000, seed=0):
+    rng = random.Random(seed)
+    names = list(KNOWN_GAMES)
+    names.extend(" ".join(rng.choice(WORDS).title() for _ in range(rng.randint(1, 4))) for _ in range(size))
+    return [{
+        "id": index + 1,
+        "name": name,
+        "first_release_date": rng.randint(946684800, 1735689600),
+        "total_rating_count": rng.randint(0, 3000) if index >= len(KNOWN_GAMES) else 5000,
+        "rating_count": rng.randint(0, 500),
+    } for index, name in enumerate(names)]
+
+
+def search(catalog, name, limit=10):
+    """Candidates sharing the most words with the searched name, like IGDB's fuzzy search returns."""
+    words = set(name.lower().split())
+    scored = [(len(words & set(game["name"].lower().split())), game) for game in catalog]
+    scored = [(score, game) for score, game in scored if score]
+    scored.sort(key=lambda item: (-item[0], -item[1]["total_rating_count"]))
+    return [game for _, game in scored[:limit]]
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    def do_POST(self):
+        server = self.server
+        body = self.rfile.read(int(self.headers.get("Content-Length") or 0)).decode()
+        time.sleep(server.latency)
+        with server.lock:
+            server.requests[self.path] = server.requests.get(self.path, 0) + 1
+        if self.path.startswith("/oauth2/token"):
+            return self.reply({"access_token": "stub-token", "expires_in": 5000000, "token_type": "bearer"})
+        if self.headers.get("Authorization") != "Bearer stub-token":
+            return self.reply({"message": "Authorization Failure"}, 401)
+        if self.path == "/v4/games":
+            match = SEARCH_PATTERN.search(body)
+            return self.reply(search(server.catalog, match["name"]) if match else [])
+        if self.path == "/v4/multiquery":
+            results = []
+            for query in MULTIQUERY_PATTERN.finditer(body):
+                match = SEARCH_PATTERN.search(query["body"])
+                results.append({"name": query["label"], "result": search(server.catalog, match["name"]) if match else []})
+            return self.reply(results)
+        self.reply({"message": "not found"}, 404)
+
+    def reply(self, body, status=200):
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_stub(port=0, latency=0.0, catalog_size=5000):
+    """Start the stub in a background thread. Returns (server, base url), server.requests counts requests per path."""
+    server = ThreadingHTTPServer(("127.0.0.1", port), StubHandler)
+    server.daemon_threads = True
+    server.catalog = build_catalog(catalog_size)
+    server.latency = latency
+    server.requests = {}
+    server.lock = threading.Lock()
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--port", type=int, default=8766)
+    parser.add_argument("--latency", type=float, default=0.0, help="Seconds added to every response")
+    parser.add_argument("--catalog", type=int, default=5000, help="Synthetic games on top of the known ones")
+    args = parser.parse_args()
+    server, url = start_stub(args.port, args.latency, args.catalog)
+    print(f"IGDB stub on {url}: IGDB_API_URL={url}/v4/ TWITCH_TOKEN_URL={url}/oauth2/token")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
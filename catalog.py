@@ -0,0 +1,181 @@
+import os
+import re
+import time
+import sqlite3
+import hashlib
+import logging
+import subprocess
+
+from backends import backend_for_archive
+
+
+logger = logging.getLogger()
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS archives (
+    archive TEXT PRIMARY KEY,
+    igdb_id INTEGER,
+    name TEXT NOT NULL,
+    year INTEGER,
+    archive_size INTEGER,
+    source_size INTEGER,
+    ratio REAL,
+    layout TEXT,
+    fingerprint TEXT,
+    added_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS archives_igdb_id ON archives (igdb_id);
+CREATE INDEX IF NOT EXISTS archives_layout ON archives (layout);
+CREATE INDEX IF NOT EXISTS archives_fingerprint ON archives (fingerprint);
+'''
+
+# "{game} ({releaseDate}).7z", the names compression gives to archives (.tar.zst and .tar.xz for the tar backends,
+# .zip for zip inputs stored as-is)
+ARCHIVE_NAME_PATTERN = re.compile(r'^(?P<name>.+) \((?P<year>\d+|None)\)\.(?:7z|zip|tar\.zst|tar\.xz)$')
+
+
+def open_catalog(config):
+    """
+    Open (and create if needed) the catalog of the archives in storeFolder.
+    Returns a sqlite3 connection, or None if the catalog is disabled.
+    """
+    catalog_config = config["catalog"]
+    if not catalog_config["enabled"]:
+        return None
+    os.makedirs(os.path.dirname(catalog_config["path"]) or ".", exist_ok=True)
+    conn = sqlite3.connect(catalog_config["path"], timeout=30)
+    conn.row_factory = sqlite3.Row
+    conn.executescript(SCHEMA)
+    return conn
+
+
+def tree_manifest(folder_path):
+    """List (path, size) of every file under folder_path, sorted, with paths relative to folder_path."""
+    manifest = []
+    for root, _, filenames in os.walk(folder_path):
+        for filename in filenames:
+            path = os.path.join(root, filename)
+            manifest.append((os.path.relpath(path, folder_path).replace(os.sep, "/"), os.lstat(path).st_size))
+    manifest.sort()
+    return manifest
+
+
+def layout_hash(manifest):
+    """Hash of the paths and sizes of a tree, which can also be computed from an archive's listing."""
+    return hashlib.sha256("".join(f"{path}\t{size}\n" for path, size in manifest).encode()).hexdigest()
+
+
+def sampled_hash(path, size, sample_size):
+    """Hash the first, middle and last sample_size bytes of a file, enough to tell builds apart without reading it all."""
+    digest = hashlib.blake2b(digest_size=16)
+    with open(path, "rb") as f:
+        for offset in sorted({0, max(0, size // 2 - sample_size // 2), max(0, size - sample_size)}):
+            f.seek(offset)
+            digest.update(f.read(sample_size))
+    return digest.hexdigest()
+
+
+def fingerprint_tree(folder_path, config):
+    """
+    Fingerprint a source tree from its manifest of paths, sizes and sampled block hashes.
+    Paths are relative to folder_path, so the release group's top-level folder name doesn't matter.
+    Returns (layout, fingerprint, source_size).
+    """
+    sample_size = config["catalog"]["sample_size"]
+    manifest = tree_manifest(folder_path)
+    fingerprint = hashlib.sha256()
+    for path, size in manifest:
+        block_hash = sampled_hash(os.path.join(folder_path, path), size, sample_size)
+        fingerprint.update(f"{path}\t{size}\t{block_hash}\n".encode())
+    return layout_hash(manifest), fingerprint.hexdigest(), sum(size for _, size in manifest)
+
+
+def find_duplicate(conn, igdb_id=None, layout=None, fingerprint=None):
+    """
+    Find an archive of the same game (by IGDB id) or of the same source tree (by fingerprint).
+    Archives added by rebuild_catalog only have a layout, so they are matched by layout instead.
+    Without a fingerprint (archives stored as-is), the layout is matched against every archive.
+    Returns (archive row, reason) or (None, None).
+    """
+    if conn is None:
+        return None, None
+    if igdb_id:
+        row = conn.execute("SELECT * FROM archives WHERE igdb_id = ?", (igdb_id,)).fetchone()
+        if row is not None:
+            return row, f"IGDB id {igdb_id}"
+    if fingerprint:
+        row = conn.execute("SELECT * FROM archives WHERE fingerprint = ? OR (fingerprint IS NULL AND layout = ?)",
+                           (fingerprint, layout)).fetchone()
+        if row is not None:
+            return row, "content fingerprint"
+    elif layout:
+        row = conn.execute("SELECT * FROM archives WHERE layout = ?", (layout,)).fetchone()
+        if row is not None:
+            return row, "file layout"
+    return None, None
+
+
+def record_archive(conn, archive_path, igdb_id, name, year, source_size, layout=None, fingerprint=None):
+    if conn is None:
+        return
+    archive_size = os.path.getsize(archive_path)
+    ratio = round(archive_size / source_size, 3) if source_size else None
+    with conn:
+        conn.execute("INSERT OR REPLACE INTO archives VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                     (os.path.basename(archive_path), igdb_id, name, year if isinstance(year, int) else None,
+                      archive_size, source_size, ratio, layout, fingerprint, time.time()))
+    logger.info(f"Added {os.path.basename(archive_path)} to the catalog")
+
+
+def list_archive(archive_path, config):
+    """Read the (path, size) manifest of an archive with the backend matching its extension."""
+    return backend_for_archive(archive_path, config).manifest(archive_path)
+
+
+def rebuild_catalog(config, resolve_ids=None):
+    """
+    Rebuild the catalog from the archives in storeFolder, forgetting the ones that are gone.
+    Archives that are already cataloged with the same size keep their entry. Source trees can't be sampled
+    from an archive, so new entries get a layout but no fingerprint.
+    resolve_ids(archives) returns a {(name, year): igdb_id} dict for a list of (name, year) pairs.
+    """
+    store_folder = config["storeFolder"]
+    conn = open_catalog(config)
+    if conn is None:
+        logger.warning("The catalog is disabled, nothing to rebuild")
+        return 0
+    known = {row["archive"]: row for row in conn.execute("SELECT * FROM archives")}
+    archives = {}
+    for entry in os.scandir(store_folder):
+        match = ARCHIVE_NAME_PATTERN.match(entry.name)
+        if not entry.is_file() or not match:
+            continue
+        row = known.get(entry.name)
+        if row is not None and row["archive_size"] == entry.stat().st_size and row["igdb_id"] is not None:
+            continue
+        year = match.group("year")
+        archives[entry.path] = (match.group("name"), int(year) if year.isdigit() else None)
+    igdb_ids = resolve_ids(list(archives.values())) if resolve_ids and archives else {}
+
+    count = 0
+    for archive_path, (name, year) in sorted(archives.items()):
+        row = known.get(os.path.basename(archive_path))
+        if row is not None and row["archive_size"] == os.path.getsize(archive_path):
+            with conn:
+                conn.execute("UPDATE archives SET igdb_id = ? WHERE archive = ?", (igdb_ids.get((name, year)), row["archive"]))
+            count += 1
+            continue
+        try:
+            manifest = list_archive(archive_path, config)
+        except (subprocess.CalledProcessError, OSError) as e:
+            logger.warning(f"Can't list {archive_path}, leaving it out of the catalog: {e}")
+            continue
+        record_archive(conn, archive_path, igdb_ids.get((name, year)), name, year,
+                       sum(size for _, size in manifest), layout_hash(manifest))
+        count += 1
+    gone = [(archive,) for archive in known if not os.path.exists(os.path.join(store_folder, archive))]
+    with conn:
+        conn.executemany("DELETE FROM archives WHERE archive = ?", gone)
+    conn.close()
+    logger.info(f"Rebuilt the catalog of {store_folder}: {count} archives updated, {len(gone)} removed")
+    return count
@@ -0,0 +1,82 @@
+import os
+import zlib
+import logging
+
+from concurrent.futures import ThreadPoolExecutor
+
+
+logger = logging.getLogger()
+
+# zlib.crc32 releases the GIL on buffers this big, so the hashing threads run in parallel
+CHUNK_SIZE = 4 * 1024 * 1024
+
+
+def crc32_file(path, chunk_size=CHUNK_SIZE):
+    """CRC32 of a file, read unbuffered into one reused buffer."""
+    crc = 0
+    buffer = bytearray(chunk_size)
+    view = memoryview(buffer)
+    with open(path, "rb", buffering=0) as f:
+        while True:
+            length = f.readinto(buffer)
+            if not length:
+                break
+            crc = zlib.crc32(view[:length], crc)
+    return crc
+
+
+class TreeChecksums:
+    """
+    CRC32 of every file of a source tree, computed by a thread pool in the background.
+    It is started along with the compressor, so both read the tree at the same time and the
+    files are mostly read once from disk, then from the page cache.
+    Paths are relative to the tree (the file's name for a single file input), like an archive's relative manifest.
+    """
+
+    def __init__(self, source_path, workers):
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="checksum")
+        self.futures = {}
+        if os.path.isfile(source_path):
+            files = [(os.path.basename(source_path), source_path)]
+        else:
+            files = []
+            for root, _, filenames in os.walk(source_path):
+                for filename in filenames:
+                    path = os.path.join(root, filename)
+                    files.append((os.path.relpath(path, source_path).replace(os.sep, "/"), path))
+        for relative_path, path in sorted(files):
+            self.futures[relative_path] = (os.lstat(path).st_size, self.executor.submit(crc32_file, path))
+        self.executor.shutdown(wait=False)
+
+    def result(self):
+        """Wait for the hashing to finish, returns {path: (size, crc32)}."""
+        return {path: (size, future.result()) for path, (size, future) in self.futures.items()}
+
+    def cancel(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+
+def compare_checksums(source, archive):
+    """
+    Check an archive's (path, size, crc32) entries against the source's {path: (size, crc32)}.
+    Returns the problems as readable strings, an empty list when every file matches.
+    """
+    problems = []
+    archived = {path: (size, crc) for path, size, crc in archive}
+    missing = sorted(set(source) - set(archived))
+    if missing:
+        problems.append(f"{len(missing)} files missing from the archive ({', '.join(missing[:10])})")
+    extra = sorted(set(archived) - set(source))
+    if extra:
+        problems.append(f"{len(extra)} files not in the source ({', '.join(extra[:10])})")
+    mismatched = [path for path in sorted(set(source) & set(archived)) if source[path] != archived[path]]
+    if mismatched:
+        problems.append(f"{len(mismatched)} files with a different size or CRC32 ({', '.join(mismatched[:10])})")
+    return problems
+
+
+def format_sfv(checksums):
+    """Format (path, size, crc32) entries as an .sfv file, the checksum format release groups ship."""
+    lines = ["; Per-file CRC32 of the archived files, paths relative to its top-level folder"]
+    lines.extend(f"{path} {crc:08X}" for path, _, crc in checksums)
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,151 @@
+import os
+import zlib
+import logging
+import tempfile
+
+from concurrent.futures import ThreadPoolExecutor
+from staging import format_size
+
+
+logger = logging.getLogger()
+
+# Formats that are already compressed, small files with these extensions are stored without probing them
+PACKED_EXTENSIONS = {
+    ".bk2", ".bik", ".mp4", ".webm", ".mkv", ".avi", ".usm", ".ogg", ".mp3", ".wem", ".xwma", ".opus", ".flac",
+    ".png", ".jpg", ".jpeg", ".zip", ".7z", ".rar", ".gz", ".xz", ".zst", ".cab", ".apk",
+}
+
+# Ratio assumed for small compressible files that aren't probed
+DEFAULT_RATIO = 0.6
+
+MB = 1024 * 1024
+
+
+def probe_file(path, size, sample_size, samples):
+    """
+    Test-compress a few samples spread over the file with a fast zlib level.
+    Returns the compressed/original ratio of the samples (1.0 means incompressible).
+    """
+    step = max(size // samples, sample_size)
+    original = 0
+    compressed = 0
+    with open(path, "rb") as f:
+        for offset in range(0, size, step):
+            f.seek(offset)
+            data = f.read(sample_size)
+            if not data:
+                break
+            original += len(data)
+            compressed += len(zlib.compress(data, 1))
+    return compressed / original if original else 1.0
+
+
+def analyze_folder(folder_path, config, threads=1):
+    """
+    Split the files of folder_path into the ones worth compressing and the ones to store as-is.
+    Paths in the returned profile are relative to the parent of folder_path, like 7z stores them.
+    A single file is profiled on its own.
+    """
+    profile_config = config["adaptive_compression"]
+    parent = os.path.dirname(os.path.abspath(folder_path))
+    profile = {"compress": [], "store": [], "compress_bytes": 0, "store_bytes": 0, "projected_bytes": 0}
+    to_probe = []
+
+    if os.path.isfile(folder_path):
+        tree = [(parent, [], [os.path.basename(os.path.abspath(folder_path))])]
+    else:
+        tree = os.walk(folder_path)
+    for root, _, filenames in tree:
+        for filename in filenames:
+            path = os.path.join(root, filename)
+            size = os.lstat(path).st_size
+            if size >= profile_config["probe_min_size"]:
+                to_probe.append((path, size))
+                continue
+            packed = os.path.splitext(filename)[1].lower() in PACKED_EXTENSIONS
+            ratio = 1.0 if packed else DEFAULT_RATIO
+            _add_to_profile(profile, os.path.relpath(path, parent), size, ratio, packed)
+
+    def probe(item):
+        path, size = item
+        return probe_file(path, size, profile_config["sample_size"], profile_config["samples"])
+
+    with ThreadPoolExecutor(max_workers=max(1, threads)) as executor:
+        for (path, size), ratio in zip(to_probe, executor.map(probe, to_probe)):
+            store = ratio >= profile_config["store_threshold"]
+            logger.debug(f"Probe {path}: ratio {ratio:.2f} ({'store' if store else 'compress'})")
+            _add_to_profile(profile, os.path.relpath(path, parent), size, ratio, store)
+
+    total = profile["compress_bytes"] + profile["store_bytes"]
+    profile["projected_ratio"] = profile["projected_bytes"] / total if total else 1.0
+    logger.info(f"Compressibility probe of {folder_path}: {len(to_probe)} files probed, "
+                f"{format_size(profile['store_bytes'])} stored, {format_size(profile['compress_bytes'])} compressed, "
+                f"projected ratio {profile['projected_ratio']:.2f}")
+    return profile
+
+
+def _add_to_profile(profile, relpath, size, ratio, store):
+    if store:
+        profile["store"].append(relpath)
+        profile["store_bytes"] += size
+        profile["projected_bytes"] += size
+    else:
+        profile["compress"].append(relpath)
+        profile["compress_bytes"] += size
+        profile["projected_bytes"] += size * ratio
+
+
+def available_memory():
+    try:
+        return os.sysconf("SC_AVPHYS_PAGES") * os.sysconf("SC_PAGE_SIZE")
+    except (ValueError, OSError):
+        return 2048 * MB
+
+
+def choose_lzma_settings(compress_bytes, threads, config):
+    """
+    Pick the LZMA2 dictionary size and level for a job.
+    The dictionary is never bigger than the data, and LZMA2 needs roughly 11x the dictionary per pair of threads
+    plus 4x for each block, so it is also capped by the share of free RAM we allow ourselves.
+    Big jobs get a lower level to keep compression time in check.
+    """
+    memory_budget = available_memory() * config["adaptive_compression"]["ram_fraction"]
+    encoders = max(1, (threads + 1) // 2)
+    dictionary = 16 * MB
+    while (dictionary * 2 <= 1536 * MB and dictionary < compress_bytes
+           and encoders * dictionary * 2 * 15 <= memory_budget):
+        dictionary *= 2
+
+    if compress_bytes < 4 * 1024 * MB:
+        level = 9
+    elif compress_bytes < 32 * 1024 * MB:
+        level = 7
+    else:
+        level = 5
+    return dictionary // MB, level
+
+
+def build_7z_commands(compression_cmd, archive_path, profile, threads, config, list_dir):
+    """
+    Build the 7z invocations for a profile: one LZMA2 pass over the compressible files, then one pass
+    adding the incompressible ones with -mx0. Each pass reads its files from a listfile in list_dir.
+    7z adds files by rewriting the whole archive, so the second pass reads and writes the first one's output again.
+    Returns a list of (command, listfile) tuples, to run from the parent of the compressed folder.
+    """
+    dictionary, level = choose_lzma_settings(profile["compress_bytes"], threads, config)
+    logger.info(f"Adaptive compression: LZMA2 level {level} with a {dictionary} MB dictionary, "
+                f"{len(profile['store'])} files stored")
+    passes = [
+        ("compress", ['-m0=lzma2', f'-mx={level}', f'-md={dictionary}m']),
+        ("store", ['-mx0']),
+    ]
+    commands = []
+    for name, switches in passes:
+        if not profile[name]:
+            continue
+        fd, listfile = tempfile.mkstemp(prefix=f"{name}_", suffix=".lst", dir=list_dir)
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            f.write("\n".join(profile[name]) + "\n")
+        command = [compression_cmd, 'a', '-t7z', archive_path, f'@{listfile}', '-scsUTF-8', f'-mmt={threads}']
+        commands.append((command + switches, listfile))
+    return commands
@@ -0,0 +1,174 @@
+import os
+import json
+import time
+import uuid
+import signal
+import logging
+import threading
+
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+from locking import write_atomic
+
+
+logger = logging.getLogger()
+
+QUEUE_STATES = ("pending", "running", "done", "failed")
+
+
+def spool_path(config, state, job_file=""):
+    return os.path.join(config["daemon"]["spool_dir"], state, job_file)
+
+
+def write_job(path, job):
+    write_atomic(path, json.dumps(job))
+
+
+def enqueue_job(config, folder_path, category, name=None, force_compress=False, release_date=None, igdb_id=None):
+    """
+    Drop a job into the spool's pending directory and return immediately.
+    Job files are named by submission time, so the daemon processes them in order.
+    """
+    os.makedirs(spool_path(config, "pending"), exist_ok=True)
+    job_file = f"{time.time_ns()}-{uuid.uuid4().hex[:8]}.json"
+    job = {
+        "input": os.path.abspath(folder_path),
+        "category": category,
+        "name": name,
+        "force_compress": force_compress,
+        "release_date": release_date,
+        "igdb_id": igdb_id,
+        "submitted_at": time.time(),
+    }
+    write_job(spool_path(config, "pending", job_file), job)
+    logger.info(f"Queued {folder_path} as job {job_file}")
+    if not daemon_running(config):
+        logger.warning("GameZip daemon is not running, the job will start once it does")
+    return job_file
+
+
+def daemon_running(config):
+    try:
+        with open(config["daemon"]["pid_file"]) as f:
+            pid = int(f.read().strip())
+        os.kill(pid, 0)
+        return True
+    except (OSError, ValueError):
+        return False
+
+
+class Scheduler:
+    """
+    Global CPU budget shared by every job the daemon runs.
+    At most max_compressions archives are built at once, and each gets an equal share of the thread budget,
+    so the sum of every -mmt value never exceeds thread_budget.
+    """
+
+    def __init__(self, config):
+        daemon_config = config["daemon"]
+        self.thread_budget = daemon_config["thread_budget"]
+        self.max_compressions = daemon_config["max_compressions"]
+        self._compressions = threading.Semaphore(self.max_compressions)
+
+    def threads_per_compression(self, config):
+        share = max(1, self.thread_budget // self.max_compressions)
+        requested = int(config["multithread"] or share)
+        return min(requested, share)
+
+    @contextmanager
+    def compression_slot(self, config):
+        waited = time.monotonic()
+        with self._compressions:
+            waited = time.monotonic() - waited
+            if waited > 1:
+                logger.info(f"Waited {waited:.0f}s for a free compression slot")
+            config["multithread"] = self.threads_per_compression(config)
+            logger.debug(f"Compression slot acquired with {config['multithread']} threads")
+            yield
+
+
+def recover_jobs(config):
+    """Jobs left in running/ by a crash or restart go back to the front of the queue."""
+    for job_file in os.listdir(spool_path(config, "running")):
+        if job_file.endswith(".json"):
+            os.replace(spool_path(config, "running", job_file), spool_path(config, "pending", job_file))
+            logger.warning(f"Recovered interrupted job {job_file}")
+
+
+def claim_next_job(config):
+    """Move the oldest pending job to running/. Returns its file name, or None if the queue is empty."""
+    pending = sorted(f for f in os.listdir(spool_path(config, "pending")) if f.endswith(".json"))
+    for job_file in pending:
+        try:
+            os.replace(spool_path(config, "pending", job_file), spool_path(config, "running", job_file))
+        except FileNotFoundError:
+            continue
+        return job_file
+    return None
+
+
+def finish_job(config, job_file, job, state, error=None):
+    job["finished_at"] = time.time()
+    if error:
+        job["error"] = error
+    write_job(spool_path(config, state, job_file), job)
+    os.remove(spool_path(config, "running", job_file))
+
+
+def serve(config, run_job):
+    """
+    Run the resident GameZip daemon.
+    Jobs are taken from the spool directory and handed to run_job(job, config, compression_slot),
+    which returns the final state of the job ("done" or "skipped").
+    """
+    daemon_config = config["daemon"]
+    for state in QUEUE_STATES:
+        os.makedirs(spool_path(config, state), exist_ok=True)
+    if daemon_running(config):
+        raise SystemExit("GameZip daemon is already running")
+    with open(daemon_config["pid_file"], "w") as f:
+        f.write(str(os.getpid()))
+
+    recover_jobs(config)
+    scheduler = Scheduler(config)
+    workers = threading.Semaphore(daemon_config["max_jobs"])
+    stop = threading.Event()
+
+    def handle_signal(signum, frame):
+        logger.info(f"Received signal {signum}, finishing running jobs before exiting")
+        stop.set()
+
+    signal.signal(signal.SIGTERM, handle_signal)
+    signal.signal(signal.SIGINT, handle_signal)
+
+    def worker(job_file):
+        try:
+            with open(spool_path(config, "running", job_file)) as f:
+                job = json.load(f)
+            logger.info(f"Starting job {job_file}: {job['input']}")
+            try:
+                job["result"] = run_job(job, config, scheduler.compression_slot)
+                finish_job(config, job_file, job, "done")
+                logger.info(f"Job {job_file} finished: {job['result']}")
+            except Exception as e:
+                logger.error(f"Job {job_file} failed: {e}")
+                finish_job(config, job_file, job, "failed", str(e))
+        finally:
+            workers.release()
+
+    logger.info(f"GameZip daemon started: {daemon_config['max_jobs']} jobs, {scheduler.max_compressions} "
+                f"compressions, {scheduler.thread_budget} threads")
+    try:
+        with ThreadPoolExecutor(max_workers=daemon_config["max_jobs"]) as executor:
+            while not stop.is_set():
+                if not workers.acquire(timeout=daemon_config["poll_interval"]):
+                    continue
+                job_file = claim_next_job(config)
+                if job_file is None:
+                    workers.release()
+                    stop.wait(daemon_config["poll_interval"])
+                    continue
+                executor.submit(worker, job_file)
+    finally:
+        os.remove(daemon_config["pid_file"])
+        logger.info("GameZip daemon stopped")
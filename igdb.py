@@ -0,0 +1,203 @@
+import os
+import json
+import time
+import random
+import logging
+import requests
+
+from requests.adapters import HTTPAdapter
+from locking import file_lock, write_atomic, acquire_slot
+
+
+logger = logging.getLogger()
+
+# Defaults of IGDB_API_URL and TWITCH_TOKEN_URL, which can point to a local stub for benchmarks
+TOKEN_URL = "https://id.twitch.tv/oauth2/token"
+API_URL = "https://api.igdb.com/v4/"
+
+# Status codes worth retrying: throttled, or a transient failure on IGDB's side
+RETRY_STATUS_CODES = (429, 500, 502, 503, 504)
+
+_session = None
+_token = None
+
+
+def get_session(config):
+    """
+    Return the process-wide requests.Session used for all Twitch/IGDB traffic.
+    Connections are pooled and kept alive, so repeated calls skip the TLS handshake.
+    """
+    global _session
+    if _session is None:
+        pool_size = config["igdb"]["pool_size"]
+        _session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=2, pool_maxsize=pool_size)
+        _session.mount("https://", adapter)
+        _session.mount("http://", adapter)
+    return _session
+
+
+def _timeouts(config):
+    return (config["igdb"]["connect_timeout"], config["igdb"]["read_timeout"])
+
+
+def _read_token_file(token_path):
+    try:
+        with open(token_path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _token_is_fresh(token, config):
+    return token is not None and token["expires_at"] - config["igdb"]["refresh_margin"] > time.time()
+
+
+def get_access_token(config, stale_token=None):
+    """
+    Return a valid Twitch client-credentials token.
+    Tokens are persisted to disk and shared between processes under a file lock; a new one is
+    only minted when the stored token is close to expiry or when stale_token was rejected (401).
+    """
+    global _token
+    if _token_is_fresh(_token, config) and _token["access_token"] != stale_token:
+        return _token["access_token"]
+
+    token_path = config["igdb"]["token_path"]
+    with file_lock(f"{token_path}.lock"):
+        # Another process may have refreshed the token while we were waiting on the lock
+        token = _read_token_file(token_path)
+        if _token_is_fresh(token, config) and token["access_token"] != stale_token:
+            _token = token
+            return token["access_token"]
+
+        logger.debug("Requesting a new Twitch access token")
+        r = get_session(config).post(config["igdb"]["token_url"], params={
+            "client_id": config["igdb"]["client_id"],
+            "client_secret": config["igdb"]["client_secret"],
+            "grant_type": "client_credentials",
+        }, timeout=_timeouts(config))
+        if r.status_code != 200:
+            raise ConnectionError(f"Token request failed with status {r.status_code}")
+        data = r.json()
+        token = {
+            "access_token": data["access_token"],
+            "expires_at": time.time() + data["expires_in"],
+        }
+        write_atomic(token_path, json.dumps(token), mode=0o600)
+        logger.info(f"New Twitch access token stored, expires in {data['expires_in']} seconds")
+        _token = token
+        return token["access_token"]
+
+
+def new_throttle_stats():
+    """Per-job counters for the time spent waiting on the IGDB rate limit."""
+    return {"waits": 0, "retries": 0, "throttle_time": 0.0}
+
+
+def log_throttle_stats(stats):
+    if stats["waits"] or stats["retries"]:
+        logger.info(f"IGDB throttling for this job: {stats['waits']} waits, {stats['retries']} retries, "
+                    f"{stats['throttle_time']:.2f}s total")
+
+
+def wait_for_rate_limit(config, stats):
+    """
+    Take one request from the token bucket shared by every GameZip process.
+    The bucket state lives in a small file under STATE_DIR; callers that find it empty reserve
+    their turn (the token count goes negative) and sleep until it comes.
+    """
+    limits = config["igdb"]["rate_limit"]
+    state_path = limits["state_path"]
+    rate = limits["requests_per_second"]
+    burst = limits["burst"]
+
+    with file_lock(f"{state_path}.lock"):
+        now = time.time()
+        try:
+            with open(state_path) as f:
+                state = json.load(f)
+        except (OSError, ValueError):
+            state = {"tokens": burst, "updated": now}
+        tokens = min(burst, state["tokens"] + (now - state["updated"]) * rate) - 1
+        write_atomic(state_path, json.dumps({"tokens": tokens, "updated": now}))
+
+    wait = -tokens / rate if tokens < 0 else 0
+    if wait > 0:
+        logger.info(f"IGDB rate limit reached, waiting {wait:.2f}s")
+        stats["waits"] += 1
+        stats["throttle_time"] += wait
+        time.sleep(wait)
+
+
+def _backoff_delay(attempt, response, config):
+    """Exponential backoff with full jitter, unless IGDB tells us how long to wait."""
+    limits = config["igdb"]["rate_limit"]
+    retry_after = response.headers.get("Retry-After") if response is not None else None
+    if retry_after:
+        try:
+            return float(retry_after) + random.uniform(0, limits["backoff_base"])
+        except ValueError:
+            pass
+    return random.uniform(0, min(limits["backoff_max"], limits["backoff_base"] * 2 ** attempt))
+
+
+def _send(session, endpoint, headers, body, config, stats):
+    """
+    Send one request through the shared rate limiter and in-flight slots,
+    retrying throttled and transient failures.
+    """
+    limits = config["igdb"]["rate_limit"]
+    slot_dir = os.path.join(os.path.dirname(limits["state_path"]), "igdb_inflight")
+    for attempt in range(limits["max_retries"] + 1):
+        wait_for_rate_limit(config, stats)
+        res = None
+        try:
+            with acquire_slot(slot_dir, limits["max_inflight"]) as slot_wait:
+                if slot_wait:
+                    logger.info(f"Waited {slot_wait:.2f}s for a free IGDB request slot")
+                    stats["waits"] += 1
+                    stats["throttle_time"] += slot_wait
+                res = session.post(f"{config['igdb']['api_url']}{endpoint}", headers=headers, data=body, timeout=_timeouts(config))
+            if res.status_code not in RETRY_STATUS_CODES:
+                return res
+            reason = f"status {res.status_code}"
+        except (requests.ConnectionError, requests.Timeout) as e:
+            reason = str(e)
+
+        if attempt == limits["max_retries"]:
+            break
+        delay = _backoff_delay(attempt, res, config)
+        stats["retries"] += 1
+        stats["throttle_time"] += delay
+        logger.warning(f"IGDB request failed ({reason}), retrying in {delay:.2f}s "
+                       f"(attempt {attempt + 1}/{limits['max_retries']})")
+        time.sleep(delay)
+
+    if res is None:
+        raise ConnectionError(f"IGDB request failed after {limits['max_retries']} retries: {reason}")
+    return res
+
+
+def igdb_post(endpoint, body, config, stats=None):
+    """
+    Send an APICalypse query to an IGDB v4 endpoint and return the decoded JSON.
+    A 401 means the token was revoked or expired early, so it is refreshed and the request retried once.
+    """
+    if stats is None:
+        stats = new_throttle_stats()
+    session = get_session(config)
+    access_token = get_access_token(config)
+    for attempt in range(2):
+        headers = {
+            'Client-ID': config["igdb"]["client_id"],
+            'Authorization': f'Bearer {access_token}',
+            'Accept': 'application/json'
+        }
+        res = _send(session, endpoint, headers, body, config, stats)
+        if res.status_code == 401 and attempt == 0:
+            logger.warning("IGDB rejected the access token, refreshing it")
+            access_token = get_access_token(config, stale_token=access_token)
+            continue
+        res.raise_for_status()
+        return res.json()
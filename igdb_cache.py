@@ -0,0 +1,113 @@
+import os
+import json
+import sqlite3
+import time
+import logging
+
+
+logger = logging.getLogger()
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS lookups (
+    search_name TEXT PRIMARY KEY,
+    igdb_id INTEGER,
+    name TEXT,
+    first_release_date INTEGER,
+    total_rating_count INTEGER,
+    candidates TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    last_used REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS lookups_last_used ON lookups (last_used);
+'''
+
+
+def open_cache(config):
+    """
+    Open (and create if needed) the IGDB lookup cache database.
+    Returns a sqlite3 connection, or None if the cache is disabled.
+    """
+    cache_config = config["igdb_cache"]
+    if not cache_config["enabled"]:
+        return None
+    return connect(cache_config["path"])
+
+
+def connect(path):
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    # Several torrents may finish at once, so wait on the write lock instead of failing.
+    conn = sqlite3.connect(path, timeout=30)
+    conn.executescript(SCHEMA)
+    return conn
+
+
+def get_cached_lookup(conn, search_name, config):
+    """
+    Look up a scrubbed folder name in the cache.
+    Returns the list of cached IGDB candidates (empty for a cached negative result),
+    or None on a miss or an expired entry.
+    """
+    if conn is None:
+        return None
+    cache_config = config["igdb_cache"]
+    row = conn.execute(
+        "SELECT name, candidates, created_at FROM lookups WHERE search_name = ?",
+        (search_name,)).fetchone()
+    if row is None:
+        logger.debug(f"IGDB cache miss for '{search_name}'")
+        return None
+
+    name, candidates, created_at = row
+    ttl = cache_config["ttl"] if name is not None else cache_config["negative_ttl"]
+    if time.time() - created_at > ttl:
+        logger.debug(f"IGDB cache entry for '{search_name}' expired")
+        with conn:
+            conn.execute("DELETE FROM lookups WHERE search_name = ?", (search_name,))
+        return None
+
+    with conn:
+        conn.execute("UPDATE lookups SET last_used = ? WHERE search_name = ?", (time.time(), search_name))
+    logger.info(f"IGDB cache hit for '{search_name}': {name if name is not None else 'no results'}")
+    return json.loads(candidates)
+
+
+def store_lookup(conn, search_name, games, best_match, config):
+    """
+    Store the candidates returned by IGDB together with the chosen match.
+    An empty candidate list is stored as a negative result.
+    """
+    if conn is None:
+        return
+    best_match = best_match or {}
+    now = time.time()
+    with conn:
+        conn.execute(
+            "INSERT OR REPLACE INTO lookups VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            (search_name, best_match.get("id"), best_match.get("name"),
+             best_match.get("first_release_date"), best_match.get("total_rating_count"),
+             json.dumps(games), now, now))
+        evict_entries(conn, config["igdb_cache"]["max_entries"])
+
+
+def evict_entries(conn, max_entries):
+    """Drop the least recently used entries until the cache fits in max_entries."""
+    count = conn.execute("SELECT COUNT(*) FROM lookups").fetchone()[0]
+    if count <= max_entries:
+        return
+    conn.execute(
+        "DELETE FROM lookups WHERE search_name IN "
+        "(SELECT search_name FROM lookups ORDER BY last_used ASC LIMIT ?)",
+        (count - max_entries,))
+    logger.debug(f"Evicted {count - max_entries} entries from the IGDB cache")
+
+
+def purge_cache(config):
+    """Delete every entry in the lookup cache."""
+    path = config["igdb_cache"]["path"]
+    if not os.path.exists(path):
+        return
+    conn = connect(path)
+    with conn:
+        deleted = conn.execute("DELETE FROM lookups").rowcount
+    conn.close()
+    logger.info(f"Purged {deleted} entries from the IGDB cache")
@@ -0,0 +1,423 @@
+import os
+import hmac
+import json
+import time
+import uuid
+import signal
+import ipaddress
+import logging
+import threading
+import urllib.error
+import urllib.request
+
+from http import HTTPStatus
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from daemon import QUEUE_STATES, Scheduler, write_job
+
+
+logger = logging.getLogger()
+
+# Seconds between retries when the job server can't be reached to report a finished job
+FINISH_RETRY_INTERVAL = 30
+
+
+def parse_path_map(text):
+    """
+    Parse "server_prefix=worker_prefix" pairs separated by commas, e.g. "/share/torrents=/mnt/nas/torrents",
+    for hosts that mount the same storage at different paths. Longest prefixes are tried first.
+    """
+    pairs = []
+    for pair in filter(None, (pair.strip() for pair in text.split(","))):
+        server_prefix, _, worker_prefix = pair.partition("=")
+        pairs.append((server_prefix.rstrip("/"), worker_prefix.rstrip("/")))
+    return sorted(pairs, key=lambda pair: len(pair[0]), reverse=True)
+
+
+def map_path(path, path_map, reverse=False):
+    """Translate a path from the server's view to the worker's (or back with reverse)."""
+    for server_prefix, worker_prefix in path_map:
+        source, target = (worker_prefix, server_prefix) if reverse else (server_prefix, worker_prefix)
+        if path == source or path.startswith(source + "/"):
+            return target + path[len(source):]
+    return path
+
+
+class JobQueue:
+    """
+    The job server's queue: one JSON file per job in pending/, running/, done/ and failed/, like the daemon's spool.
+    A running job is leased to a worker, which has to report progress before the lease ends.
+    Jobs whose worker went silent go back to pending, also across server restarts.
+    """
+
+    def __init__(self, config):
+        self.spool_dir = config["job_server"]["spool_dir"]
+        self.lease = config["job_server"]["lease"]
+        self.lock = threading.Lock()
+        for state in QUEUE_STATES:
+            os.makedirs(os.path.join(self.spool_dir, state), exist_ok=True)
+
+    def path(self, state, job_id):
+        return os.path.join(self.spool_dir, state, f"{job_id}.json")
+
+    def find(self, job_id):
+        """Return (state, job) of a job, or (None, None) if there is no such job."""
+        for state in QUEUE_STATES:
+            try:
+                with open(self.path(state, job_id)) as f:
+                    return state, json.load(f)
+            except FileNotFoundError:
+                continue
+        return None, None
+
+    def submit(self, job):
+        """Queue a job, named by submission time so jobs are handed out in order."""
+        job_id = f"{time.time_ns()}-{uuid.uuid4().hex[:8]}"
+        job = {
+            "input": job["input"],
+            "category": job.get("category"),
+            "name": job.get("name"),
+            "force_compress": bool(job.get("force_compress")),
+            "submitted_at": time.time(),
+        }
+        with self.lock:
+            write_job(self.path("pending", job_id), job)
+        logger.info(f"Queued {job['input']} as job {job_id}")
+        return job_id
+
+    def claim(self, worker):
+        """Lease the oldest pending job to worker. Returns (job_id, job), or (None, None) if the queue is empty."""
+        with self.lock:
+            self.expire_leases()
+            pending = sorted(f for f in os.listdir(os.path.join(self.spool_dir, "pending")) if f.endswith(".json"))
+            for job_file in pending:
+                job_id = job_file[:-len(".json")]
+                try:
+                    os.replace(self.path("pending", job_id), self.path("running", job_id))
+                except FileNotFoundError:
+                    continue
+                with open(self.path("running", job_id)) as f:
+                    job = json.load(f)
+                job.update(worker=worker, started_at=time.time(), lease_until=time.time() + self.lease, progress=None)
+                write_job(self.path("running", job_id), job)
+                logger.info(f"Job {job_id} leased to {worker}: {job['input']}")
+                return job_id, job
+        return None, None
+
+    def progress(self, job_id, worker, event, details):
+        """Record a worker's progress and renew its lease. Returns False if the job isn't leased to it anymore."""
+        with self.lock:
+            job = self._leased_job(job_id, worker)
+            if job is None:
+                return False
+            job["lease_until"] = time.time() + self.lease
+            if event:
+                job["progress"] = {"event": event, "at": time.time(), **details}
+            write_job(self.path("running", job_id), job)
+            return True
+
+    def finish(self, job_id, worker, state, details):
+        with self.lock:
+            job = self._leased_job(job_id, worker)
+            if job is None:
+                return False
+            job.update(details)
+            job["finished_at"] = time.time()
+            job.pop("lease_until", None)
+            write_job(self.path(state, job_id), job)
+            os.remove(self.path("running", job_id))
+        logger.info(f"Job {job_id} {state} on {worker}: {details.get('result') or details.get('error')}")
+        return True
+
+    def _leased_job(self, job_id, worker):
+        try:
+            with open(self.path("running", job_id)) as f:
+                job = json.load(f)
+        except FileNotFoundError:
+            return None
+        return job if job.get("worker") == worker else None
+
+    def expire_leases(self):
+        now = time.time()
+        for job_file in os.listdir(os.path.join(self.spool_dir, "running")):
+            job_id = job_file[:-len(".json")]
+            try:
+                with open(self.path("running", job_id)) as f:
+                    job = json.load(f)
+            except (FileNotFoundError, ValueError):
+                continue
+            if job.get("lease_until", 0) > now:
+                continue
+            logger.warning(f"Worker {job.get('worker')} went silent, job {job_id} goes back to the queue")
+            job["attempts"] = job.get("attempts", 0) + 1
+            for key in ("worker", "lease_until", "started_at"):
+                job.pop(key, None)
+            write_job(self.path("pending", job_id), job)
+            os.remove(self.path("running", job_id))
+
+    def summary(self):
+        return {state: len(os.listdir(os.path.join(self.spool_dir, state))) for state in QUEUE_STATES}
+
+
+class JobRequestHandler(BaseHTTPRequestHandler):
+    """
+    POST /jobs                 submit {"input", "category", "name", "force_compress"}, returns {"id"}
+    GET  /jobs                 number of jobs in each state
+    GET  /jobs/<id>            a job's state, progress, result and archive
+    POST /claim                lease the next job to {"worker"}, 204 when there is none
+    POST /jobs/<id>/progress   {"worker", "event", ...} renews the lease, 409 once the job was taken back
+    POST /jobs/<id>/finish     {"worker", "state": "done" or "failed", "result", "archive", "error"}
+    """
+    server_version = "GameZip"
+
+    def do_GET(self):
+        if not self.authorized():
+            return
+        parts = self.path.strip("/").split("/")
+        if parts == ["jobs"]:
+            return self.reply(HTTPStatus.OK, self.server.queue.summary())
+        if len(parts) == 2 and parts[0] == "jobs":
+            state, job = self.server.queue.find(parts[1])
+            if job is None:
+                return self.reply(HTTPStatus.NOT_FOUND, {"error": "no such job"})
+            return self.reply(HTTPStatus.OK, {"id": parts[1], "state": state, **job})
+        self.reply(HTTPStatus.NOT_FOUND, {"error": "not found"})
+
+    def do_POST(self):
+        if not self.authorized():
+            return
+        try:
+            body = json.loads(self.rfile.read(int(self.headers.get("Content-Length") or 0)) or b"{}")
+        except ValueError:
+            return self.reply(HTTPStatus.BAD_REQUEST, {"error": "invalid JSON"})
+        queue = self.server.queue
+        parts = self.path.strip("/").split("/")
+        if parts == ["jobs"]:
+            if not body.get("input"):
+                return self.reply(HTTPStatus.BAD_REQUEST, {"error": "input is required"})
+            return self.reply(HTTPStatus.CREATED, {"id": queue.submit(body)})
+        if parts == ["claim"]:
+            job_id, job = queue.claim(body.get("worker") or self.client_address[0])
+            if job is None:
+                return self.reply(HTTPStatus.NO_CONTENT)
+            return self.reply(HTTPStatus.OK, {"id": job_id, **job})
+        if len(parts) == 3 and parts[0] == "jobs" and parts[2] in ("progress", "finish"):
+            worker = body.pop("worker", None)
+            if parts[2] == "progress":
+                accepted = queue.progress(parts[1], worker, body.pop("event", None), body)
+            elif body.get("state") not in ("done", "failed"):
+                return self.reply(HTTPStatus.BAD_REQUEST, {"error": "state must be done or failed"})
+            else:
+                accepted = queue.finish(parts[1], worker, body.pop("state"), body)
+            if not accepted:
+                return self.reply(HTTPStatus.CONFLICT, {"error": "job is not leased to this worker"})
+            return self.reply(HTTPStatus.OK, {"ok": True})
+        self.reply(HTTPStatus.NOT_FOUND, {"error": "not found"})
+
+    def authorized(self):
+        token = self.server.token
+        header = self.headers.get("Authorization", "")
+        if token and not hmac.compare_digest(header.encode(), f"Bearer {token}".encode()):
+            self.reply(HTTPStatus.UNAUTHORIZED, {"error": "invalid token"})
+            return False
+        return True
+
+    def reply(self, status, body=None):
+        data = json.dumps(body).encode() if body is not None else b""
+        self.send_response(status)
+        if body is not None:
+            self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        logger.debug(f"{self.client_address[0]} {format % args}")
+
+
+class JobServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, config):
+        host, _, port = config["job_server"]["bind"].rpartition(":")
+        super().__init__((host or "0.0.0.0", int(port)), JobRequestHandler)
+        self.queue = JobQueue(config)
+        self.token = config["job_server"]["token"]
+        self.last_sweep = 0
+
+    def service_actions(self):
+        # Called by serve_forever between requests, so silent workers lose their jobs even when nobody claims
+        if time.monotonic() - self.last_sweep > 10:
+            self.last_sweep = time.monotonic()
+            with self.queue.lock:
+                self.queue.expire_leases()
+
+
+def is_loopback(host):
+    """Whether a JOB_SERVER_BIND host only accepts connections from this machine."""
+    if host == "localhost":
+        return True
+    try:
+        return ipaddress.ip_address(host.strip("[]")).is_loopback
+    except ValueError:
+        return False
+
+
+def serve_jobs(config):
+    """
+    Run the job server until SIGTERM or SIGINT.
+    Refuses to start without JOB_SERVER_TOKEN unless it only listens on loopback.
+    """
+    bind = config["job_server"]["bind"]
+    if not config["job_server"]["token"] and not is_loopback(bind.rpartition(":")[0]):
+        logger.error(f"JOB_SERVER_TOKEN is not set, refusing to listen on {bind} where anyone could submit jobs")
+        raise SystemExit(1)
+    server = JobServer(config)
+    host, port = server.server_address[:2]
+    logger.info(f"Job server listening on {host}:{port}, spool in {config['job_server']['spool_dir']}, "
+                f"{config['job_server']['lease']:.0f}s leases")
+
+    def handle_signal(signum, frame):
+        logger.info(f"Received signal {signum}, stopping the job server")
+        threading.Thread(target=server.shutdown).start()
+
+    signal.signal(signal.SIGTERM, handle_signal)
+    signal.signal(signal.SIGINT, handle_signal)
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+        logger.info("Job server stopped")
+
+
+class JobClient:
+    """JSON over HTTP client for the job server."""
+
+    def __init__(self, url, token="", timeout=30):
+        self.url = url.rstrip("/")
+        self.token = token
+        self.timeout = timeout
+
+    def request(self, method, path, body=None):
+        """Returns (status, JSON body or None). Raises urllib.error.URLError if the server can't be reached."""
+        request = urllib.request.Request(f"{self.url}{path}", method=method,
+                                         data=json.dumps(body).encode() if body is not None else None)
+        request.add_header("Content-Type", "application/json")
+        if self.token:
+            request.add_header("Authorization", f"Bearer {self.token}")
+        try:
+            with urllib.request.urlopen(request, timeout=self.timeout) as response:
+                data = response.read()
+                return response.status, json.loads(data) if data else None
+        except urllib.error.HTTPError as e:
+            data = e.read()
+            return e.code, json.loads(data) if data else None
+
+    def submit(self, folder_path, category, name=None, force_compress=False):
+        status, body = self.request("POST", "/jobs", {"input": folder_path, "category": category, "name": name,
+                                                      "force_compress": force_compress})
+        if status != HTTPStatus.CREATED:
+            raise RuntimeError(f"Job server refused the job: {status} {body}")
+        return body["id"]
+
+
+def submit_remote(config, url, folder_path, category, name=None, force_compress=False):
+    """Submit a job to a job server from the machine that downloaded it."""
+    job_id = JobClient(url, config["job_server"]["token"]).submit(os.path.abspath(folder_path), category, name, force_compress)
+    logger.info(f"Submitted {folder_path} to {url} as job {job_id}")
+    return job_id
+
+
+def run_worker(config, url, run_job):
+    """
+    Pull jobs from a job server and run them with run_job(job, config, compression_slot), like the daemon does.
+    Up to WORKER_MAX_JOBS run at once. Progress (each stage as it starts) is reported to the server, which renews
+    the job's lease; a heartbeat renews it during long stages. The result and the archive's location, mapped back
+    to the server's paths, are reported when the job ends.
+    """
+    worker_config = config["worker"]
+    client = JobClient(url, config["job_server"]["token"])
+    name = worker_config["name"]
+    path_map = worker_config["path_map"]
+    scheduler = Scheduler(config)
+    slots = threading.Semaphore(worker_config["max_jobs"])
+    stop = threading.Event()
+
+    def handle_signal(signum, frame):
+        logger.info(f"Received signal {signum}, finishing running jobs before exiting")
+        stop.set()
+
+    signal.signal(signal.SIGTERM, handle_signal)
+    signal.signal(signal.SIGINT, handle_signal)
+
+    def report(job_id, body):
+        try:
+            status, _ = client.request("POST", f"/jobs/{job_id}/progress", {"worker": name, **body})
+            if status == HTTPStatus.CONFLICT:
+                logger.warning(f"Job {job_id} was taken back by the job server, its lease ran out")
+        except (urllib.error.URLError, OSError) as e:
+            logger.warning(f"Failed to report progress of job {job_id}: {e}")
+
+    def finish(job_id, body):
+        # The result must not get lost, keep trying until the server is back
+        while True:
+            try:
+                status, _ = client.request("POST", f"/jobs/{job_id}/finish", {"worker": name, **body})
+                if status == HTTPStatus.CONFLICT:
+                    logger.warning(f"Job {job_id} was taken back by the job server, its result is dropped")
+                return
+            except (urllib.error.URLError, OSError) as e:
+                logger.warning(f"Failed to report the result of job {job_id}, retrying: {e}")
+                time.sleep(FINISH_RETRY_INTERVAL)
+
+    def worker(job_id, job):
+        archive = {}
+        done = threading.Event()
+
+        def progress(event, **details):
+            if event == "archived":
+                archive["path"] = map_path(details["archive"], path_map, reverse=True)
+                details = {"archive": archive["path"]}
+            report(job_id, {"event": event, **details})
+
+        def heartbeat():
+            while not done.wait(worker_config["heartbeat"]):
+                report(job_id, {})
+
+        threading.Thread(target=heartbeat, daemon=True).start()
+        local_job = dict(job, input=map_path(job["input"], path_map))
+        try:
+            logger.info(f"Starting job {job_id}: {local_job['input']}")
+            result = run_job(local_job, {**config, "progress": progress}, scheduler.compression_slot)
+            finish(job_id, {"state": "done", "result": result, "archive": archive.get("path")})
+            logger.info(f"Job {job_id} finished: {result}")
+        except Exception as e:
+            logger.error(f"Job {job_id} failed: {e}")
+            finish(job_id, {"state": "failed", "error": str(e)})
+        finally:
+            done.set()
+            slots.release()
+
+    logger.info(f"Worker {name} pulling jobs from {url}, {worker_config['max_jobs']} at a time")
+    threads = []
+    while not stop.is_set():
+        if not slots.acquire(timeout=worker_config["poll_interval"]):
+            continue
+        try:
+            status, body = client.request("POST", "/claim", {"worker": name})
+        except (urllib.error.URLError, OSError) as e:
+            logger.warning(f"Can't reach the job server at {url}: {e}")
+            status = None
+        if status != HTTPStatus.OK:
+            if status not in (None, HTTPStatus.NO_CONTENT):
+                logger.error(f"Job server refused the claim: {status} {body}")
+            slots.release()
+            stop.wait(worker_config["poll_interval"])
+            continue
+        job_id = body.pop("id")
+        thread = threading.Thread(target=worker, args=(job_id, body), name=f"job-{job_id[-8:]}")
+        thread.start()
+        threads.append(thread)
+        threads = [thread for thread in threads if thread.is_alive()]
+    for thread in threads:
+        thread.join()
+    logger.info(f"Worker {name} stopped")
@@ -0,0 +1,89 @@
+import os
+import json
+import time
+import hashlib
+import logging
+
+from locking import file_lock, write_atomic
+
+
+logger = logging.getLogger()
+
+# Stages of a job, in the order they complete
+STAGES = ("name", "extracted", "staged", "compressed", "verified")
+
+
+def job_key(folder_path):
+    """Stable id of a job, derived from its folder, so a rerun finds what the previous run left behind."""
+    return hashlib.sha1(os.path.abspath(folder_path).encode()).hexdigest()
+
+
+def journal_path(config, folder_path):
+    return os.path.join(config["state_dir"], "journal", f"{job_key(folder_path)}.json")
+
+
+def open_journal(config, folder_path):
+    """
+    Load the journal of a job, kept in the job's config until close_journal.
+    A journal left behind by a job that crashed or failed lets the rerun resume from its last completed stage.
+    """
+    path = journal_path(config, folder_path)
+    try:
+        with open(path) as f:
+            journal = json.load(f)
+    except (OSError, ValueError):
+        journal = {"job": os.path.abspath(folder_path), "stages": {}}
+    journal["path"] = path
+    config["journal"] = journal
+    if journal["stages"]:
+        completed = [name for name in STAGES if name in journal["stages"]]
+        logger.info(f"Resuming {folder_path}, completed stages: {', '.join(completed)}")
+    return journal
+
+
+def completed_stage(config, name):
+    """Return the data recorded for a completed stage of the current job, or None."""
+    journal = config.get("journal")
+    if journal is None:
+        return None
+    return journal["stages"].get(name)
+
+
+def record_stage(config, name, **data):
+    """Mark a stage of the current job as completed, along with what's needed to resume after it."""
+    journal = config.get("journal")
+    if journal is None:
+        return
+    data["completed_at"] = time.time()
+    # The name lookup records its stage from its own thread, the lock keeps both writers in order
+    with file_lock(f"{journal['path']}.lock"):
+        journal["stages"][name] = data
+        os.makedirs(os.path.dirname(journal["path"]), exist_ok=True)
+        write_atomic(journal["path"], json.dumps({"job": journal["job"], "stages": journal["stages"]}))
+    logger.debug(f"Journal of {journal['job']}: {name} completed")
+
+
+def forget_stage(config, name):
+    """Drop a stage whose output turned out to be gone, so it runs again."""
+    journal = config.get("journal")
+    if journal is None or name not in journal["stages"]:
+        return
+    with file_lock(f"{journal['path']}.lock"):
+        del journal["stages"][name]
+        write_atomic(journal["path"], json.dumps({"job": journal["job"], "stages": journal["stages"]}))
+
+
+def close_journal(config, finished):
+    """
+    Stop journaling the current job. The journal is deleted once the job is finished for good,
+    and kept when it failed so the next run resumes it.
+    """
+    journal = config.pop("journal", None)
+    if journal is None or not finished:
+        return
+    for path in (journal["path"], f"{journal['path']}.lock"):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
@@ -0,0 +1,80 @@
+import os
+import fcntl
+import time
+import threading
+
+from contextlib import contextmanager
+
+
+@contextmanager
+def file_lock(lock_path, shared=False):
+    """
+    Hold an flock() on lock_path for the duration of the block.
+    The lock is released by the kernel if the process dies, so a crashed job never leaves it stuck.
+    """
+    os.makedirs(os.path.dirname(lock_path) or ".", exist_ok=True)
+    with open(lock_path, "a") as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_SH if shared else fcntl.LOCK_EX)
+        try:
+            yield lock_file
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def write_atomic(path, data, mode=0o644):
+    """Write data to path through a temporary file and rename, so readers never see a partial file."""
+    tmp_path = f"{path}.tmp{os.getpid()}.{threading.get_ident()}"
+    try:
+        # Left behind by a crashed process with the same pid
+        os.remove(tmp_path)
+    except FileNotFoundError:
+        pass
+    # Created with its final permissions, a secret (like the Twitch token) is never readable by others, even briefly
+    fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, mode)
+    with os.fdopen(fd, "w") as f:
+        # The umask may have taken bits off mode, it never adds any
+        os.fchmod(fd, mode)
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+def fsync_path(path):
+    """Flush a file and the directory entry pointing to it to disk."""
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+    dir_fd = os.open(os.path.dirname(os.path.abspath(path)), os.O_RDONLY)
+    try:
+        os.fsync(dir_fd)
+    finally:
+        os.close(dir_fd)
+
+
+@contextmanager
+def acquire_slot(slot_dir, count, poll_interval=0.05):
+    """
+    Hold one of `count` slot locks in slot_dir, waiting until one is free.
+    Yields the number of seconds spent waiting for a slot.
+    """
+    os.makedirs(slot_dir, exist_ok=True)
+    waited = 0.0
+    while True:
+        for i in range(count):
+            slot_file = open(os.path.join(slot_dir, f"slot.{i}"), "a")
+            try:
+                fcntl.flock(slot_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                slot_file.close()
+                continue
+            try:
+                yield waited
+            finally:
+                fcntl.flock(slot_file, fcntl.LOCK_UN)
+                slot_file.close()
+            return
+        time.sleep(poll_interval)
+        waited += poll_interval
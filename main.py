@@ -1,22 +1,69 @@
 import os
 import argparse
-import requests
 import re
 import subprocess
 import logging
-import json
 import datetime
 import rarfile
 import uuid 
 import shutil
 import time
+import copy
+import socket
+import sqlite3
 
+from contextlib import nullcontext
+from concurrent.futures import Future, ThreadPoolExecutor
 from shutil import which
 from dotenv import load_dotenv
+from igdb import igdb_post, new_throttle_stats, log_throttle_stats, API_URL, TOKEN_URL
+from igdb_cache import open_cache, get_cached_lookup, store_lookup, purge_cache
+from daemon import enqueue_job, serve
+from watcher import watch
+from jobserver import serve_jobs, run_worker, submit_remote, parse_path_map
+from title_index import open_index, lookup, build_index, update_index
+from staging import stage_tree, stage_file, new_staging_stats, log_staging_stats, format_size
+from passwords import (release_tag, archive_fingerprint, load_password_store, record_password,
+                       order_passwords, test_password, test_passwords_parallel)
+from compression_profile import analyze_folder, build_7z_commands
+from metrics import start_job_metrics, stage, finish_job_metrics, average_throughput, report_progress
+from sevenzip import run_7z, read_listing
+from journal import job_key, open_journal, completed_stage, record_stage, forget_stage, close_journal
+from locking import fsync_path, write_atomic
+from checksums import TreeChecksums, compare_checksums, format_sfv
+from catalog import open_catalog, fingerprint_tree, find_duplicate, record_archive, rebuild_catalog, layout_hash
+from backends import (BACKENDS, get_backend, select_backend, listing_manifest, parse_backend_spec, parse_backend_rules,
+                      parse_size)
+from volumes import index_volume_sets, describe_problems, is_extractable, classify_volume
+from scratch import (estimate_extracted_size, estimate_folder_size, reserve_space, release_space,
+                     cleanup_scratch_extract)
+
+
+# IGDB accepts at most 10 queries in a single multiquery request
+MULTIQUERY_LIMIT = 10
+
+# A single archive counts as the game itself when it holds this share of its folder (the rest being .nfo, .sfv...)
+PACKED_INPUT_SHARE = 0.9
+
+# Archive types the fast path stores as they are, under "{game} ({year}).{type}"
+PACKED_INPUT_TYPES = ("7z", "zip")
+
+# Compression methods that leave a lot on the table compared to LZMA2
+WEAK_METHODS = ("Copy", "Store", "Deflate", "Deflate64")
+
+# Title index candidates this close to the best similarity are all handed to find_best_match
+SIMILARITY_MARGIN = 0.1
+
+# unrar's exit code for a wrong password
+UNRAR_BAD_PASSWORD = 11
+
+# Failures of the local lookup cache and title index (locked, corrupt or unwritable database), IGDB's API is used instead
+LOCAL_LOOKUP_ERRORS = (sqlite3.Error, OSError, ValueError)
 
 
 def load_config():
     load_dotenv()
+    state_dir = os.path.expanduser(os.getenv("STATE_DIR", "~/.cache/gamezip"))
     config = {
         "category_name": os.getenv("categoryName"),
         "logFileLocation": os.getenv("logFileLocation"),
@@ -25,11 +72,148 @@ def load_config():
         "storeFolder": os.getenv("storeFolder"),
         "igdb": {
             "client_id": os.getenv("client_id"),
-            "client_secret": os.getenv("client_secret")
+            "client_secret": os.getenv("client_secret"),
+            "token_path": os.path.join(state_dir, "twitch_token.json"),
+            # Point these to benchmarks/igdb_stub.py to run without the real API
+            "api_url": os.getenv("IGDB_API_URL", API_URL).rstrip("/") + "/",
+            "token_url": os.getenv("TWITCH_TOKEN_URL", TOKEN_URL),
+            # Refresh the access token this many seconds before it expires
+            "refresh_margin": int(os.getenv("IGDB_TOKEN_REFRESH_MARGIN", "300")),
+            "connect_timeout": float(os.getenv("IGDB_CONNECT_TIMEOUT", "5")),
+            "read_timeout": float(os.getenv("IGDB_READ_TIMEOUT", "20")),
+            "pool_size": int(os.getenv("IGDB_POOL_SIZE", "4")),
+            # Shared by every GameZip process, IGDB allows about 4 requests per second
+            "rate_limit": {
+                "state_path": os.path.join(state_dir, "igdb_ratelimit.json"),
+                "requests_per_second": float(os.getenv("IGDB_REQUESTS_PER_SECOND", "4")),
+                "burst": float(os.getenv("IGDB_BURST", "4")),
+                "max_inflight": int(os.getenv("IGDB_MAX_INFLIGHT", "4")),
+                "max_retries": int(os.getenv("IGDB_MAX_RETRIES", "5")),
+                "backoff_base": float(os.getenv("IGDB_BACKOFF_BASE", "1")),
+                "backoff_max": float(os.getenv("IGDB_BACKOFF_MAX", "60")),
+            },
         },
         "compressionCMD": "7zz" if which("7z") is None else "7z",
         "password_list": os.getenv("password_list", "").split(","),
+        # Passwords that worked before, by release group and archive, so they are tried first next time
+        "password_store": os.path.join(state_dir, "rar_passwords.json"),
+        "password_workers": int(os.getenv("PASSWORD_WORKERS", "4")),
+        "state_dir": state_dir,
+
+        # IGDB lookup cache, keyed by the scrubbed folder name
+        "igdb_cache": {
+            "enabled": os.getenv("IGDB_CACHE", "true").lower() == "true",
+            "path": os.path.join(state_dir, "igdb_cache.sqlite"),
+            "ttl": int(os.getenv("IGDB_CACHE_TTL_DAYS", "30")) * 86400,
+            "negative_ttl": int(os.getenv("IGDB_CACHE_NEGATIVE_TTL_HOURS", "24")) * 3600,
+            "max_entries": int(os.getenv("IGDB_CACHE_MAX_ENTRIES", "5000")),
+        },
         
+        # Offline IGDB title index, the API is only used when it has no good match
+        "title_index": {
+            "enabled": os.getenv("TITLE_INDEX", "false").lower() == "true",
+            "path": os.path.expanduser(os.getenv("TITLE_INDEX_PATH", os.path.join(state_dir, "title_index.sqlite"))),
+            "min_similarity": float(os.getenv("TITLE_INDEX_MIN_SIMILARITY", "0.6")),
+        },
+
+        # Resident daemon mode, jobs are queued in a spool directory
+        "daemon": {
+            "enabled": os.getenv("ENABLE_DAEMON", "false").lower() == "true",
+            "spool_dir": os.path.join(state_dir, "spool"),
+            "pid_file": os.path.join(state_dir, "daemon.pid"),
+            "max_jobs": int(os.getenv("DAEMON_MAX_JOBS", "2")),
+            "max_compressions": int(os.getenv("DAEMON_MAX_COMPRESSIONS", "1")),
+            "thread_budget": int(os.getenv("DAEMON_THREAD_BUDGET", str(os.cpu_count() or 1))),
+            "poll_interval": float(os.getenv("DAEMON_POLL_INTERVAL", "2")),
+        },
+
+        # Job server the downloading machine submits to, and workers on compute hosts pull from
+        "job_server": {
+            "bind": os.getenv("JOB_SERVER_BIND", "127.0.0.1:8765"),
+            # Shared secret, sent by the NAS and the workers as a bearer token
+            "token": os.getenv("JOB_SERVER_TOKEN", ""),
+            "spool_dir": os.path.join(state_dir, "jobs"),
+            # A running job goes back to the queue when its worker reports nothing for this long
+            "lease": float(os.getenv("JOB_LEASE_SECONDS", "300")),
+        },
+        "worker": {
+            "name": os.getenv("WORKER_NAME") or socket.gethostname(),
+            "max_jobs": int(os.getenv("WORKER_MAX_JOBS", "1")),
+            "poll_interval": float(os.getenv("WORKER_POLL_INTERVAL", "5")),
+            "heartbeat": float(os.getenv("WORKER_HEARTBEAT_SECONDS", "30")),
+            # "server_prefix=worker_prefix" pairs, for storage mounted at different paths on the worker
+            "path_map": parse_path_map(os.getenv("WORKER_PATH_MAP", "")),
+        },
+
+        # --watch mode: folders dropped in the watched directory are processed once they stop changing
+        "watch": {
+            "settle": float(os.getenv("WATCH_SETTLE_SECONDS", "60")),
+            "poll_interval": float(os.getenv("WATCH_POLL_INTERVAL", "10")),
+            "max_jobs": int(os.getenv("WATCH_MAX_JOBS", "1")),
+            "use_inotify": os.getenv("WATCH_INOTIFY", "true").lower() == "true",
+            "state_path": os.path.join(state_dir, "watch_state.json"),
+        },
+
+        # Scratch volumes (SSD, tmpfs...) for extraction and in-progress archives, and free space admission control
+        "scratch": {
+            "dirs": [d for d in os.getenv("SCRATCH_DIRS", "").split(",") if d],
+            "headroom": float(os.getenv("SPACE_HEADROOM", "0.1")),
+            "admission_timeout": int(os.getenv("ADMISSION_TIMEOUT", "3600")),
+            "admission_poll": int(os.getenv("ADMISSION_POLL_INTERVAL", "30")),
+            "reservations_path": os.path.join(state_dir, "space_reservations.json"),
+        },
+
+        # Store already packed files and size LZMA2 for the job, based on a quick compressibility probe
+        "adaptive_compression": {
+            "enabled": os.getenv("ADAPTIVE_COMPRESSION", "false").lower() == "true",
+            "probe_min_size": int(os.getenv("PROBE_MIN_SIZE_MB", "16")) * 1024 * 1024,
+            "sample_size": int(os.getenv("PROBE_SAMPLE_SIZE_MB", "1")) * 1024 * 1024,
+            "samples": int(os.getenv("PROBE_SAMPLES", "4")),
+            "store_threshold": float(os.getenv("PROBE_STORE_THRESHOLD", "0.95")),
+            "ram_fraction": float(os.getenv("COMPRESSION_RAM_FRACTION", "0.5")),
+        },
+
+        # Per-stage job metrics, as JSON lines and optionally as a Prometheus textfile
+        "metrics": {
+            "file": os.path.expanduser(os.getenv("METRICS_FILE", os.path.join(state_dir, "metrics.jsonl"))),
+            "prometheus_textfile": os.path.expanduser(os.getenv("PROMETHEUS_TEXTFILE", "")),
+            "prometheus_state": os.path.join(state_dir, "prometheus_totals.json"),
+        },
+
+        # Catalog of the archives in storeFolder, new jobs are checked against it for duplicates
+        "catalog": {
+            "enabled": os.getenv("CATALOG", "true").lower() == "true",
+            "path": os.path.expanduser(os.getenv("CATALOG_PATH") or os.path.join(os.getenv("storeFolder", ""), ".gamezip_catalog.sqlite")),
+            "dedupe": os.getenv("CATALOG_DEDUPE", "true").lower() == "true",
+            "sample_size": int(os.getenv("FINGERPRINT_SAMPLE_KB", "64")) * 1024,
+        },
+
+        # Inputs that already are a single 7z or zip archive are stored as-is instead of being recompressed
+        "packed_inputs": {
+            "enabled": os.getenv("PACKED_INPUT_FAST_PATH", "true").lower() == "true",
+            # never, weak (only Store/Deflate archives) or always
+            "repack": os.getenv("PACKED_INPUT_REPACK", "never").lower(),
+            "keep_source": os.getenv("PACKED_INPUT_KEEP_SOURCE", "true").lower() == "true",
+        },
+
+        # Test every archive (with "7z t", or by reading the tar stream back) before it gets its final name in storeFolder
+        "verify_archives": os.getenv("VERIFY_ARCHIVES", "true").lower() == "true",
+        # Threads computing the CRC32 of the source files while they are compressed, checked against the archive
+        "checksum_workers": int(os.getenv("CHECKSUM_WORKERS", "4")),
+        # Write "{archive}.sfv" with the CRC32 of every archived file next to each archive
+        "checksum_sidecar": os.getenv("CHECKSUM_SIDECAR", "true").lower() == "true",
+
+        # Output format of the archives: 7z, zstd (tar+zstd) or xz (tar+xz), with an optional level like "zstd:19"
+        "output": {
+            "default": parse_backend_spec(os.getenv("OUTPUT_BACKEND", "7z")),
+            # "category=backend[:level]" pairs, e.g. "GamesArchive=zstd:19,Games=7z"
+            "by_category": parse_backend_rules(os.getenv("OUTPUT_BACKEND_BY_CATEGORY", "")),
+            # "size=backend[:level]" pairs, the largest size a source reaches wins over its category, e.g. "50G=zstd:12"
+            "by_size": {parse_size(size): rule for size, rule in parse_backend_rules(os.getenv("OUTPUT_BACKEND_BY_SIZE", "")).items()},
+            # zstd long distance matching window, as a power of 2 (27 = 128 MB)
+            "zstd_long": int(os.getenv("ZSTD_LONG_WINDOW", "27")),
+        },
+
         # Popularity filter settings - only check how many ratings/reviews a game has
         "enable_popularity_filter": os.getenv("ENABLE_POPULARITY_FILTER", "false").lower() == "true",
         "skip_unknown_games": os.getenv("SKIP_UNKNOWN_GAMES", "false").lower() == "true",
@@ -62,76 +246,77 @@ def fix_filename(file):
     return file
 
 
+def calculate_match_score(game_name, search_name):
+    """Calculate how well a game name matches the search term"""
+    game_lower = game_name.lower()
+    search_lower = search_name.lower()
+    
+    # Exact match gets highest score
+    if game_lower == search_lower:
+        return 1000
+    
+    # Game name starts with search term and is not much longer
+    if game_lower.startswith(search_lower):
+        length_ratio = len(search_lower) / len(game_lower)
+        if length_ratio > 0.8:  # Game name is not much longer than search term
+            return 900
+        elif length_ratio > 0.6:
+            return 800
+        else:
+            return 400  # Much longer, less relevant
+    
+    # Search term starts with game name - be more strict here
+    if search_lower.startswith(game_lower):
+        length_ratio = len(game_lower) / len(search_lower)
+        # Only give high score if the game name is a significant part
+        if length_ratio > 0.8:  # Game name is almost as long as search term
+            return 850
+        elif length_ratio > 0.6:
+            return 750
+        elif length_ratio > 0.4:  # Still substantial portion
+            return 400
+        else:
+            return 150  # Game name is too short compared to search term
+    
+    # Game name contains search term as whole word
+    if f" {search_lower} " in f" {game_lower} ":
+        return 600
+    
+    # Search term contains game name as whole word - be very strict
+    if f" {game_lower} " in f" {search_lower} ":
+        length_ratio = len(game_lower) / len(search_lower)
+        if length_ratio > 0.5:  # Game name is substantial part of search
+            return 500
+        else:
+            return 200  # Game name is small part of search
+    
+    # Partial matches with length consideration
+    if search_lower in game_lower:
+        length_ratio = len(search_lower) / len(game_lower)
+        if length_ratio > 0.7:  # Search term is a significant part of game name
+            return 300
+        else:
+            return 150  # Search term is a small part of game name
+    
+    # Game name contained in search term - very strict penalties
+    if game_lower in search_lower:
+        length_ratio = len(game_lower) / len(search_lower)
+        if length_ratio > 0.7:  # Game name is a significant part of search term
+            return 250
+        elif length_ratio > 0.4:  # Moderate portion
+            return 150
+        else:
+            return 50  # Game name is a very small part of search term
+    
+    # No match
+    return 0
+
+
 def find_best_match(games, search_name):
     """
     Find the best matching game from a list of games based on name similarity.
     Returns the best matching game or None if no matches found.
     """
-    def calculate_match_score(game_name, search_name):
-        """Calculate how well a game name matches the search term"""
-        game_lower = game_name.lower()
-        search_lower = search_name.lower()
-        
-        # Exact match gets highest score
-        if game_lower == search_lower:
-            return 1000
-        
-        # Game name starts with search term and is not much longer
-        if game_lower.startswith(search_lower):
-            length_ratio = len(search_lower) / len(game_lower)
-            if length_ratio > 0.8:  # Game name is not much longer than search term
-                return 900
-            elif length_ratio > 0.6:
-                return 800
-            else:
-                return 400  # Much longer, less relevant
-        
-        # Search term starts with game name - be more strict here
-        if search_lower.startswith(game_lower):
-            length_ratio = len(game_lower) / len(search_lower)
-            # Only give high score if the game name is a significant part
-            if length_ratio > 0.8:  # Game name is almost as long as search term
-                return 850
-            elif length_ratio > 0.6:
-                return 750
-            elif length_ratio > 0.4:  # Still substantial portion
-                return 400
-            else:
-                return 150  # Game name is too short compared to search term
-        
-        # Game name contains search term as whole word
-        if f" {search_lower} " in f" {game_lower} ":
-            return 600
-        
-        # Search term contains game name as whole word - be very strict
-        if f" {game_lower} " in f" {search_lower} ":
-            length_ratio = len(game_lower) / len(search_lower)
-            if length_ratio > 0.5:  # Game name is substantial part of search
-                return 500
-            else:
-                return 200  # Game name is small part of search
-        
-        # Partial matches with length consideration
-        if search_lower in game_lower:
-            length_ratio = len(search_lower) / len(game_lower)
-            if length_ratio > 0.7:  # Search term is a significant part of game name
-                return 300
-            else:
-                return 150  # Search term is a small part of game name
-        
-        # Game name contained in search term - very strict penalties
-        if game_lower in search_lower:
-            length_ratio = len(game_lower) / len(search_lower)
-            if length_ratio > 0.7:  # Game name is a significant part of search term
-                return 250
-            elif length_ratio > 0.4:  # Moderate portion
-                return 150
-            else:
-                return 50  # Game name is a very small part of search term
-        
-        # No match
-        return 0
-    
     best_match = None
     best_score = -1
     
@@ -167,63 +352,124 @@ def find_best_match(games, search_name):
     return best_match
 
 
-def fetch_game_name(folder_path, config):
-    client_id = config["igdb"]['client_id']
-    client_secret = config["igdb"]['client_secret']
-    releaseDate = 2020
-    folder_name = fix_filename(folder_path)
-    folder_name = os.path.basename(folder_name)
-    original_folder_name = folder_name
-    folder_name = scrub_filename(folder_name)
+def build_search_query(folder_name):
+    return f'''search "{folder_name}"; 
+        fields name,first_release_date,alternative_names.name, total_rating_count;                 
+        where game_type = (0, 4) & version_parent = null;
+        limit 10;
+        '''
+
+
+def search_igdb(folder_name, config, stats=None):
+    """
+    Search IGDB's games endpoint for a scrubbed folder name.
+    Returns the raw list of candidate games.
+    """
+    query = build_search_query(folder_name)
+    logger.debug(f"Query used: {query}")
+    games = igdb_post("games", query, config, stats)
+    logger.debug(games)
+    return games
+
+
+def multisearch_igdb(folder_names, config, stats=None):
+    """
+    Search IGDB for up to MULTIQUERY_LIMIT scrubbed folder names in a single multiquery request.
+    Returns a dict of folder name -> raw list of candidate games.
+    """
+    query = "".join(f'query games "{i}" {{ {build_search_query(name)} }};\n' for i, name in enumerate(folder_names))
+    logger.debug(f"Multiquery used: {query}")
+    results = igdb_post("multiquery", query, config, stats)
+    logger.debug(results)
+    return {folder_names[int(result["name"])]: result["result"] for result in results}
+
+
+def search_title_index(folder_name, config):
+    """
+    Look a scrubbed folder name up in the offline title index.
+    Returns the candidates close to the best match, or None when the index is disabled
+    or has nothing similar enough, in which case IGDB's API should be asked instead.
+    """
+    index_config = config["title_index"]
+    if not index_config["enabled"] or not os.path.exists(index_config["path"]):
+        return None
+    conn = open_index(index_config["path"])
+    try:
+        games = lookup(conn, folder_name, score_function=calculate_match_score)
+    finally:
+        conn.close()
+    if not games or games[0]["similarity"] < index_config["min_similarity"]:
+        logger.info(f"No close match for '{folder_name}' in the title index, falling back to IGDB's API")
+        return None
+    best_similarity = games[0]["similarity"]
+    games = [game for game in games if game["similarity"] >= best_similarity - SIMILARITY_MARGIN]
+    logger.info(f"Title index match for '{folder_name}': {games[0]['name']} (similarity {best_similarity})")
+    logger.debug(f"Title index candidates: {games}")
+    return games
+
+
+def open_lookup_cache(config):
+    """open_cache, or None when the cache can't be opened, names are then looked up without it."""
+    try:
+        return open_cache(config)
+    except LOCAL_LOOKUP_ERRORS as e:
+        logger.warning(f"IGDB lookup cache unavailable, looking names up without it: {e}")
+        return None
+
+
+def local_candidates(cache, folder_name, config):
+    """
+    Candidates from the title index, then the lookup cache, without any network round trip.
+    Returns None when neither has them, or can't be read: IGDB's API should be asked instead.
+    """
+    try:
+        games = search_title_index(folder_name, config)
+    except LOCAL_LOOKUP_ERRORS as e:
+        logger.warning(f"Title index lookup of '{folder_name}' failed, asking IGDB's API: {e}")
+        games = None
+    if games is None:
+        try:
+            games = get_cached_lookup(cache, folder_name, config)
+        except LOCAL_LOOKUP_ERRORS as e:
+            logger.warning(f"IGDB cache lookup of '{folder_name}' failed, asking IGDB's API: {e}")
+    return games
+
+
+def cache_lookup(cache, folder_name, games, best_match, config):
+    try:
+        store_lookup(cache, folder_name, games, best_match, config)
+    except LOCAL_LOOKUP_ERRORS as e:
+        logger.warning(f"Failed to cache the IGDB lookup of '{folder_name}': {e}")
+
+
+def folder_search_name(folder_path):
+    """Returns the folder's original name and the scrubbed name we search IGDB with."""
+    original_folder_name = os.path.basename(fix_filename(folder_path))
+    folder_name = scrub_filename(original_folder_name)
     logger.debug(f"Name obtained from directory's name: {folder_name}")
+    return original_folder_name, folder_name
+
+
+def resolve_game_name(best_match, original_folder_name, config):
+    """
+    Turn the best IGDB match into the archive's name, applying the popularity filter
+    and falling back to the original folder name when there is no match.
+    """
+    releaseDate = 2020
     game = None
-    
-    try:
-        r = requests.post(
-            f"https://id.twitch.tv/oauth2/token?client_id={client_id}&client_secret={client_secret}&grant_type=client_credentials")
-        if r.status_code != 200:
-            raise ConnectionError(f"Token request failed with status {r.status_code}")
-        access_token = json.loads(r.content)['access_token']
-        headers = {
-            'Client-ID': client_id,
-            'Authorization': f'Bearer {access_token}',
-            'Accept': 'application/json'
-        }
-        query = f'''search "{folder_name}"; 
-            fields name,first_release_date,alternative_names.name, total_rating_count;                 
-            where game_type = (0, 4) & version_parent = null;
-            limit 10;
-            '''
-            
-        res = requests.post('https://api.igdb.com/v4/games', headers=headers, data=query)
-        res.raise_for_status()
-        games = res.json()
-        logger.debug(games)
-        
-        
-        best_match = find_best_match(games, folder_name)
-        
-        if best_match:
-            game = best_match['name']
-            releaseDate = best_match['first_release_date'] if 'first_release_date' in best_match else None
-            if releaseDate:
-                releaseDate = datetime.datetime.fromtimestamp(releaseDate).year
-            logger.info(f"Name obtained from IGDB's API: {game} releaseDate={releaseDate} ratings={best_match.get('rating_count', 0)}")
-            is_popular, reason = quality_check(best_match, config)
-            if not is_popular:
-                logger.warning(f"Game '{game}' filtered out: {reason}")
-                raise ValueError(f"Game popularity filter failed: {reason}")
-            logger.info(f"Game '{game}' passed popularity check: {best_match.get('total_rating_count', 0)} ratings")
-
-
-        if not game:
-            logger.warning(f"No results found for game '{folder_name}' in IGDB database")
-    except ValueError:
-        raise
-    except Exception as e:
-        logger.error(f"Error fetching from IGDB API: {str(e)}")
-        logger.error(f"Folder name searched: {folder_name}")
-        logger.debug(f"Query used: {query if 'query' in locals() else 'Query not defined'}")
+    config["igdb_id"] = None
+    if best_match:
+        game = best_match['name']
+        config["igdb_id"] = best_match.get('id')
+        releaseDate = best_match['first_release_date'] if 'first_release_date' in best_match else None
+        if releaseDate:
+            releaseDate = datetime.datetime.fromtimestamp(releaseDate).year
+        logger.info(f"Name obtained from IGDB's API: {game} releaseDate={releaseDate} ratings={best_match.get('rating_count', 0)}")
+        is_popular, reason = quality_check(best_match, config)
+        if not is_popular:
+            logger.warning(f"Game '{game}' filtered out: {reason}")
+            raise ValueError(f"Game popularity filter failed: {reason}")
+        logger.info(f"Game '{game}' passed popularity check: {best_match.get('total_rating_count', 0)} ratings")
 
     # Fallback: use original folder name if API search failed
     if not game:
@@ -242,152 +488,218 @@ def fetch_game_name(folder_path, config):
     return game
 
 
-def find_rar_files(folder_path):
-    """
-    Find all RAR files in the folder, including split volumes.
-    Returns the main RAR file and a list of all related volumes.
-    Handles extended sequences: .rar, .r00-.r99, .s00-.s99, .t00-.t99, etc.
-    """
-    all_files = os.listdir(folder_path)
-    main_rar = None
-    rar_files = []
-    
-    def is_rar_part(filename):
-        return bool(re.match(r'.*\.[r-z]\d{2}$', filename, re.IGNORECASE))
-    
-    def is_part_numbered(filename):
-        return bool(re.match(r'.*\.part\d+\.rar$', filename, re.IGNORECASE))
-    
-    # First, try to find the main RAR file
-    for file in all_files:
-        if is_rar_part(file) or is_part_numbered(file):
-            continue
-            
-        if file.lower().endswith('.rar'):
-            main_rar = os.path.join(folder_path, file)
-            break
-    
-    if not main_rar:
-        # Look for any file with .r00 through .z99 extension
-        r_files = [f for f in all_files if is_rar_part(f)]
-        if r_files:
-            # For this format, the main file should be .rar
-            base_name = re.sub(r'\.[r-z]\d{2}$', '', r_files[0], flags=re.IGNORECASE)
-            potential_main = f"{base_name}.rar"
-            if potential_main in all_files:
-                main_rar = os.path.join(folder_path, potential_main)
-    
-    if not main_rar:
-        part_files = [f for f in all_files if is_part_numbered(f)]
-        if part_files:
-            # Sort part files to ensure the first part is selected as main
-            part_files.sort(key=lambda x: int(re.search(r'\.part(\d+)\.rar$', x).group(1)))
-            main_rar = os.path.join(folder_path, part_files[0])
-
-    if not main_rar:
-        return None, []
-    
-    # Get the base name without extension
-    main_base = re.sub(r'\.rar$', '', os.path.basename(main_rar))
+def fetch_game_name(folder_path, config):
+    original_folder_name, folder_name = folder_search_name(folder_path)
+    best_match = None
+    cache = None
+    throttle_stats = new_throttle_stats()
     
-    # Now collect all related RAR parts
-    for file in all_files:
-        full_path = os.path.join(folder_path, file)
+    try:
+        # The title index or a cache hit gives us the candidate list without any network round trip
+        cache = open_lookup_cache(config)
+        games = local_candidates(cache, folder_name, config)
+        cached = games is not None
+        if not cached:
+            games = search_igdb(folder_name, config, throttle_stats)
         
-        # Skip the main RAR file as we already have it
-        if full_path == main_rar:
-            continue
-            
-        # Check if this file belongs to the same RAR set
-        if is_rar_part(file) or is_part_numbered(file) or file.lower().endswith('.rar'):
-            # Get the base name of this file
-            if is_rar_part(file):
-                file_base = re.sub(r'\.[r-z]\d{2}$', '', file)
-            elif is_part_numbered(file):
-                file_base = re.sub(r'\.part\d+\.rar$', '', file)
-            else:
-                file_base = re.sub(r'\.rar$', '', file)
-                
-            # If the base names match, this is part of our RAR set
-            if file_base.lower() == main_base.lower():
-                rar_files.append(full_path)
-    
-    logger.debug(f"Found main RAR: {main_rar}")
-    logger.debug(f"Found RAR parts: {rar_files}")
-    
-    # Sort the RAR files to ensure proper order
-    def rar_sort_key(path):
-        filename = os.path.basename(path).lower()
-        if '.part' in filename:
-            match = re.search(r'\.part(\d+)\.rar$', filename)
-            return (1, int(match.group(1)) if match else 0)
-        elif re.match(r'.*\.[r-z]\d{2}$', filename):
-            match = re.search(r'\.([r-z])(\d{2})$', filename)
-            if match:
-                letter, number = match.groups()
-                letter_value = (ord(letter.lower()) - ord('r')) * 100
-                return (2, letter_value + int(number))
-        return (0, 0)  # Main .rar file comes first
-    
-    rar_files = sorted(rar_files, key=rar_sort_key)
-    
-    # Add main RAR to the beginning of the list
-    all_rar_files = [main_rar] + rar_files
-    
-    return main_rar, all_rar_files
+        best_match = find_best_match(games, folder_name)
+        if not cached:
+            cache_lookup(cache, folder_name, games, best_match, config)
+
+        if not best_match:
+            logger.warning(f"No results found for game '{folder_name}' in IGDB database")
+    except Exception as e:
+        logger.error(f"Error fetching from IGDB API: {str(e)}")
+        logger.error(f"Folder name searched: {folder_name}")
+    finally:
+        if cache is not None:
+            cache.close()
+        log_throttle_stats(throttle_stats)
+
+    return resolve_game_name(best_match, original_folder_name, config)
 
 
-def try_unlock_rar(rar_file, password_list):
-    for password in password_list:
-        logger.debug(f"Trying password: {password}")
+def fetch_game_names(folder_paths, config):
+    """
+    Resolve the names of many folders at once, sending IGDB multiquery requests
+    with up to MULTIQUERY_LIMIT searches each instead of one request per folder.
+    Returns a list of (folder_path, game_name, job_config) tuples, game_name is None for skipped games.
+    """
+    folders = {folder_path: folder_search_name(folder_path) for folder_path in folder_paths}
+    candidates = {}
+    cache = None
+    throttle_stats = new_throttle_stats()
+
+    try:
+        cache = open_lookup_cache(config)
+        for _, folder_name in folders.values():
+            games = local_candidates(cache, folder_name, config)
+            if games is not None:
+                candidates[folder_name] = games
+
+        misses = [name for name in dict.fromkeys(name for _, name in folders.values()) if name not in candidates]
+        logger.info(f"Resolving {len(misses)} of {len(folders)} names with IGDB multiquery")
+        for i in range(0, len(misses), MULTIQUERY_LIMIT):
+            chunk = misses[i:i + MULTIQUERY_LIMIT]
+            try:
+                results = multisearch_igdb(chunk, config, throttle_stats)
+            except Exception as e:
+                logger.error(f"Error fetching from IGDB API: {str(e)}")
+                logger.error(f"Folder names searched: {chunk}")
+                continue
+            for folder_name, games in results.items():
+                cache_lookup(cache, folder_name, games, find_best_match(games, folder_name), config)
+                candidates[folder_name] = games
+    finally:
+        if cache is not None:
+            cache.close()
+        log_throttle_stats(throttle_stats)
+
+    resolved = []
+    for folder_path, (original_folder_name, folder_name) in folders.items():
+        job_config = copy.deepcopy(config)
+        best_match = find_best_match(candidates.get(folder_name, []), folder_name)
         try:
-            with rarfile.RarFile(rar_file, 'r') as rf:
-                logger.debug(f"Attempting to list contents with password: {password}")
-                rf.setpassword(password)
+            game = resolve_game_name(best_match, original_folder_name, job_config)
+        except ValueError as e:
+            logger.info(f"Game skipped: {folder_path}: {e}")
+            game = None
+        resolved.append((folder_path, game, job_config))
+    return resolved
 
-                if len(rf.namelist()) == 0:
-                    raise rarfile.RarWrongPassword("Wrong password")
-                logger.debug(f"Successfully unlocked RAR with password: {password}")
-                return password
-        except rarfile.BadRarFile:
-            logger.error(f"File {rar_file} is corrupted")  
-            raise
-        except (rarfile.PasswordRequired, rarfile.RarWrongPassword):
-            logger.debug(f"Password {password} is incorrect")
+
+def find_archive_sets(folder_path, include_packed=False):
+    """
+    Find the archive sets to extract in a folder: every RAR set, and 7z or zip archives split into volumes
+    (single 7z and zip archives too with include_packed, when they are repacked).
+    Incomplete sets (missing or short volumes) are refused before starting a long extraction.
+    """
+    volume_sets = [volume_set for volume_set in index_volume_sets(folder_path)
+                   if include_packed or is_extractable(volume_set)]
+    for volume_set in volume_sets:
+        problems = describe_problems(volume_set)
+        if problems:
+            logger.error(f"Archive set {volume_set['base']} in {folder_path} is incomplete: {'; '.join(problems)}")
+            raise ValueError(f"Incomplete {volume_set['kind']} set {volume_set['base']}: {'; '.join(problems)}")
+        logger.debug(f"Found {volume_set['kind']} set {volume_set['main']} with {len(volume_set['volumes'])} volumes")
+    return volume_sets
+
+
+def try_unlock_rar(rar_file, password_list, config=None):
+    """
+    Find the password of rar_file among password_list.
+    Passwords that worked before for this archive or its release group are tried first,
+    and the rest are tested in parallel when a config with password_workers is given.
+    The password is only recorded by remember_password once unrar extracted the archive with it.
+    """
+    store_path = config["password_store"] if config else None
+    store = load_password_store(store_path) if store_path else {"fingerprints": {}, "tags": {}, "global": {}}
+    tag = password_tag(rar_file)
+    fingerprint = archive_fingerprint(rar_file)
+    candidates = order_passwords(password_list, store, tag, fingerprint)
+    logger.debug(f"Password candidates for {rar_file} (release tag {tag}): {candidates}")
+
+    try:
+        # The most likely candidate is tested right away, a process pool isn't worth it when it works
+        password = test_password(rar_file, candidates[0]) if candidates else None
+        if password is None and len(candidates) > 1:
+            workers = config["password_workers"] if config else 1
+            if workers > 1:
+                password = test_passwords_parallel(rar_file, candidates[1:], workers)
+            else:
+                password = next((p for p in candidates[1:] if test_password(rar_file, p) is not None), None)
+    except rarfile.BadRarFile:
+        logger.error(f"File {rar_file} is corrupted")  
+        raise
+
+    if password is None:
+        logger.warning("Failed to unlock RAR with any provided password")
+        return None
+    logger.debug(f"Successfully unlocked RAR with password: {password}")
+    return password
+
+
+def password_tag(rar_file):
+    return release_tag(os.path.basename(os.path.dirname(os.path.abspath(rar_file))))
+
+
+def remember_password(rar_file, password, config):
+    """
+    Record the password that extracted rar_file, so it's tried first for its release group next time.
+    Archives without encrypted headers list their files with any password, only a successful extraction proves it.
+    """
+    record_password(config["password_store"], password, password_tag(rar_file), archive_fingerprint(rar_file))
+
+
+def check_rar_extraction(rar_path, extract_path, password=None):
+    """
+    Compare the files unrar extracted with the names and sizes in the headers of the RAR set.
+    Returns the problems found as readable strings, an empty list when every file is there.
+    """
+    try:
+        with rarfile.RarFile(rar_path, 'r') as rf:
+            if password:
+                rf.setpassword(password)
+            infos = rf.infolist()
+    except (rarfile.Error, OSError) as e:
+        logger.warning(f"Can't read the RAR headers of {rar_path} to check its extraction: {e}")
+        return []
+    problems = []
+    for info in infos:
+        if info.is_dir() or info.is_symlink():
             continue
-            
-    logger.warning("Failed to unlock RAR with any provided password")
-    return None 
+        path = os.path.join(extract_path, *info.filename.split("/"))
+        try:
+            size = os.path.getsize(path)
+        except OSError:
+            problems.append(f"{info.filename} is missing")
+            continue
+        if size != info.file_size:
+            problems.append(f"{info.filename} has {size} bytes instead of {info.file_size}")
+    return problems
 
 
 def extract_rar(rar_path, extract_path, config):
     """
     Extract RAR file to the specified path.
-    Returns True if extraction was successful, False otherwise.
+    unrar checks the CRC of every file, and the extracted files are checked against the RAR headers,
+    so a truncated or corrupted set raises CalledProcessError instead of leaving a partial extraction.
+    Returns True if extraction was successful.
     """
-    command = ['unrar', 'x', '-y']
     password = None
     
     try:
         with rarfile.RarFile(rar_path, 'r') as rf:
-            if rf.needs_password():
-                password = try_unlock_rar(rar_path, config["password_list"])
+            needs_password = rf.needs_password()
+        password_list = list(config["password_list"])
+        while True:
+            command = ['unrar', 'x', '-y']
+            if needs_password:
+                with stage(config, "password_unlock"):
+                    password = try_unlock_rar(rar_path, password_list, config)
                 if not password:
                     raise ValueError(f"Failed to unlock RAR file: {rar_path}")
                 command.extend([f'-p{password}'])
+            command.extend([rar_path, extract_path])
+            result = subprocess.run(command, capture_output=True, text=True, check=False)
+            if not (needs_password and is_wrong_password(result)):
+                break
+            # The password test can be fooled, unrar has the last word: move on to the next candidate
+            logger.warning(f"unrar rejected the password found for {rar_path}, trying the other candidates")
+            password_list = [p for p in password_list if p != password]
         
-        command.extend([rar_path, extract_path])
-        result = subprocess.run(command, capture_output=True, text=True, check=False)
-        
+        # Logged with the errors, without the password
+        shown_command = ['-p***' if part.startswith('-p') else part for part in command]
         if result.returncode != 0:
-            error_msg = result.stderr.strip()
-            if "is not RAR archive" not in error_msg:  # Ignore expected errors for split archives
-                logger.warning(f"Extraction warning: {error_msg}")
-        
-        # Verify extraction success by checking if files were created
-        if not os.listdir(extract_path):
-            raise subprocess.CalledProcessError(1, command, "Extraction failed - no files extracted")
-        
+            # CRC errors, truncated or missing volumes, wrong password
+            raise subprocess.CalledProcessError(result.returncode, shown_command,
+                                                result.stderr.strip() or result.stdout.strip())
+        problems = check_rar_extraction(rar_path, extract_path, password)
+        if problems:
+            raise subprocess.CalledProcessError(1, shown_command, f"Incomplete extraction: {'; '.join(problems[:10])}")
+        if password:
+            remember_password(rar_path, password, config)
+
         logger.info(f"Successfully extracted RAR file: {rar_path}")
         return True
         
@@ -398,48 +710,149 @@ def extract_rar(rar_path, extract_path, config):
         raise
 
 
-def handle_rar_file(folder_path, game_name, config):
+def is_wrong_password(result):
+    """Whether an unrar run failed on a wrong password, exit code 11 since unrar 5."""
+    return result.returncode == UNRAR_BAD_PASSWORD or "password is incorrect" in (result.stderr or "").lower()
+
+
+def extract_archive_sets(volume_sets, extract_dir, config):
+    """Extract every archive set of a folder into extract_dir, RAR sets with unrar and split 7z/zip archives with 7z."""
+    for volume_set in volume_sets:
+        if volume_set["kind"] == "rar" and volume_set["scheme"] != "split":
+            extract_rar(volume_set["main"], extract_dir, config)
+            continue
+        command = [config["compressionCMD"], 'x', volume_set["main"], f'-o{extract_dir}', '-y']
+        returncode = run_7z(command, bytes_in=volume_set["size"])
+        if returncode != 0:
+            raise subprocess.CalledProcessError(returncode, command, f"Extraction of {volume_set['main']} failed")
+        logger.info(f"Successfully extracted {volume_set['kind']} set: {volume_set['main']}")
+    return True
+
+
+def extract_to_scratch(folder_path, volume_sets, needed, config):
+    """
+    Extract a RAR set to a scratch volume instead of the torrent folder.
+    Compression reads straight from the scratch copy, so the torrent folder and its RAR files are left untouched;
+    the scratch copy is removed by cleanup_scratch_extract once the job is done.
+    Returns (success, root_folder) tuple, root_folder being an absolute path on the scratch volume.
     """
-    Handle RAR file extraction and cleanup.
+    main_rar = volume_sets[0]["main"]
+    reservation = f"extract {folder_path}"
+    extracted = completed_stage(config, "extracted")
+    if extracted and os.path.isdir(extracted["root_folder"]):
+        logger.info(f"Reusing the extraction of {main_rar} left in {extracted['root_folder']} by the previous run")
+        config["scratch_extract"] = {"dir": extracted["dir"], "reservation": reservation}
+        return True, extracted["root_folder"]
+
+    scratch_dir = reserve_space(needed, config["scratch"]["dirs"], reservation, config)
+    job_dir = os.path.join(scratch_dir, f"temp_extract_{uuid.uuid4().hex}")
+    config["scratch_extract"] = {"dir": job_dir, "reservation": reservation}
+    # Keep the torrent folder's name, it becomes the top-level folder inside the archive
+    extract_dir = os.path.join(job_dir, os.path.basename(fix_filename(folder_path)))
+    os.makedirs(extract_dir)
+
+    try:
+        with stage(config, "extraction", sum(volume_set["size"] for volume_set in volume_sets)) as record:
+            extract_archive_sets(volume_sets, extract_dir, config)
+            record["bytes_out"] = estimate_folder_size(extract_dir)
+    except Exception as e:
+        logger.error(f"Error during RAR handling: {str(e)}")
+        cleanup_scratch_extract(config)
+        raise
+
+    directories = [d for d in os.listdir(extract_dir) if os.path.isdir(os.path.join(extract_dir, d))]
+    if len(directories) == 1:
+        root_folder = os.path.join(extract_dir, directories[0])
+    else:
+        root_folder = extract_dir
+    record_stage(config, "extracted", dir=job_dir, root_folder=root_folder)
+    logger.info(f"Extracted {main_rar} to scratch directory {root_folder}")
+    return True, root_folder
+
+
+def remove_rar_files(rar_files):
+    for rar_file in rar_files:
+        try:
+            os.remove(rar_file)
+            logger.debug(f"Removed RAR file: {rar_file}")
+        except OSError as e:
+            logger.warning(f"Failed to remove RAR file {rar_file}: {e}")
+
+
+def handle_rar_file(folder_path, game_name, config, before_staging=None, include_packed=False):
+    """
+    Handle RAR file extraction. The RAR files to remove once the archive is verified are left in
+    config["source_archives"].
+    before_staging is called once the RAR set is extracted, before the torrent folder is modified;
+    raising from it aborts the job and leaves the folder untouched.
+    include_packed also extracts single 7z and zip archives, to repack them.
     Returns (success, root_folder) tuple.
     """
-    main_rar, rar_files = find_rar_files(folder_path)
-    if not main_rar:
+    if os.path.isfile(folder_path):
+        return False, None
+    staged = completed_stage(config, "staged")
+    if staged and not config["scratch"]["dirs"]:
+        logger.info(f"RAR set of {folder_path} was already extracted and staged by the previous run")
+        config["source_archives"] = [rar_file for rar_file in staged["rar_files"] if os.path.exists(rar_file)]
+        return True, staged["root_folder"]
+
+    volume_sets = find_archive_sets(folder_path, include_packed)
+    if not volume_sets:
         logger.info(f"No RAR files found in {folder_path}. Proceeding with normal compression.")
         return False, None
 
-    # Create a unique subdirectory for extraction
-    temp_dir_name = f"temp_extract_{uuid.uuid4().hex}"
-    extract_dir = os.path.join(folder_path, temp_dir_name)
-    os.makedirs(extract_dir, exist_ok=True)
-    
+    main_rar = volume_sets[0]["main"]
+    rar_files = [volume for volume_set in volume_sets for volume in volume_set["volumes"]]
+    # A single 7z or zip extracted to be repacked is what the torrent seeds, PACKED_INPUT_KEEP_SOURCE keeps it
+    keep_packed = config["packed_inputs"]["keep_source"]
+    source_archives = [volume for volume_set in volume_sets if is_extractable(volume_set) or not keep_packed
+                       for volume in volume_set["volumes"]]
+    needed = sum(estimate_extracted_size(volume_set, config) for volume_set in volume_sets)
+    logger.info(f"Extracting {', '.join(os.path.basename(volume_set['main']) for volume_set in volume_sets)} "
+                f"({len(rar_files)} volumes) needs about {format_size(needed)}")
+    if config["scratch"]["dirs"]:
+        return extract_to_scratch(folder_path, volume_sets, needed, config)
+
+    reservation = f"extract {folder_path}"
     extraction_successful = False
     root_folder = None
 
+    # A run that crashed after extracting leaves its extraction directory behind, and the journal points to it
+    resumed = completed_stage(config, "extracted")
+    if resumed and os.path.isdir(resumed["dir"]):
+        extract_dir = resumed["dir"]
+        temp_dir_name = os.path.basename(extract_dir)
+        logger.info(f"Reusing the extraction of {main_rar} left in {extract_dir} by the previous run")
+    else:
+        reserve_space(needed, [folder_path], reservation, config)
+        # Create a unique subdirectory for extraction
+        temp_dir_name = f"temp_extract_{uuid.uuid4().hex}"
+        extract_dir = os.path.join(folder_path, temp_dir_name)
+        os.makedirs(extract_dir, exist_ok=True)
+
     try:
-        if extract_rar(main_rar, extract_dir, config):
-            logger.info(f"Successfully extracted RAR file: {main_rar}")
+        if resumed and extract_dir == resumed["dir"]:
+            extracted = True
+        else:
+            with stage(config, "extraction", sum(volume_set["size"] for volume_set in volume_sets)) as record:
+                extracted = extract_archive_sets(volume_sets, extract_dir, config)
+                record["bytes_out"] = estimate_folder_size(extract_dir)
+            record_stage(config, "extracted", dir=extract_dir)
+        if extracted:
+            logger.info(f"Successfully extracted archive sets of {folder_path}")
+            if before_staging is not None:
+                before_staging()
             
-            # Move extracted contents to the original folder
-            for item in os.listdir(extract_dir):
-                s = os.path.join(extract_dir, item)
-                d = os.path.join(folder_path, item)
-                if os.path.isdir(s):
-                    shutil.copytree(s, d, dirs_exist_ok=True)
-                else:
-                    shutil.copy2(s, d)
+            # Move extracted contents to the original folder, renaming instead of copying whenever possible
+            with stage(config, "staging") as record:
+                staging_stats = stage_tree(extract_dir, folder_path)
+                record["bytes_in"] = sum(staging_stats[k] for k in ("moved", "reflinked", "hardlinked", "copied"))
+                record["bytes_out"] = staging_stats["copied"]
+            log_staging_stats(staging_stats)
             logger.info(f"Moved extracted contents to {folder_path}")
             
             extraction_successful = True
             
-            # Clean up RAR files only after successful extraction and copying
-            for rar_file in [main_rar] + rar_files:
-                try:
-                    os.remove(rar_file)
-                    logger.debug(f"Removed RAR file: {rar_file}")
-                except OSError as e:
-                    logger.warning(f"Failed to remove RAR file {rar_file}: {e}")
-            
             # Determine the root folder for compression
             # Explicitly exclude the temporary directory from the search
             directories = [d for d in os.listdir(folder_path) 
@@ -455,6 +868,10 @@ def handle_rar_file(folder_path, game_name, config):
             else:
                 logger.warning(f"No directories found inside {folder_path}. Using original folder path.")
                 root_folder = os.path.basename(folder_path)
+            record_stage(config, "staged", root_folder=root_folder, rar_files=source_archives)
+
+            # The RAR files are only removed once their content is archived and verified, see run_pipeline
+            config["source_archives"] = source_archives
                 
     except Exception as e:
         logger.error(f"Error during RAR handling: {str(e)}")
@@ -467,6 +884,7 @@ def handle_rar_file(folder_path, game_name, config):
                 logger.debug("Cleaned up temporary extraction directory")
             except OSError as e:
                 logger.warning(f"Failed to clean up temporary directory {extract_dir}: {e}")
+        release_space(reservation, config)
     
     return extraction_successful, root_folder
 
@@ -490,57 +908,623 @@ def quality_check(game_data, config):
     return True, f"Game is popular enough with {rating_count} ratings"
 
 
-def compression(folder_path, game_name, config):
+def adaptive_compression(folder_path, archive_path, config, cancel=None, reservation=None):
+    """
+    Compress folder_path with settings picked from a compressibility probe:
+    already packed files are stored, the rest is compressed with LZMA2 sized for the job and the available RAM.
+    Returns False without compressing anything when there are no files to profile.
+    """
+    threads = int(config["multithread"] or 1)
+    profile = analyze_folder(folder_path, config, threads)
+    if not profile["compress"] and not profile["store"]:
+        logger.info(f"No files to profile in {folder_path}, compressing with the default settings")
+        return False
+    total = profile["compress_bytes"] + profile["store_bytes"]
+    if profile["compress"] and profile["store"] and reservation is not None:
+        # The store pass adds to the archive of the LZMA2 pass by rewriting it to a temporary file next to it,
+        # so the old and the new archive exist side by side until it ends: one more copy to make room for
+        logger.info(f"Adaptive compression writes the archive twice, reserving {format_size(profile['projected_bytes'])} more")
+        reserve_space(total + profile["projected_bytes"], [os.path.dirname(os.path.abspath(archive_path))],
+                      reservation, config)
+    archive_path = os.path.abspath(archive_path)
+    os.makedirs(config["state_dir"], exist_ok=True)
+    # 7z stores paths relative to where it runs, run it next to the folder so the archive keeps its top-level folder
+    cwd = os.path.dirname(os.path.abspath(folder_path))
+    for command, listfile in build_7z_commands(config["compressionCMD"], archive_path, profile, threads, config, config["state_dir"]):
+        try:
+            returncode = run_7z(command, cwd=cwd, bytes_in=total, cancel=cancel)
+            if returncode != 0:
+                raise subprocess.CalledProcessError(returncode, command)
+        finally:
+            os.remove(listfile)
+
+    if total and os.path.exists(archive_path):
+        actual_ratio = os.path.getsize(archive_path) / total
+        logger.info(f"Compression ratio of {archive_path}: projected {profile['projected_ratio']:.2f}, actual {actual_ratio:.2f}")
+    return True
+
+
+def verify_archive(archive_path, config, backend, archive_type=None, source_checksums=None):
+    """
+    Test an archive with its backend ("7z t", or reading the whole tar stream back),
+    raising CalledProcessError if it is damaged.
+    With the source's {path: (size, crc32)} from TreeChecksums, every archived file is also checked against
+    its source, and the archive's (path, size, crc32) entries are returned.
+    """
+    size = os.path.getsize(archive_path)
+    archive_checksums = None
+    with stage(config, "verification", size):
+        # Reading a tar stream back for its checksums already decompresses all of it, 7z only lists its stored CRCs
+        if source_checksums is None or backend.name == "7z":
+            returncode = backend.test(archive_path, archive_type)
+            if returncode != 0:
+                raise subprocess.CalledProcessError(returncode, f"{backend.name} test {archive_path}", f"Archive {archive_path} failed verification")
+        if source_checksums is not None:
+            archive_checksums = backend.checksums(archive_path)
+            problems = compare_checksums(source_checksums, archive_checksums)
+            if problems:
+                logger.error(f"Archive {archive_path} doesn't match its source: {'; '.join(problems)}")
+                raise subprocess.CalledProcessError(1, f"{backend.name} checksums {archive_path}", f"Archive {archive_path} doesn't match its source")
+    if archive_checksums is not None:
+        logger.info(f"Verified archive {archive_path}, the CRC32 of its {len(archive_checksums)} files match the source")
+    else:
+        logger.info(f"Verified archive {archive_path}")
+    return archive_checksums
+
+
+def write_checksum_sidecar(archive_path, config, backend, checksums=None):
+    """Write "{archive}.sfv" next to an archive, from the checksums its verification returned or from its listing."""
+    if not config["checksum_sidecar"]:
+        return
+    try:
+        if checksums is None:
+            checksums = backend.checksums(archive_path)
+        write_atomic(f"{archive_path}.sfv", format_sfv(checksums))
+    except (subprocess.CalledProcessError, OSError) as e:
+        logger.warning(f"Failed to write the checksum sidecar of {archive_path}: {e}")
+
+
+def compression(folder_path, game_name, config, pending_name=None):
+    """
+    Compress folder_path into storeFolder as "{game_name} ({releaseDate}).7z" (or .tar.zst, .tar.xz,
+    depending on the output backend select_backend picks for it).
+    The backend writes to a ".partial" file, which is verified, fsynced and renamed to its final name only once complete,
+    so an archive with its final name is always a finished one.
+    pending_name is a Future for a name lookup that hasn't finished yet: the archive is then built under a
+    temporary name and renamed once the lookup is done, or deleted if the game gets filtered out.
+    Returns the archive's path, or None if there already was one.
+    """
+    store_folder = config["storeFolder"]
+    source_checksums = None
+
+    if pending_name is not None and pending_name.done():
+        game_name, pending_name = pending_name.result(), None
+    reservation = f"archive {folder_path}"
+    fingerprint = (None, None, estimate_folder_size(folder_path))
+    if config["catalog"]["enabled"] and os.path.isdir(folder_path):
+        fingerprint = fingerprint_tree(folder_path, config)
+    compressed = completed_stage(config, "compressed")
+    if compressed and os.path.exists(compressed["partial"]):
+        partial_path = compressed["partial"]
+        backend = get_backend(compressed.get("backend", "7z"), config)
+        logger.info(f"Reusing archive {partial_path} compressed by the previous run")
+        if pending_name is not None:
+            game_name = pending_name.result()
+    else:
+        forget_stage(config, "verified")
+        forget_stage(config, "compressed")
+        backend, level = select_backend(config, fingerprint[2])
+        if pending_name is None and os.path.exists(f"{store_folder}{game_name} ({config['releaseDate']}){backend.extension}"):
+            logger.warning(f"File {store_folder}{game_name} already exists! Skipping compression of {folder_path}!")
+            return
+        check_duplicate(config, fingerprint=fingerprint[:2])
+        if config["verify_archives"]:
+            # Hashed while the backend reads the same files, so they mostly come from the page cache
+            source_checksums = TreeChecksums(folder_path, config["checksum_workers"])
+        try:
+            partial_path = compress_to_partial(folder_path, game_name, config, pending_name, reservation, backend, level)
+        except Exception:
+            if source_checksums is not None:
+                source_checksums.cancel()
+            raise
+        if pending_name is not None:
+            game_name = pending_name.result()
+        record_stage(config, "compressed", partial=partial_path, backend=backend.name)
+
+    final_path = f"{store_folder}{game_name} ({config['releaseDate']}){backend.extension}"
+    try:
+        if os.path.exists(final_path):
+            logger.warning(f"File {store_folder}{game_name} already exists! Discarding the archive of {folder_path}!")
+            os.remove(partial_path)
+            return
+        archive_checksums = None
+        if config["verify_archives"] and not completed_stage(config, "verified"):
+            if source_checksums is None:
+                source_checksums = TreeChecksums(folder_path, config["checksum_workers"])
+            try:
+                archive_checksums = verify_archive(partial_path, config, backend, source_checksums=source_checksums.result())
+            except subprocess.CalledProcessError:
+                os.remove(partial_path)
+                forget_stage(config, "compressed")
+                raise
+            record_stage(config, "verified")
+
+        if os.path.dirname(os.path.abspath(partial_path)) != os.path.abspath(store_folder):
+            # Built on a scratch volume, bring it over to storeFolder still under a .partial name
+            release_space(reservation, config)
+            archive_size = os.path.getsize(partial_path)
+            reserve_space(archive_size, [store_folder], reservation, config)
+            shutil.move(partial_path, f"{final_path}.partial")
+            logger.info(f"Moved {format_size(archive_size)} archive from scratch directory {os.path.dirname(partial_path)} to {store_folder}")
+            partial_path = f"{final_path}.partial"
+            record_stage(config, "compressed", partial=partial_path, backend=backend.name)
+        fsync_path(partial_path)
+        os.replace(partial_path, final_path)
+        fsync_path(final_path)
+    finally:
+        release_space(reservation, config)
+    write_checksum_sidecar(final_path, config, backend, archive_checksums)
+    conn = open_catalog(config)
+    if conn is not None:
+        try:
+            layout, content, source_size = fingerprint
+            record_archive(conn, final_path, config.get("igdb_id"), game_name, config["releaseDate"], source_size, layout, content)
+        finally:
+            conn.close()
+    logger.info(f"Successfully compressed {game_name} to {final_path}")
+    report_progress(config, "archived", archive=final_path)
+    return final_path
+
+
+def find_packed_archive(folder_path, config):
+    """
+    Detect inputs that already are a single 7z or zip archive of the game: a torrent of just that file,
+    or a folder where it is the only archive and holds nearly all the data.
+    Returns the archive's details read from its listing, or None.
+    """
+    if not config["packed_inputs"]["enabled"]:
+        return None
+    if os.path.isfile(folder_path):
+        classified = classify_volume(os.path.basename(folder_path))
+        # game.7z, or game.zip which would close a zip split if there were .z01 volumes
+        if not classified or (classified[2], classified[3]) not in (("single", 0), ("zip", None)):
+            return None
+        archive_path, archive_type = folder_path, classified[0]
+    else:
+        volume_sets = index_volume_sets(folder_path)
+        if len(volume_sets) != 1 or is_extractable(volume_sets[0]):
+            return None
+        archive_path, archive_type = volume_sets[0]["main"], volume_sets[0]["kind"]
+        if volume_sets[0]["size"] < estimate_folder_size(folder_path) * PACKED_INPUT_SHARE:
+            return None
+
+    try:
+        _, listing = read_listing(config["compressionCMD"], archive_path)
+    except (subprocess.CalledProcessError, OSError) as e:
+        logger.warning(f"Can't list {archive_path}, compressing it like any other file: {e}")
+        return None
+    files = [fields for fields in listing if fields.get("Folder") != "+" and not fields.get("Attributes", "").startswith("D")]
+    size = os.path.getsize(archive_path)
+    unpacked_size = sum(int(fields.get("Size") or 0) for fields in files)
+    packed = {
+        "path": archive_path,
+        "type": archive_type,
+        "size": size,
+        "unpacked_size": unpacked_size,
+        "ratio": size / unpacked_size if unpacked_size else 1.0,
+        # "LZMA2:24 BCJ" -> LZMA2, BCJ
+        "methods": sorted({method.split(":")[0] for fields in files for method in fields.get("Method", "").split()}),
+        "encrypted": any(fields.get("Encrypted") == "+" for fields in files),
+        "layout": layout_hash(listing_manifest(listing)),
+    }
+    logger.info(f"{archive_path} already is a {archive_type} archive: {format_size(unpacked_size)} packed to "
+                f"{format_size(size)} (ratio {packed['ratio']:.2f}) with {', '.join(packed['methods']) or 'an unknown method'}")
+    return packed
+
+
+def should_repack(packed, folder_path, config):
+    """Apply the repack policy: never, weak (only archives made with weak methods) or always."""
+    policy = config["packed_inputs"]["repack"]
+    weak = packed["methods"] and all(method in WEAK_METHODS for method in packed["methods"])
+    if not (policy == "always" or (policy == "weak" and weak)):
+        return False
+    if os.path.isfile(folder_path) or packed["encrypted"]:
+        logger.warning(f"Can't repack {packed['path']} (single file torrent or encrypted archive), storing it as-is")
+        return False
+    logger.info(f"Repacking {packed['path']} per the {policy} repack policy")
+    return True
+
+
+def store_packed_archive(packed, config, pending_name):
+    """
+    Fast path for inputs that already are a 7z or zip archive: test it, then hardlink (or move) it into storeFolder
+    under the resolved name instead of extracting and recompressing it.
+    Returns the archive's path, or None if there already was one.
+    """
+    archive_path = packed["path"]
+    store_folder = config["storeFolder"]
+    check_duplicate(config, fingerprint=(packed["layout"], None))
+    start = time.monotonic()
+    staging_stats = new_staging_stats()
+    with stage(config, "fast_path", packed["size"]) as record:
+        if packed["encrypted"]:
+            logger.warning(f"{archive_path} is encrypted, it can't be tested without its password")
+        else:
+            verify_archive(archive_path, config, get_backend("7z", config), packed["type"])
+        game_name = pending_name.result()
+        final_path = f"{store_folder}{game_name} ({config['releaseDate']}).{packed['type']}"
+        if os.path.exists(final_path):
+            logger.warning(f"File {final_path} already exists! Skipping {archive_path}!")
+            return
+        partial_path = f"{final_path}.partial"
+        stage_file(archive_path, partial_path, staging_stats, keep_source=config["packed_inputs"]["keep_source"])
+        log_staging_stats(staging_stats)
+        fsync_path(partial_path)
+        os.replace(partial_path, final_path)
+        fsync_path(final_path)
+        record["bytes_out"] = staging_stats["copied"]
+
+    write_checksum_sidecar(final_path, config, get_backend("7z", config))
+    report_progress(config, "archived", archive=final_path)
+    conn = open_catalog(config)
+    if conn is not None:
+        try:
+            record_archive(conn, final_path, config.get("igdb_id"), game_name, config["releaseDate"],
+                           packed["unpacked_size"], packed["layout"])
+        finally:
+            conn.close()
+
+    # Extracting and recompressing reads the archive, writes and reads back the unpacked data and writes a new archive,
+    # the fast path only read the archive once to test it, plus what it had to copy
+    saved_io = 2 * packed["unpacked_size"] + packed["size"] - 2 * staging_stats["copied"]
+    elapsed = time.monotonic() - start
+    throughput = average_throughput(config, "compression")
+    saved_time = ""
+    if throughput:
+        seconds = packed["unpacked_size"] / (1024 * 1024) / throughput
+        duration = f"{seconds / 60:.0f} min" if seconds >= 120 else f"{seconds:.0f}s"
+        saved_time = f", and about {duration} of compression at the usual {throughput:.1f} MB/s"
+    logger.info(f"Stored {archive_path} as {final_path} in {elapsed:.1f}s without recompressing it: "
+                f"saved about {format_size(saved_io)} of I/O{saved_time}")
+    return final_path
+
+
+def compress_to_partial(folder_path, game_name, config, pending_name, reservation, backend, level=None):
+    """Run the backend on folder_path and return the path of the finished, not yet verified, .partial archive."""
     store_folder = config["storeFolder"]
-    multithread = config["multithread"]
-    release_date = config["releaseDate"]
-
-    if not os.path.exists(f"{store_folder}{game_name} ({release_date}).7z"):
-        compression_cmd = [config["compressionCMD"]]
-        compression_cmd.extend(['a', f'{store_folder}{game_name} ({release_date})', folder_path])
-        compression_cmd.append(f'-mmt={multithread}')
-        compression_cmd.append('-o ' + store_folder)
-        subprocess.run(compression_cmd)
-        logger.info(f"Successfully compressed {game_name} to {store_folder}{game_name} {release_date}")
+    scratch_dirs = config["scratch"]["dirs"]
+
+    # The archive is never bigger than its source, so that's all the space we need to admit the job
+    needed = estimate_folder_size(folder_path)
+    work_dir = reserve_space(needed, scratch_dirs or [store_folder], reservation, config)
+    if pending_name is not None:
+        # Named after the job, so a rerun overwrites the leftovers of a crashed one
+        archive_name = f".gamezip-{job_key(folder_path)[:16]}"
+        logger.info(f"Name lookup still running, compressing to temporary archive {archive_name}{backend.extension}.partial")
+        # Stop 7z right away if the lookup ends up filtering the game out
+        cancel = lambda: pending_name.done() and pending_name.exception() is not None
+    else:
+        archive_name = f"{game_name} ({config['releaseDate']})"
+        cancel = None
+    partial_name = f"{archive_name}{backend.extension}.partial"
+    partial_path = os.path.join(work_dir, partial_name) if scratch_dirs else f'{store_folder}{partial_name}'
+    # 7z adds to an existing archive, never let it add to what a killed 7z left behind
+    if os.path.exists(partial_path):
+        logger.info(f"Removing incomplete archive {partial_path} left by a previous run")
+        os.remove(partial_path)
+
+    try:
+        with stage(config, "compression", needed) as record:
+            # Adaptive compression picks its own 7z methods per file, it doesn't apply to the tar backends
+            adaptive = backend.name == "7z" and config["adaptive_compression"]["enabled"]
+            if not (adaptive and adaptive_compression(folder_path, partial_path, config, cancel, reservation)):
+                returncode = backend.compress(folder_path, partial_path, config["multithread"], level, cancel, needed)
+                if returncode != 0:
+                    raise subprocess.CalledProcessError(returncode, f"{backend.name} compression of {folder_path}")
+            record["bytes_out"] = os.path.getsize(partial_path)
+    except Exception:
+        release_space(reservation, config)
+        if os.path.exists(partial_path):
+            os.remove(partial_path)
+        if cancel is not None and cancel():
+            logger.info(f"Name lookup failed, discarded the archive of {folder_path}")
+            pending_name.result()
+        raise
+
+    if pending_name is not None:
+        try:
+            pending_name.result()
+        except Exception:
+            logger.info(f"Name lookup failed, removing temporary archive {partial_path}")
+            release_space(reservation, config)
+            os.remove(partial_path)
+            raise
+    return partial_path
+
+
+def check_duplicate(config, igdb_id=None, fingerprint=None):
+    """
+    Skip the job when the catalog already has an archive of the same game (by IGDB id)
+    or of the same source tree (fingerprint is a (layout, fingerprint) tuple from fingerprint_tree).
+    """
+    if not config["catalog"]["dedupe"]:
+        return
+    conn = open_catalog(config)
+    if conn is None:
+        return
+    try:
+        layout, fingerprint = fingerprint or (None, None)
+        row, reason = find_duplicate(conn, igdb_id, layout, fingerprint)
+    finally:
+        conn.close()
+    if row is not None:
+        logger.warning(f"{row['name']} ({row['year']}) is already stored as {row['archive']}, same {reason}")
+        raise ValueError(f"Duplicate of {row['archive']} already in catalog (same {reason})")
+
+
+def resolve_igdb_ids(archives, config):
+    """
+    Find the IGDB ids of the (name, year) pairs read from archive names, with multiquery requests.
+    A match only counts when its release year agrees with the archive's.
+    """
+    names = list(dict.fromkeys(name for name, _ in archives))
+    candidates = {}
+    for i in range(0, len(names), MULTIQUERY_LIMIT):
+        chunk = names[i:i + MULTIQUERY_LIMIT]
+        try:
+            candidates.update(multisearch_igdb(chunk, config))
+        except Exception as e:
+            logger.error(f"Error fetching from IGDB API: {str(e)}")
+    igdb_ids = {}
+    for name, year in archives:
+        best_match = find_best_match(candidates.get(name, []), name)
+        if not best_match:
+            continue
+        match_year = datetime.datetime.fromtimestamp(best_match["first_release_date"]).year if best_match.get("first_release_date") else None
+        if year is None or match_year is None or match_year == year:
+            igdb_ids[(name, year)] = best_match["id"]
+    return igdb_ids
+
+
+def process_folder(folder_path, config, game_name=None, compression_slot=None):
+    """
+    Run the whole pipeline for one folder: name lookup, RAR handling and compression.
+    compression_slot is a context manager factory used by the daemon to schedule compressions.
+    Stage metrics of the job are written once it finishes. Completed stages are journaled, so that running
+    a failed or interrupted job again resumes it instead of starting over.
+    """
+    start_job_metrics(config, folder_path)
+    open_journal(config, folder_path)
+    status = "failed"
+    try:
+        run_pipeline(folder_path, config, game_name, compression_slot)
+        status = "done"
+    except ValueError as e:
+        if is_skipped_game(e):
+            status = "skipped"
+        raise
+    finally:
+        close_journal(config, finished=status != "failed")
+        finish_job_metrics(config, status)
+
+
+def timed_fetch_game_name(folder_path, config):
+    with stage(config, "name_lookup"):
+        game_name = fetch_game_name(folder_path, config)
+    check_duplicate(config, igdb_id=config.get("igdb_id"))
+    check_existing_archive(game_name, config)
+    record_stage(config, "name", game_name=game_name, release_date=config["releaseDate"], igdb_id=config.get("igdb_id"))
+    return game_name
+
+
+def check_existing_archive(game_name, config):
+    """
+    Skip the job as soon as its name is known when storeFolder already has an archive with its final name,
+    in any output format or stored by the packed-input fast path, so compression running in the meantime
+    is stopped instead of finishing for nothing.
+    """
+    extensions = dict.fromkeys([backend.extension for backend in BACKENDS.values()] +
+                               [f".{archive_type}" for archive_type in PACKED_INPUT_TYPES])
+    for extension in extensions:
+        archive_path = f"{config['storeFolder']}{game_name} ({config['releaseDate']}){extension}"
+        if os.path.exists(archive_path):
+            logger.warning(f"File {archive_path} already exists! Skipping {game_name}!")
+            raise ValueError(f"Archive {archive_path} already exists")
+
+
+def run_pipeline(folder_path, config, game_name=None, compression_slot=None):
+    """
+    The name lookup runs in the background while the RAR set is extracted and compressed,
+    since the name is only needed to rename the finished archive. The torrent folder is only
+    modified once the game is known to pass the filters, and a late "filtered out" verdict stops 7z.
+    """
+    if compression_slot is None:
+        compression_slot = lambda config: nullcontext()
+    named = completed_stage(config, "name")
+    if not game_name and named:
+        game_name = named["game_name"]
+        config["releaseDate"] = named["release_date"]
+        config["igdb_id"] = named.get("igdb_id")
+        logger.info(f"Using {game_name} ({config['releaseDate']}) found by the previous run")
+    executor = None
+    finished = False
+    archive_path = None
+    if game_name:
+        lookup = Future()
+        lookup.set_result(game_name)
     else:
-        logger.warning(f"File {store_folder}{game_name} already exists! Skipping compression of {folder_path}!")
+        executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="name_lookup")
+        lookup = executor.submit(timed_fetch_game_name, folder_path, config)
+
+    try:
+        if game_name:
+            check_duplicate(config, igdb_id=config.get("igdb_id"))
+        packed = find_packed_archive(folder_path, config)
+        if packed is not None and not should_repack(packed, folder_path, config):
+            archive_path = store_packed_archive(packed, config, lookup)
+        else:
+            success, root_folder = handle_rar_file(folder_path, game_name, config, before_staging=lookup.result,
+                                                   include_packed=packed is not None)
+            if success:
+                compression_path = os.path.join(folder_path, root_folder) if root_folder else folder_path
+                logger.info(f"  Starting compression from {compression_path}")
+            else:
+                compression_path = folder_path
+                logger.info(f"No RAR handling needed. Starting direct compression from {folder_path}")
+            with compression_slot(config):
+                archive_path = compression(compression_path, None, config, pending_name=lookup)
+            # Gated on the archive being verified, a failed compression leaves the RAR set as it was
+            if archive_path is not None and config.get("source_archives"):
+                remove_rar_files(config.pop("source_archives"))
+        finished = True
+    except ValueError as e:
+        finished = is_skipped_game(e)
+        raise
+    finally:
+        if executor is not None:
+            executor.shutdown(wait=True)
+        if finished or not completed_stage(config, "extracted"):
+            cleanup_scratch_extract(config)
+        elif "scratch_extract" in config:
+            # Keep the extraction for the next run, the journal points to it
+            release_space(config.pop("scratch_extract")["reservation"], config)
+    if archive_path is not None:
+        logger.info(f"Successfully compressed {lookup.result()}")
+    else:
+        logger.info(f"No new archive for {lookup.result()}, storeFolder already has one")
+
+
+def is_skipped_game(error):
+    reasons = ("popularity filter", "skip_unknown_games", "already in catalog", "already exists")
+    return any(reason in str(error).lower() for reason in reasons)
+
+
+def run_job(job, config, compression_slot=None):
+    """
+    Process a queued job with its own copy of the config, since jobs run concurrently in the daemon.
+    Returns "done", or "skipped" when the game was filtered out.
+    """
+    job_config = copy.deepcopy(config)
+    if job.get("force_compress"):
+        job_config["enable_popularity_filter"] = False
+    if job.get("release_date"):
+        job_config["releaseDate"] = job["release_date"]
+    job_config["igdb_id"] = job.get("igdb_id")
+    job_config["category"] = job.get("category")
+    try:
+        process_folder(job["input"], job_config, job.get("name"), compression_slot)
+    except ValueError as e:
+        if is_skipped_game(e):
+            logger.info(f"Game skipped: {e}")
+            return "skipped"
+        raise
+    return "done"
+
+
+def process_batch(folder_paths, config, queue=False):
+    """
+    Resolve every folder's name in one go, then compress them one after another (or queue them for the daemon).
+    A failing folder is logged and doesn't stop the rest of the batch.
+    """
+    failed = []
+    for folder_path, game_name, job_config in fetch_game_names(folder_paths, config):
+        if game_name is None:
+            continue
+        if queue:
+            enqueue_job(config, folder_path, config["category"], game_name,
+                        not config["enable_popularity_filter"], job_config["releaseDate"], job_config["igdb_id"])
+            continue
+        try:
+            process_folder(folder_path, job_config, game_name)
+        except Exception as e:
+            logger.error(f"Error during processing: {str(e)}")
+            logger.error(f"Failed to process {folder_path}")
+            failed.append(folder_path)
+    if failed:
+        raise SystemExit(1)
 
 
 def main():
     config = load_config()
     parser = argparse.ArgumentParser()
-    parser.add_argument("input", help="Input file")
+    parser.add_argument("input", nargs="*", help="Input file, several inputs are resolved together in batch mode")
     parser.add_argument("-c", "--category", action="store", help="Torrent category")
     parser.add_argument("-n", "--name", action="store", help="Provide the file's name in case we can't pick it up")
     parser.add_argument("--debug", action="store_true", help="Enable non-interactive debugging mode")
     parser.add_argument("--force-compress", action="store_true", help="Bypass popularity filters")
+    parser.add_argument("--no-cache", action="store_true", help="Bypass the IGDB lookup cache")
+    parser.add_argument("--purge-cache", action="store_true", help="Delete all IGDB lookup cache entries before running")
+    parser.add_argument("--serve", action="store_true", help="Run as a resident daemon processing queued jobs")
+    parser.add_argument("--job-server", action="store_true", help="Run the job server remote workers pull jobs from")
+    parser.add_argument("--worker", metavar="URL", help="Pull jobs from the job server at URL and process them")
+    parser.add_argument("--submit", metavar="URL", help="Submit the input to the job server at URL")
+    parser.add_argument("--watch", metavar="DIR", help="Process the folders dropped in DIR once they stop changing")
+    parser.add_argument("--build-index", metavar="GAMES_CSV", help="Build the offline title index from an IGDB games dump")
+    parser.add_argument("--alt-names", metavar="ALTERNATIVE_NAMES_CSV", help="IGDB alternative_names dump used with --build-index")
+    parser.add_argument("--update-index", action="store_true", help="Refresh the offline title index from IGDB's API")
+    parser.add_argument("--rebuild-catalog", action="store_true", help="Rebuild the storeFolder catalog from its archives")
+    parser.add_argument("--no-queue", action="store_true", help="Process the input right away even if the daemon is enabled")
     args = parser.parse_args()
     load_logger(config, args.debug)
-    folder_path = args.input
+    folder_path = args.input[0] if args.input else None
     logger.debug(f"Loaded passwords: {config['password_list']}")
+    if args.purge_cache:
+        purge_cache(config)
+    if args.no_cache:
+        config["igdb_cache"]["enabled"] = False
+        logger.info("IGDB lookup cache bypassed due to --no-cache flag")
     if args.force_compress:
         config["enable_popularity_filter"] = False
         logger.info("Popularity filters bypassed due to --force-compress flag")
 
-    if args.category == config["category_name"]:
+    if args.serve:
+        serve(config, run_job)
+        return
+    if args.job_server:
+        serve_jobs(config)
+        return
+    if args.worker:
+        run_worker(config, args.worker, run_job)
+        return
+    if args.submit:
+        if not folder_path:
+            parser.error("--submit needs an input")
+        for path in args.input:
+            submit_remote(config, args.submit, path, args.category, args.name if len(args.input) == 1 else None,
+                          args.force_compress)
+        return
+    if args.watch:
+        config["category"] = args.category or config["category_name"]
+        os.makedirs(os.path.dirname(config["watch"]["state_path"]), exist_ok=True)
+        watch(args.watch, config, run_job)
+        return
+    if args.build_index:
+        build_index(config["title_index"]["path"], args.build_index, args.alt_names)
+        return
+    if args.update_index:
+        update_index(config["title_index"]["path"], config)
+        return
+    if args.rebuild_catalog:
+        rebuild_catalog(config, lambda archives: resolve_igdb_ids(archives, config))
+        return
+    if not folder_path:
+        parser.error("the following arguments are required: input")
+
+    # Categories with their own output backend are processed too
+    accepted = args.category == config["category_name"] or args.category in config["output"]["by_category"]
+    config["category"] = args.category
+    if accepted and len(args.input) > 1:
+        if args.name:
+            parser.error("--name can't be used with several inputs")
+        process_batch(args.input, config, queue=config["daemon"]["enabled"] and not args.no_queue)
+    elif accepted:
+        if config["daemon"]["enabled"] and not args.no_queue:
+            enqueue_job(config, folder_path, args.category, args.name, args.force_compress)
+            return
         try:
-            if args.name:
-                game_name = args.name
-            else:
-                game_name = fetch_game_name(folder_path, config)
-            
-            success, root_folder = handle_rar_file(folder_path, game_name, config)
-            if success:
-                compression_path = os.path.join(folder_path, root_folder) if root_folder else folder_path
-                logger.info(f"  Starting compression from {compression_path}")
-                compression(compression_path, game_name, config)
-                logger.info(f"Successfully compressed {game_name}")
-            else:
-                logger.info(f"No RAR handling needed. Starting direct compression from {folder_path}")
-                compression(folder_path, game_name, config)
-                logger.info(f"Successfully compressed {game_name}")
+            process_folder(folder_path, config, args.name)
         except ValueError as e:
-            if "popularity filter" in str(e).lower() or "skip_unknown_games" in str(e).lower():
+            if is_skipped_game(e):
                 logger.info(f"Game skipped: {e}")
                 return  # Exit gracefully, don't treat as error
             else:
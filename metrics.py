@@ -0,0 +1,125 @@
+import os
+import json
+import time
+import logging
+
+from contextlib import contextmanager
+from locking import file_lock, write_atomic
+
+
+logger = logging.getLogger()
+
+MB = 1024 * 1024
+
+
+def start_job_metrics(config, folder_path):
+    """Start collecting stage metrics for a job, they are kept in the job's config until finish_job_metrics."""
+    config["job_metrics"] = {"job": os.path.abspath(folder_path), "started_at": time.time(), "stages": []}
+
+
+def report_progress(config, event, **details):
+    """Hand a job event (a stage starting, the archive being stored) to the job's progress callback, if it has one."""
+    progress = config.get("progress")
+    if progress is not None:
+        progress(event, **details)
+
+
+@contextmanager
+def stage(config, name, bytes_in=0):
+    """
+    Time one stage of a job. The yielded record can be updated with bytes_in/bytes_out while the stage runs.
+    Throughput is computed from the larger of the two byte counts.
+    """
+    record = {"stage": name, "bytes_in": bytes_in, "bytes_out": 0}
+    report_progress(config, name)
+    start = time.monotonic()
+    try:
+        yield record
+    finally:
+        record["wall_time"] = round(time.monotonic() - start, 3)
+        moved = max(record["bytes_in"], record["bytes_out"])
+        record["mb_per_s"] = round(moved / MB / record["wall_time"], 2) if record["wall_time"] else 0
+        logger.info(f"Stage {name}: {record['wall_time']:.1f}s, {record['bytes_in'] / MB:.1f} MB in, "
+                    f"{record['bytes_out'] / MB:.1f} MB out, {record['mb_per_s']:.1f} MB/s")
+        job_metrics = config.get("job_metrics")
+        if job_metrics is not None:
+            job_metrics["stages"].append(record)
+
+
+def finish_job_metrics(config, status):
+    """Write the job's metrics as one JSON line, and update the Prometheus textfile if one is configured."""
+    job_metrics = config.pop("job_metrics", None)
+    if job_metrics is None:
+        return
+    job_metrics["status"] = status
+    job_metrics["wall_time"] = round(time.time() - job_metrics["started_at"], 3)
+    metrics_config = config["metrics"]
+    try:
+        if metrics_config["file"]:
+            with file_lock(f"{metrics_config['file']}.lock"):
+                with open(metrics_config["file"], "a") as f:
+                    f.write(json.dumps(job_metrics) + "\n")
+        if metrics_config["prometheus_textfile"]:
+            update_prometheus_textfile(job_metrics, metrics_config)
+    except OSError as e:
+        logger.warning(f"Failed to write job metrics: {e}")
+
+
+def average_throughput(config, stage_name, jobs=50):
+    """Average MB/s of a stage over the last jobs in the metrics file, or None when there's no history."""
+    metrics_file = config["metrics"]["file"]
+    if not metrics_file or not os.path.exists(metrics_file):
+        return None
+    with open(metrics_file, "rb") as f:
+        # Only the tail of the file is needed
+        f.seek(max(0, os.path.getsize(metrics_file) - 512 * 1024))
+        lines = f.read().splitlines()[-jobs:]
+    speeds = []
+    for line in lines:
+        try:
+            stages = json.loads(line)["stages"]
+        except (ValueError, KeyError):
+            continue
+        speeds += [record["mb_per_s"] for record in stages if record["stage"] == stage_name and record["mb_per_s"]]
+    return sum(speeds) / len(speeds) if speeds else None
+
+
+def update_prometheus_textfile(job_metrics, metrics_config):
+    """
+    Keep running totals per stage in a state file and render them for node_exporter's textfile collector.
+    """
+    state_path = metrics_config["prometheus_state"]
+    with file_lock(f"{state_path}.lock"):
+        try:
+            with open(state_path) as f:
+                totals = json.load(f)
+        except (OSError, ValueError):
+            totals = {"jobs": {}, "stages": {}}
+
+        totals["jobs"][job_metrics["status"]] = totals["jobs"].get(job_metrics["status"], 0) + 1
+        for record in job_metrics["stages"]:
+            stage_totals = totals["stages"].setdefault(record["stage"], {"seconds": 0, "bytes_in": 0, "bytes_out": 0, "count": 0})
+            stage_totals["seconds"] += record["wall_time"]
+            stage_totals["bytes_in"] += record["bytes_in"]
+            stage_totals["bytes_out"] += record["bytes_out"]
+            stage_totals["count"] += 1
+        write_atomic(state_path, json.dumps(totals))
+
+        lines = [
+            "# HELP gamezip_jobs_total Jobs processed by GameZip, by final status.",
+            "# TYPE gamezip_jobs_total counter",
+        ]
+        lines += [f'gamezip_jobs_total{{status="{status}"}} {count}' for status, count in totals["jobs"].items()]
+        for metric, key, help_text in (
+                ("gamezip_stage_seconds_total", "seconds", "Wall time spent in each stage."),
+                ("gamezip_stage_bytes_in_total", "bytes_in", "Bytes read by each stage."),
+                ("gamezip_stage_bytes_out_total", "bytes_out", "Bytes written by each stage."),
+                ("gamezip_stage_runs_total", "count", "Number of times each stage ran.")):
+            lines += [f"# HELP {metric} {help_text}", f"# TYPE {metric} counter"]
+            lines += [f'{metric}{{stage="{name}"}} {values[key]}' for name, values in totals["stages"].items()]
+        lines += [
+            "# HELP gamezip_last_job_seconds Wall time of the last job.",
+            "# TYPE gamezip_last_job_seconds gauge",
+            f"gamezip_last_job_seconds {job_metrics['wall_time']}",
+        ]
+        write_atomic(metrics_config["prometheus_textfile"], "\n".join(lines) + "\n")
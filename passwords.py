@@ -0,0 +1,101 @@
+import os
+import re
+import json
+import hashlib
+import logging
+import rarfile
+
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from locking import file_lock, write_atomic
+
+
+logger = logging.getLogger()
+
+# Bytes hashed from the start of the first volume to fingerprint a RAR set
+FINGERPRINT_BYTES = 1024 * 1024
+
+# Chunk size test_password decrypts a file with
+TEST_READ_SIZE = 1024 * 1024
+
+
+def release_tag(folder_name):
+    """The release group tag, i.e. the [bracket] text that scrub_filename strips from the name."""
+    match = re.search(r'\[(.*?)\]', folder_name)
+    return match.group(1).strip().lower() if match else None
+
+
+def archive_fingerprint(rar_file):
+    digest = hashlib.sha1()
+    digest.update(str(os.path.getsize(rar_file)).encode())
+    with open(rar_file, "rb") as f:
+        digest.update(f.read(FINGERPRINT_BYTES))
+    return digest.hexdigest()
+
+
+def load_password_store(store_path):
+    try:
+        with open(store_path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {"fingerprints": {}, "tags": {}, "global": {}}
+
+
+def record_password(store_path, password, tag, fingerprint):
+    with file_lock(f"{store_path}.lock"):
+        store = load_password_store(store_path)
+        store["fingerprints"][fingerprint] = password
+        if tag:
+            tag_counts = store["tags"].setdefault(tag, {})
+            tag_counts[password] = tag_counts.get(password, 0) + 1
+        store["global"][password] = store["global"].get(password, 0) + 1
+        write_atomic(store_path, json.dumps(store), mode=0o600)
+
+
+def order_passwords(password_list, store, tag, fingerprint):
+    """
+    Most likely passwords first: the one that opened this exact archive before, then the ones that worked
+    for the same release group, then the ones that worked most often overall. Ties keep the configured order.
+    """
+    tag_counts = store["tags"].get(tag, {}) if tag else {}
+    global_counts = store["global"]
+    candidates = sorted(dict.fromkeys(password_list),
+                        key=lambda p: (-tag_counts.get(p, 0), -global_counts.get(p, 0)))
+    known = store["fingerprints"].get(fingerprint)
+    if known is not None:
+        candidates = [known] + [p for p in candidates if p != known]
+    return candidates
+
+
+def test_password(rar_file, password):
+    """
+    Returns the password if it unlocks rar_file, None otherwise.
+    Archives without encrypted headers list their files with any password, so the smallest file is
+    decrypted and its CRC checked. Runs in a worker process, so it only uses picklable arguments.
+    """
+    # Raises BadRarFile when the archive itself is corrupted
+    with rarfile.RarFile(rar_file, 'r') as rf:
+        try:
+            rf.setpassword(password)
+            files = [info for info in rf.infolist() if not info.is_dir()]
+            if not files:
+                raise rarfile.RarWrongPassword("Wrong password")
+            with rf.open(min(files, key=lambda info: info.file_size)) as f:
+                while f.read(TEST_READ_SIZE):
+                    pass
+            return password
+        except (rarfile.PasswordRequired, rarfile.RarWrongPassword, rarfile.RarCRCError, rarfile.BadRarFile):
+            return None
+
+
+def test_passwords_parallel(rar_file, candidates, workers):
+    """Test candidates in a process pool, stopping at the first one that works."""
+    executor = ProcessPoolExecutor(max_workers=min(workers, len(candidates)))
+    try:
+        futures = [executor.submit(test_password, rar_file, password) for password in candidates]
+        for future in as_completed(futures):
+            password = future.result()
+            if password is not None:
+                return password
+        return None
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,126 @@
+import os
+import json
+import time
+import shutil
+import logging
+import rarfile
+import subprocess
+
+from locking import file_lock, write_atomic
+from sevenzip import read_listing
+from staging import format_size, tree_size
+
+
+logger = logging.getLogger()
+
+
+def estimate_extracted_size(volume_set, config):
+    """
+    Estimate how much space extracting an archive set takes, from the unpacked sizes in its headers:
+    read with rarfile for RAR sets, and from the "7z l -slt" listing for 7z and zip archives.
+    Archives with encrypted headers can't be listed without the password, so the size of the volumes is used instead.
+    """
+    volumes = volume_set["volumes"]
+    volumes_size = sum(os.path.getsize(volume) for volume in volumes)
+    try:
+        if volume_set["kind"] == "rar":
+            with rarfile.RarFile(volumes[0], 'r') as rf:
+                unpacked_size = sum(info.file_size for info in rf.infolist())
+        else:
+            _, listing = read_listing(config["compressionCMD"], volume_set["main"])
+            unpacked_size = sum(int(fields.get("Size") or 0) for fields in listing)
+    except (rarfile.Error, subprocess.CalledProcessError, OSError, ValueError) as e:
+        logger.debug(f"Can't read the headers of {volume_set['main']}: {e}")
+        unpacked_size = 0
+    if not unpacked_size:
+        logger.debug(f"Estimating extracted size of {volume_set['main']} from its volumes")
+        return volumes_size
+    return unpacked_size
+
+
+def estimate_folder_size(folder_path):
+    return tree_size(folder_path)[0]
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+        return True
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+
+
+def _load_reservations(path):
+    try:
+        with open(path) as f:
+            reservations = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    # Drop reservations left behind by processes that died without releasing them
+    return {key: r for key, r in reservations.items() if _pid_alive(r["pid"])}
+
+
+def _device(path):
+    return str(os.stat(path).st_dev)
+
+
+def reserve_space(needed, candidates, key, config):
+    """
+    Admission control for a job that needs `needed` bytes on one of the candidate directories.
+    The first candidate with enough free space (minus what other running jobs already reserved) is picked
+    and reserved under `key`. When none fits, the job waits for space up to the admission timeout.
+    Returns the chosen directory.
+    """
+    scratch_config = config["scratch"]
+    reservations_path = scratch_config["reservations_path"]
+    required = int(needed * (1 + scratch_config["headroom"]))
+    waited = 0
+
+    while True:
+        with file_lock(f"{reservations_path}.lock"):
+            reservations = _load_reservations(reservations_path)
+            for directory in candidates:
+                os.makedirs(directory, exist_ok=True)
+                device = _device(directory)
+                # A key reserved again (to grow its reservation) replaces its previous one
+                reserved = sum(r["bytes"] for k, r in reservations.items() if r["device"] == device and k != key)
+                free = shutil.disk_usage(directory).free - reserved
+                logger.debug(f"{directory}: {format_size(free)} free after reservations, {format_size(required)} needed")
+                if free >= required:
+                    reservations[key] = {"pid": os.getpid(), "device": device, "bytes": required}
+                    write_atomic(reservations_path, json.dumps(reservations))
+                    logger.info(f"Admitted {key}: reserved {format_size(required)} on {directory}")
+                    return directory
+
+        if waited >= scratch_config["admission_timeout"]:
+            raise OSError(f"Not enough free space for {key}: {format_size(required)} needed on one of {candidates}")
+        if waited == 0:
+            logger.warning(f"Not enough free space for {key} ({format_size(required)} needed), waiting for space")
+        time.sleep(scratch_config["admission_poll"])
+        waited += scratch_config["admission_poll"]
+
+
+def release_space(key, config):
+    reservations_path = config["scratch"]["reservations_path"]
+    with file_lock(f"{reservations_path}.lock"):
+        reservations = _load_reservations(reservations_path)
+        if reservations.pop(key, None) is not None:
+            write_atomic(reservations_path, json.dumps(reservations))
+            logger.debug(f"Released space reserved for {key}")
+
+
+def cleanup_scratch_extract(config):
+    """Remove a job's extraction directory on the scratch volume once it has been compressed."""
+    scratch_extract = config.pop("scratch_extract", None)
+    if not scratch_extract:
+        return
+    extract_dir = scratch_extract["dir"]
+    if os.path.exists(extract_dir):
+        try:
+            shutil.rmtree(extract_dir)
+            logger.debug(f"Cleaned up scratch extraction directory {extract_dir}")
+        except OSError as e:
+            logger.warning(f"Failed to clean up scratch directory {extract_dir}: {e}")
+    release_space(scratch_extract["reservation"], config)
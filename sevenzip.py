@@ -0,0 +1,107 @@
+import os
+import re
+import time
+import signal
+import logging
+import threading
+import subprocess
+
+
+logger = logging.getLogger()
+
+PROGRESS_PATTERN = re.compile(rb'(\d{1,3})%')
+
+# Log live progress every this many percent
+PROGRESS_STEP = 10
+
+
+def _watch_cancel(process, cancel, stop):
+    while not stop.wait(1):
+        if cancel():
+            logger.warning(f"Job cancelled, stopping {os.path.basename(process.args[0])}")
+            _terminate_group(process)
+            return
+
+
+def _terminate_group(process):
+    """Terminate the tool and its children, like the compressor tar -I starts, which would otherwise run on."""
+    try:
+        os.killpg(process.pid, signal.SIGTERM)
+    except ProcessLookupError:
+        pass
+
+
+def run_7z(command, cwd=None, bytes_in=0, cancel=None):
+    """
+    Run a 7z command with -bsp1 and log its progress as it goes.
+    7z redraws its progress line with backspaces, so the output is read in chunks and split on them.
+    When cancel is given, it is polled every second and 7z is terminated as soon as it returns True.
+    Returns the process' return code.
+    """
+    return run_tool(command + ['-bsp1'], cwd=cwd, bytes_in=bytes_in, cancel=cancel, progress=True)
+
+
+def run_tool(command, cwd=None, bytes_in=0, cancel=None, progress=False):
+    """
+    Run an archiving tool (7z, tar...) the same way as run_7z, logging 7z style percentages only with progress.
+    The tool runs in its own process group, so cancelling also stops the processes it started (tar's -I compressor).
+    Returns the process' return code.
+    """
+    start = time.monotonic()
+    process = subprocess.Popen(command, cwd=cwd, stdin=subprocess.DEVNULL, stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+                               start_new_session=True)
+    stop = threading.Event()
+    if cancel is not None:
+        threading.Thread(target=_watch_cancel, args=(process, cancel, stop), daemon=True).start()
+    try:
+        return _follow_progress(process, start, bytes_in, progress)
+    finally:
+        stop.set()
+        # Interrupted (Ctrl+C...): its own session doesn't get the terminal's signals, don't leave it running
+        if process.poll() is None:
+            _terminate_group(process)
+            process.wait()
+
+
+def _follow_progress(process, start, bytes_in, progress=True):
+    next_report = PROGRESS_STEP
+    output = b""
+    while True:
+        chunk = process.stdout.read1(4096)
+        if not chunk:
+            break
+        output = (output + chunk)[-4096:]
+        if not progress:
+            continue
+        for match in PROGRESS_PATTERN.finditer(chunk):
+            percent = int(match.group(1))
+            if percent < next_report or percent > 100:
+                continue
+            elapsed = time.monotonic() - start
+            speed = bytes_in * percent / 100 / (1024 * 1024) / elapsed if elapsed and bytes_in else 0
+            logger.info(f"7z progress: {percent}% after {elapsed:.0f}s ({speed:.1f} MB/s)")
+            next_report = percent - percent % PROGRESS_STEP + PROGRESS_STEP
+    returncode = process.wait()
+    if returncode != 0:
+        logger.warning(f"{os.path.basename(process.args[0])} exited with code {returncode}: "
+                       f"{output.decode(errors='replace').strip()[-1000:]}")
+    return returncode
+
+
+def read_listing(compression_cmd, archive_path):
+    """
+    List an archive with "7z l -slt".
+    Returns (archive, entries): the archive's own properties (Type, Physical Size...) and one dict per entry
+    (Path, Size, Packed Size, Method, Encrypted...), as 7z prints them.
+    """
+    output = subprocess.run([compression_cmd, 'l', '-slt', archive_path], stdin=subprocess.DEVNULL,
+                            capture_output=True, text=True, errors="replace", check=True).stdout
+    # The archive's properties come first, then one block of "Key = value" lines per entry after a "----------" line
+    header, _, body = output.partition("\n----------\n")
+    archive = dict(line.split(" = ", 1) for line in header.splitlines() if " = " in line)
+    entries = []
+    for block in body.split("\n\n"):
+        fields = dict(line.split(" = ", 1) for line in block.strip().splitlines() if " = " in line)
+        if "Path" in fields:
+            entries.append(fields)
+    return archive, entries
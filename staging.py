@@ -0,0 +1,118 @@
+import os
+import fcntl
+import shutil
+import logging
+
+
+logger = logging.getLogger()
+
+# ioctl number of FICLONE from linux/fs.h, clones a whole file on filesystems with reflink support (btrfs, xfs)
+FICLONE = 0x40049409
+
+
+def new_staging_stats():
+    return {"moved": 0, "reflinked": 0, "hardlinked": 0, "copied": 0, "files": 0}
+
+
+def format_size(size):
+    for unit in ("B", "KB", "MB", "GB"):
+        if size < 1024:
+            return f"{size:.1f} {unit}"
+        size /= 1024
+    return f"{size:.1f} TB"
+
+
+def log_staging_stats(stats):
+    logger.info(f"Staged {stats['files']} files: moved {format_size(stats['moved'])}, "
+                f"reflinked {format_size(stats['reflinked'])}, hardlinked {format_size(stats['hardlinked'])}, "
+                f"copied {format_size(stats['copied'])}")
+
+
+def tree_size(path):
+    """Total size and file count of a directory tree (or a single file), without following symlinks."""
+    if os.path.isfile(path):
+        return os.path.getsize(path), 1
+    size = 0
+    files = 0
+    for root, _, filenames in os.walk(path):
+        for filename in filenames:
+            size += os.lstat(os.path.join(root, filename)).st_size
+            files += 1
+    return size, files
+
+
+def _reflink(src, dst):
+    try:
+        with open(src, "rb") as s, open(dst, "wb") as d:
+            fcntl.ioctl(d.fileno(), FICLONE, s.fileno())
+    except OSError:
+        if os.path.exists(dst):
+            os.remove(dst)
+        raise
+    shutil.copystat(src, dst)
+
+
+def stage_file(src, dst, stats, keep_source=False):
+    """
+    Put src at dst as cheaply as possible: rename, then reflink, then hardlink, and copy only as a last resort.
+    src is gone afterwards, unless keep_source is set: src is then hardlinked, reflinked or copied, in that order.
+    """
+    size = os.lstat(src).st_size
+    stats["files"] += 1
+    if not keep_source:
+        try:
+            os.replace(src, dst)
+            stats["moved"] += size
+            return
+        except OSError as e:
+            logger.debug(f"Can't rename {src} to {dst}: {e}")
+
+    if os.path.lexists(dst):
+        os.remove(dst)
+    if keep_source:
+        try:
+            os.link(src, dst)
+            stats["hardlinked"] += size
+            return
+        except OSError as e:
+            logger.debug(f"Can't hardlink {src} to {dst}: {e}")
+    try:
+        _reflink(src, dst)
+        stats["reflinked"] += size
+    except OSError:
+        try:
+            os.link(src, dst)
+            stats["hardlinked"] += size
+        except OSError:
+            shutil.copy2(src, dst, follow_symlinks=False)
+            stats["copied"] += size
+    if not keep_source:
+        os.remove(src)
+
+
+def stage_tree(src_dir, dst_dir, stats=None):
+    """
+    Move the contents of src_dir into dst_dir, merging into directories that already exist.
+    Whole directories are renamed when possible, so staging on the same filesystem reads and writes no data.
+    Returns the staging stats (bytes moved, reflinked, hardlinked and copied).
+    """
+    if stats is None:
+        stats = new_staging_stats()
+    os.makedirs(dst_dir, exist_ok=True)
+    for entry in os.scandir(src_dir):
+        dst = os.path.join(dst_dir, entry.name)
+        if entry.is_dir(follow_symlinks=False):
+            if not os.path.lexists(dst):
+                size, files = tree_size(entry.path)
+                try:
+                    os.rename(entry.path, dst)
+                    stats["moved"] += size
+                    stats["files"] += files
+                    continue
+                except OSError as e:
+                    logger.debug(f"Can't rename {entry.path} to {dst}: {e}")
+            stage_tree(entry.path, dst, stats)
+            os.rmdir(entry.path)
+        else:
+            stage_file(entry.path, dst, stats)
+    return stats
@@ -0,0 +1,185 @@
+import os
+import re
+import csv
+import time
+import sqlite3
+import logging
+
+from igdb import igdb_post
+
+
+logger = logging.getLogger()
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS games (
+    id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL,
+    first_release_date INTEGER,
+    total_rating_count INTEGER
+);
+CREATE TABLE IF NOT EXISTS names (
+    id INTEGER PRIMARY KEY,
+    game_id INTEGER NOT NULL,
+    name TEXT NOT NULL,
+    gram_count INTEGER NOT NULL,
+    UNIQUE (game_id, name)
+);
+CREATE TABLE IF NOT EXISTS grams (
+    gram TEXT NOT NULL,
+    name_id INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS grams_gram ON grams (gram);
+CREATE INDEX IF NOT EXISTS grams_name_id ON grams (name_id);
+CREATE INDEX IF NOT EXISTS names_game_id ON names (game_id);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+'''
+
+# Candidates fetched from the inverted index before they are scored
+CANDIDATE_POOL = 200
+
+# Titles fetched per request when updating the index from the API
+UPDATE_PAGE_SIZE = 500
+
+
+def normalize(name):
+    """Lowercase and drop everything but letters and digits, so "M.i.n_.e.c.raft" and "Minecraft" look the same."""
+    return re.sub(r'[\W_]+', '', name.lower())
+
+
+def trigrams(name):
+    normalized = normalize(name)
+    if not normalized:
+        return set()
+    padded = f"  {normalized} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def open_index(path):
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    conn = sqlite3.connect(path, timeout=30)
+    conn.executescript(SCHEMA)
+    return conn
+
+
+def add_game(conn, game_id, name, first_release_date, total_rating_count, alternative_names=()):
+    """Insert or refresh a game and index its name and alternative names."""
+    conn.execute("INSERT OR REPLACE INTO games VALUES (?, ?, ?, ?)",
+                 (game_id, name, first_release_date, total_rating_count))
+    old_names = [row[0] for row in conn.execute("SELECT id FROM names WHERE game_id = ?", (game_id,))]
+    if old_names:
+        conn.executemany("DELETE FROM grams WHERE name_id = ?", [(name_id,) for name_id in old_names])
+        conn.execute("DELETE FROM names WHERE game_id = ?", (game_id,))
+    for title in dict.fromkeys([name, *alternative_names]):
+        grams = trigrams(title)
+        if not grams:
+            continue
+        name_id = conn.execute("INSERT INTO names (game_id, name, gram_count) VALUES (?, ?, ?)",
+                               (game_id, title, len(grams))).lastrowid
+        conn.executemany("INSERT INTO grams VALUES (?, ?)", [(gram, name_id) for gram in grams])
+
+
+def _int_or_none(value):
+    try:
+        return int(float(value)) if value not in (None, "") else None
+    except ValueError:
+        return None
+
+
+def build_index(path, games_csv, alternative_names_csv=None):
+    """
+    Build the index from IGDB's games dump (and optionally its alternative_names dump).
+    Only main games and remakes that aren't versions of another game are kept, like the API search does.
+    """
+    start = time.monotonic()
+    alternative_names = {}
+    if alternative_names_csv:
+        with open(alternative_names_csv, newline="", encoding="utf-8") as f:
+            for row in csv.DictReader(f):
+                alternative_names.setdefault(row["game"], []).append(row["name"])
+
+    if os.path.exists(path):
+        os.remove(path)
+    conn = open_index(path)
+    count = 0
+    with conn, open(games_csv, newline="", encoding="utf-8") as f:
+        for row in csv.DictReader(f):
+            game_type = row.get("game_type", row.get("category", "0"))
+            if game_type not in ("", "0", "4") or row.get("version_parent"):
+                continue
+            add_game(conn, int(row["id"]), row["name"], _int_or_none(row.get("first_release_date")),
+                     _int_or_none(row.get("total_rating_count")) or 0, alternative_names.get(row["id"], []))
+            count += 1
+        conn.execute("INSERT OR REPLACE INTO meta VALUES ('updated_at', ?)", (str(int(time.time())),))
+    conn.close()
+    logger.info(f"Built title index {path} with {count} games in {time.monotonic() - start:.1f}s")
+    return count
+
+
+def update_index(path, config):
+    """Fetch the games IGDB changed since the last build or update, and refresh them in the index."""
+    conn = open_index(path)
+    row = conn.execute("SELECT value FROM meta WHERE key = 'updated_at'").fetchone()
+    since = int(row[0]) if row else 0
+    latest = since
+    count = 0
+    offset = 0
+    while True:
+        query = f'''fields name,first_release_date,total_rating_count,alternative_names.name,updated_at;
+            where updated_at > {since} & game_type = (0, 4) & version_parent = null;
+            sort updated_at asc; limit {UPDATE_PAGE_SIZE}; offset {offset};'''
+        games = igdb_post("games", query, config)
+        with conn:
+            for game in games:
+                add_game(conn, game["id"], game["name"], game.get("first_release_date"),
+                         game.get("total_rating_count", 0),
+                         [alt["name"] for alt in game.get("alternative_names", []) if "name" in alt])
+                latest = max(latest, game.get("updated_at", since))
+        count += len(games)
+        if len(games) < UPDATE_PAGE_SIZE:
+            break
+        offset += UPDATE_PAGE_SIZE
+    with conn:
+        conn.execute("INSERT OR REPLACE INTO meta VALUES ('updated_at', ?)", (str(latest),))
+    conn.close()
+    logger.info(f"Updated {count} games in title index {path}")
+    return count
+
+
+def lookup(conn, search_name, limit=10, score_function=None):
+    """
+    Find the games whose name or alternative names look the most like search_name.
+    Candidates come from the trigram inverted index and are ranked by trigram (Dice) similarity,
+    plus score_function(name, search_name) / 1000 when one is given.
+    Returns IGDB-like game dicts with an extra "similarity" field, best first.
+    """
+    grams = trigrams(search_name)
+    if not grams:
+        return []
+    placeholders = ",".join("?" * len(grams))
+    rows = conn.execute(
+        f"SELECT names.game_id, names.name, names.gram_count, COUNT(*) AS shared FROM grams "
+        f"JOIN names ON names.id = grams.name_id WHERE grams.gram IN ({placeholders}) "
+        f"GROUP BY grams.name_id ORDER BY shared DESC LIMIT ?",
+        (*grams, CANDIDATE_POOL)).fetchall()
+
+    best = {}
+    for game_id, name, gram_count, shared in rows:
+        similarity = 2 * shared / (len(grams) + gram_count)
+        rank = similarity + (score_function(name, search_name) / 1000 if score_function else 0)
+        if game_id not in best or rank > best[game_id][0]:
+            best[game_id] = (rank, similarity)
+
+    ranked = sorted(best.items(), key=lambda item: item[1][0], reverse=True)[:limit]
+    games = []
+    for game_id, (rank, similarity) in ranked:
+        _, name, first_release_date, total_rating_count = conn.execute(
+            "SELECT * FROM games WHERE id = ?", (game_id,)).fetchone()
+        game = {"id": game_id, "name": name, "total_rating_count": total_rating_count or 0,
+                "similarity": round(similarity, 3)}
+        if first_release_date:
+            game["first_release_date"] = first_release_date
+        games.append(game)
+    return games
@@ -0,0 +1,135 @@
+"""
+Lightweight entry point for the torrent client's "run on completion" hook.
+
+Checks the category with the standard library only, and exits right away for torrents that aren't games.
+Games are handed off without waiting for them to be processed: submitted to the job server at JOB_SERVER_URL,
+queued for the daemon when ENABLE_DAEMON=true, or else processed by a detached main.py.
+    /usr/bin/python3 trigger.py -c %L '"%R"'
+requests, rarfile and dotenv are never imported here, the daemon and job server modules only for games.
+"""
+import os
+import sys
+import argparse
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def find_env_file(filename=".env"):
+    """The .env python-dotenv's load_dotenv() picks for main.py: in its directory or the closest parent."""
+    path = SCRIPT_DIR
+    while True:
+        candidate = os.path.join(path, filename)
+        if os.path.isfile(candidate):
+            return candidate
+        parent = os.path.dirname(path)
+        if parent == path:
+            return None
+        path = parent
+
+
+def load_env(path):
+    """
+    Read the KEY=VALUE lines of a .env file into os.environ, without overriding variables that are already set,
+    like load_dotenv(). Covers what .env.example uses: comments, export and quoted values, not interpolation.
+    """
+    if path is None:
+        return
+    with open(path) as f:
+        for line in f:
+            line = line.strip()
+            if not line or line.startswith("#") or "=" not in line:
+                continue
+            key, _, value = line.partition("=")
+            key = key.strip()
+            if key.startswith("export "):
+                key = key[len("export "):].strip()
+            value = value.strip()
+            if value[:1] in ("'", '"') and value.endswith(value[0]) and len(value) > 1:
+                value = value[1:-1]
+            elif " #" in value:
+                value = value.split(" #", 1)[0].rstrip()
+            os.environ.setdefault(key, value)
+
+
+def accepted_categories():
+    """categoryName, and the categories OUTPUT_BACKEND_BY_CATEGORY gives their own backend, like main()."""
+    categories = {os.getenv("categoryName")}
+    for pair in os.getenv("OUTPUT_BACKEND_BY_CATEGORY", "").split(","):
+        category = pair.partition("=")[0].strip()
+        if category:
+            categories.add(category)
+    categories.discard(None)
+    return categories
+
+
+def trigger_config():
+    """The part of load_config() handing jobs off needs, kept in sync with it."""
+    state_dir = os.path.expanduser(os.getenv("STATE_DIR", "~/.cache/gamezip"))
+    return {
+        "logFileLocation": os.getenv("logFileLocation"),
+        "daemon": {
+            "enabled": os.getenv("ENABLE_DAEMON", "false").lower() == "true",
+            "spool_dir": os.path.join(state_dir, "spool"),
+            "pid_file": os.path.join(state_dir, "daemon.pid"),
+        },
+        "job_server": {
+            "url": os.getenv("JOB_SERVER_URL", ""),
+            "token": os.getenv("JOB_SERVER_TOKEN", ""),
+            "submit_timeout": float(os.getenv("JOB_SUBMIT_TIMEOUT", "10")),
+        },
+    }
+
+
+def spawn_main(argv):
+    """Run main.py with the hook's arguments in its own session, so the torrent client doesn't wait for it."""
+    import subprocess
+    subprocess.Popen([sys.executable, os.path.join(SCRIPT_DIR, "main.py"), *argv],
+                     stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+                     start_new_session=True)
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    parser = argparse.ArgumentParser(description="Hand completed torrents off to GameZip")
+    parser.add_argument("input", nargs="*", help="Input file or folder")
+    parser.add_argument("-c", "--category", action="store", help="Torrent category")
+    parser.add_argument("-n", "--name", action="store", help="Provide the file's name in case we can't pick it up")
+    parser.add_argument("--force-compress", action="store_true", help="Bypass popularity filters")
+    # Everything else is passed on to main.py as is
+    args, _ = parser.parse_known_args(argv)
+
+    load_env(find_env_file())
+    if args.category not in accepted_categories():
+        return 0
+    if not args.input:
+        parser.error("the following arguments are required: input")
+
+    config = trigger_config()
+    import logging
+    logging.basicConfig(filename=config["logFileLocation"], format='%(asctime)s %(message)s', filemode='a',
+                        level=logging.INFO)
+    logger = logging.getLogger()
+    name = args.name if len(args.input) == 1 else None
+    if config["job_server"]["url"]:
+        from jobserver import JobClient
+        client = JobClient(config["job_server"]["url"], config["job_server"]["token"],
+                           config["job_server"]["submit_timeout"])
+        for path in args.input:
+            try:
+                job_id = client.submit(os.path.abspath(path), args.category, name, args.force_compress)
+            except (OSError, RuntimeError) as e:
+                logger.error(f"Failed to submit {path} to {config['job_server']['url']}: {e}")
+                return 1
+            logger.info(f"Submitted {path} to {config['job_server']['url']} as job {job_id}")
+    elif config["daemon"]["enabled"]:
+        from daemon import enqueue_job
+        for path in args.input:
+            enqueue_job(config, path, args.category, name, args.force_compress)
+    else:
+        spawn_main(argv)
+        logger.info(f"Started main.py for {', '.join(args.input)}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,124 @@
+import os
+import re
+import logging
+
+
+logger = logging.getLogger()
+
+# game.part1.rar, game.part01.rar...
+RAR_PART_PATTERN = re.compile(r'^(?P<base>.+)\.part(?P<number>\d+)\.rar$', re.IGNORECASE)
+# game.rar followed by game.r00-r99, game.s00-s99... up to z99
+RAR_OLD_PATTERN = re.compile(r'^(?P<base>.+)\.(?:rar|(?P<letter>[r-z])(?P<number>\d{2}))$', re.IGNORECASE)
+# game.7z.001, game.zip.001, game.rar.001: plain byte splits of one archive
+SPLIT_PATTERN = re.compile(r'^(?P<base>.+\.(?P<kind>7z|zip|rar))\.(?P<number>\d{3,})$', re.IGNORECASE)
+# game.z01, game.z02... closed by game.zip
+ZIP_PATTERN = re.compile(r'^(?P<base>.+)\.z(?:ip|(?P<number>\d{2,}))$', re.IGNORECASE)
+SEVEN_ZIP_PATTERN = re.compile(r'^(?P<base>.+)\.7z$', re.IGNORECASE)
+
+
+def classify_volume(name, rar_bases=()):
+    """
+    Return (kind, base, scheme, index) for an archive volume name, or None if it isn't one.
+    index orders the volumes of a set from 0, it is None for the .zip closing a zip split.
+    .z01 is both a zip split and an old style RAR volume, it only counts as RAR when a .rar with the same base
+    is in rar_bases.
+    """
+    match = RAR_PART_PATTERN.match(name)
+    if match:
+        return "rar", match["base"], "part", int(match["number"]) - 1
+    match = SPLIT_PATTERN.match(name)
+    if match:
+        return match["kind"].lower(), match["base"], "split", int(match["number"]) - 1
+    match = ZIP_PATTERN.match(name)
+    if match and (match["number"] is None or match["base"].lower() not in rar_bases):
+        return "zip", match["base"], "zip", int(match["number"]) - 1 if match["number"] else None
+    match = RAR_OLD_PATTERN.match(name)
+    if match:
+        if not match["letter"]:
+            return "rar", match["base"], "old", 0
+        # .rar is volume 0, .r00 volume 1... .s00 volume 101
+        return "rar", match["base"], "old", (ord(match["letter"].lower()) - ord("r")) * 100 + int(match["number"]) + 1
+    match = SEVEN_ZIP_PATTERN.match(name)
+    if match:
+        return "7z", match["base"], "single", 0
+    return None
+
+
+def index_volume_sets(folder_path):
+    """
+    Group the archives of a folder into volume sets, reading the directory once with os.scandir.
+    Returns a list of volume set dicts sorted by base name, each with:
+    kind (rar, 7z or zip), base, scheme (part, old, split, zip or single), main (the volume to open),
+    volumes (in order), size, and the missing indexes and short volumes of an incomplete set.
+    """
+    files = []
+    rar_bases = set()
+    with os.scandir(folder_path) as entries:
+        for entry in entries:
+            if entry.is_file():
+                files.append((entry.name, entry.path, entry.stat().st_size))
+                if entry.name.lower().endswith(".rar"):
+                    rar_bases.add(entry.name[:-4].lower())
+
+    sets = {}
+    for name, path, size in files:
+        classified = classify_volume(name, rar_bases)
+        if classified is None:
+            continue
+        kind, base, scheme, index = classified
+        volume_set = sets.setdefault((base.lower(), kind, scheme), {"kind": kind, "base": base, "scheme": scheme, "entries": {}})
+        volume_set["entries"][index] = (path, size)
+
+    volume_sets = [_finish_set(sets[key]) for key in sorted(sets)]
+    logger.debug(f"Indexed {len(files)} files in {folder_path} into {len(volume_sets)} archive sets")
+    return volume_sets
+
+
+def _finish_set(volume_set):
+    entries = volume_set.pop("entries")
+    last = entries.pop(None, None)
+    if volume_set["scheme"] == "zip" and not entries:
+        # A lone .zip, not a split
+        volume_set["scheme"] = "single"
+        entries, last = {0: last}, None
+
+    indexes = sorted(entries)
+    count = indexes[-1] + 1 if indexes else 0
+    volume_set["missing"] = [index for index in range(count) if index not in entries]
+    volumes = [entries[index] for index in indexes]
+    if volume_set["scheme"] == "zip":
+        if last is None:
+            volume_set["missing"].append("last")
+        else:
+            volumes.append(last)
+    volume_set["volumes"] = [path for path, _ in volumes]
+    volume_set["size"] = sum(size for _, size in volumes)
+    # Zip splits are opened from their closing .zip, everything else from its first volume
+    volume_set["main"] = last[0] if last else volume_set["volumes"][0]
+
+    # Every volume but the last one has the nominal volume size, and the last one is never bigger,
+    # so a smaller one was truncated or is still downloading (the first one of a 2-volume set too)
+    full_size = max((size for _, size in volumes), default=0)
+    volume_set["short"] = [path for path, size in volumes[:-1] if size < full_size]
+    return volume_set
+
+
+def describe_problems(volume_set):
+    """Return the problems of an incomplete volume set as readable strings, an empty list when it looks complete."""
+    problems = []
+    missing = volume_set["missing"]
+    if 0 in missing:
+        problems.append("first volume is missing")
+    numbered = [index for index in missing if index not in (0, "last")]
+    if numbered:
+        problems.append(f"{len(numbered)} volumes missing (#{', #'.join(str(index + 1) for index in numbered[:10])})")
+    if "last" in missing:
+        problems.append("closing .zip volume is missing")
+    if volume_set["short"]:
+        problems.append(f"short volumes: {', '.join(os.path.basename(path) for path in volume_set['short'][:10])}")
+    return problems
+
+
+def is_extractable(volume_set):
+    """RAR sets are always extracted, 7z and zip archives only when they are split into volumes."""
+    return volume_set["kind"] == "rar" or volume_set["scheme"] != "single"
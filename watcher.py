@@ -0,0 +1,259 @@
+import os
+import json
+import time
+import select
+import signal
+import struct
+import ctypes
+import ctypes.util
+import logging
+import threading
+
+from concurrent.futures import ThreadPoolExecutor
+from daemon import Scheduler, enqueue_job
+from locking import write_atomic
+
+
+logger = logging.getLogger()
+
+# inotify(7) constants
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_Q_OVERFLOW = 0x00004000
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = os.O_NONBLOCK
+IN_CLOEXEC = os.O_CLOEXEC
+WATCH_MASK = IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+EVENT_HEADER = struct.Struct("iIII")
+
+# Files download clients write to before renaming them to their final name
+INCOMPLETE_SUFFIXES = (".!qb", ".part", ".crdownload", ".!ut", ".tmp")
+
+
+class Inotify:
+    """Minimal inotify binding over ctypes, watching a directory tree for writes."""
+
+    def __init__(self):
+        self.libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        self.fd = self.libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            error = ctypes.get_errno()
+            raise OSError(error, os.strerror(error))
+        self.paths = {}
+
+    def add_tree(self, root):
+        """Watch root and every directory under it."""
+        for path, _, _ in os.walk(root):
+            self.add_watch(path)
+
+    def add_watch(self, path):
+        wd = self.libc.inotify_add_watch(self.fd, os.fsencode(path), WATCH_MASK)
+        if wd < 0:
+            error = ctypes.get_errno()
+            # ENOSPC: out of fs.inotify.max_user_watches
+            raise OSError(error, f"Can't watch {path}: {os.strerror(error)}")
+        self.paths[wd] = path
+
+    def read(self, timeout):
+        """
+        Wait up to timeout seconds for events. Returns a list of (path, mask) for the changed entries,
+        new directories are watched as they appear. None means the queue overflowed and events were lost.
+        """
+        readable, _, _ = select.select([self.fd], [], [], timeout)
+        if not readable:
+            return []
+        try:
+            data = os.read(self.fd, 64 * 1024)
+        except BlockingIOError:
+            return []
+        events = []
+        offset = 0
+        while offset < len(data):
+            wd, mask, _, length = EVENT_HEADER.unpack_from(data, offset)
+            name = data[offset + EVENT_HEADER.size:offset + EVENT_HEADER.size + length].rstrip(b"\0")
+            offset += EVENT_HEADER.size + length
+            if mask & IN_Q_OVERFLOW:
+                return None
+            if wd not in self.paths:
+                continue
+            path = os.path.join(self.paths[wd], os.fsdecode(name)) if name else self.paths[wd]
+            if mask & IN_ISDIR and mask & (IN_CREATE | IN_MOVED_TO):
+                try:
+                    self.add_tree(path)
+                except OSError as e:
+                    logger.warning(f"{e}, changes under it will only be seen by polling")
+            events.append((path, mask))
+        return events
+
+    def close(self):
+        os.close(self.fd)
+
+
+def tree_signature(path):
+    """
+    (file count, total size, latest mtime) of a file or folder, or None while a download client
+    still has an incomplete file in it, or while the folder is empty.
+    """
+    if os.path.isfile(path):
+        stat = os.stat(path)
+        return None if path.lower().endswith(INCOMPLETE_SUFFIXES) else [1, stat.st_size, stat.st_mtime_ns]
+    count, size, mtime = 0, 0, 0
+    for root, _, filenames in os.walk(path):
+        for filename in filenames:
+            if filename.lower().endswith(INCOMPLETE_SUFFIXES):
+                return None
+            try:
+                stat = os.lstat(os.path.join(root, filename))
+            except FileNotFoundError:
+                return None
+            count, size, mtime = count + 1, size + stat.st_size, max(mtime, stat.st_mtime_ns)
+    return [count, size, mtime] if count else None
+
+
+def load_watch_state(config):
+    try:
+        with open(config["watch"]["state_path"]) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def watch(watch_dir, config, run_job):
+    """
+    Watch a directory for new game folders (or files) and process each one once it has settled:
+    no writes for WATCH_SETTLE_SECONDS, and the same file count, size and mtime on two checks in a row.
+    Folders are processed by run_job(job, config, compression_slot), like daemon jobs, at most WATCH_MAX_JOBS
+    at once, or queued for the daemon when it is enabled.
+    Every submitted entry is recorded in the watch state file, so a restart doesn't process it again.
+    """
+    watch_config = config["watch"]
+    watch_dir = os.path.abspath(watch_dir)
+    settle = watch_config["settle"]
+    queue = config["daemon"]["enabled"]
+    store_folder = os.path.abspath(config["storeFolder"] or watch_dir)
+    processed = load_watch_state(config)
+    # Guards processed and running, which job threads update while the loop thread reads them
+    state_lock = threading.Lock()
+    # Top-level entries waiting to settle: name -> {"activity": last write seen, "signature": last check}
+    pending = {}
+    running = set()
+    stop = threading.Event()
+
+    def handle_signal(signum, frame):
+        logger.info(f"Received signal {signum}, finishing running jobs before exiting")
+        stop.set()
+
+    signal.signal(signal.SIGTERM, handle_signal)
+    signal.signal(signal.SIGINT, handle_signal)
+
+    def save_state(path, status, signature):
+        with state_lock:
+            processed[path] = {"status": status, "signature": signature, "at": time.time()}
+            write_atomic(watch_config["state_path"], json.dumps(processed, indent=1))
+
+    def wanted(name):
+        path = os.path.join(watch_dir, name)
+        # Hidden files, and everything GameZip itself writes there
+        if name.startswith(".") or name.startswith("temp_extract_") or path == store_folder:
+            return False
+        with state_lock:
+            entry = processed.get(path)
+            busy = path in running
+        # Failed entries are retried once their content changes
+        return not busy and (entry is None or entry["status"] == "failed")
+
+    def touch(name):
+        if wanted(name):
+            entry = pending.setdefault(name, {"activity": time.monotonic(), "signature": None})
+            entry["activity"] = time.monotonic()
+
+    def scan():
+        for name in os.listdir(watch_dir):
+            if name not in pending and wanted(name):
+                pending[name] = {"activity": time.monotonic(), "signature": None}
+
+    def worker(path, signature):
+        job = {"input": path, "category": config.get("category"), "name": None, "force_compress": False}
+        try:
+            status = run_job(job, config, scheduler.compression_slot)
+            logger.info(f"Watched {path} processed: {status}")
+        except Exception as e:
+            logger.error(f"Error during processing: {str(e)}")
+            logger.error(f"Failed to process {path}")
+            status = "failed"
+        save_state(path, status, signature)
+        with state_lock:
+            running.discard(path)
+
+    inotify = None
+    if watch_config["use_inotify"]:
+        try:
+            inotify = Inotify()
+            inotify.add_tree(watch_dir)
+        except OSError as e:
+            logger.warning(f"inotify unavailable ({e}), polling {watch_dir} every {watch_config['poll_interval']:.0f}s")
+            if inotify is not None:
+                inotify.close()
+            inotify = None
+
+    scheduler = Scheduler(config)
+    mode = "queued for the daemon" if queue else f"{watch_config['max_jobs']} at a time"
+    logger.info(f"Watching {watch_dir} with {'inotify' if inotify else 'polling'}, "
+                f"folders are processed after {settle:.0f}s without writes, {mode}")
+    last_scan = 0
+    with ThreadPoolExecutor(max_workers=watch_config["max_jobs"], thread_name_prefix="watch") as executor:
+        try:
+            while not stop.is_set():
+                if inotify is not None:
+                    events = inotify.read(timeout=1)
+                    if events is None:
+                        logger.warning("inotify queue overflowed, rescanning every folder")
+                        for name in list(pending):
+                            touch(name)
+                        last_scan = 0
+                        events = []
+                    for path, _ in events:
+                        name = os.path.relpath(path, watch_dir).split(os.sep, 1)[0]
+                        if name != "..":
+                            touch(name)
+                else:
+                    stop.wait(1)
+                if time.monotonic() - last_scan >= watch_config["poll_interval"]:
+                    scan()
+                    last_scan = time.monotonic()
+
+                for name, entry in list(pending.items()):
+                    if time.monotonic() - entry["activity"] < settle:
+                        continue
+                    path = os.path.join(watch_dir, name)
+                    if not os.path.exists(path):
+                        del pending[name]
+                        continue
+                    signature = tree_signature(path)
+                    if signature is None or signature != entry["signature"]:
+                        # Changed since the last check (or still downloading), give it another settle period
+                        entry["signature"] = signature
+                        entry["activity"] = time.monotonic()
+                        continue
+                    del pending[name]
+                    with state_lock:
+                        previous = processed.get(path)
+                    if previous is not None and previous["signature"] == signature:
+                        continue
+                    logger.info(f"{path} settled: {signature[0]} files, {signature[1] / 1024 / 1024:.1f} MB")
+                    if queue:
+                        enqueue_job(config, path, config.get("category"))
+                        save_state(path, "queued", signature)
+                    else:
+                        with state_lock:
+                            running.add(path)
+                        executor.submit(worker, path, signature)
+        finally:
+            if inotify is not None:
+                inotify.close()
+    logger.info("Stopped watching")